@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Anomaly detection engine for Raw to Ready.
+
+The old detect_anomalies recomputed mean() and std() several times per numeric
+column, copied every flagged row and concatenated them onto a growing frame
+inside the column loop (quadratic, and a row flagged by two columns appeared
+twice). Here the numeric block is turned into one float matrix, the statistics
+of all its columns are computed in one vectorized pass, and the result is a
+compact long table with one (row, column, value, score) entry per flagged cell.
+Callers join it back to the full rows only when they need to show them.
+
+Every method boils down to a band [lo, hi] and a scale per column; a value's
+score is how many scales it lies outside the band (0 inside it):
+
+- zscore: lo = hi = mean, scale = standard deviation
+- mad:    lo = hi = median, scale = MAD / 0.6745 (the "modified z-score")
+- iqr:    lo = Q1, hi = Q3, scale = IQR (Tukey's fences)
+
+With group_by, the band and scale come from each row's own group (segment)
+instead of the whole column. Group statistics are computed by cythonized
+groupby aggregations over the whole matrix at once and broadcast back to the
+rows through their group codes, so there is no Python loop over groups.
+"""
+
+import warnings
+
+import numpy as np
+import pandas as pd
+
+# Method -> default threshold on |score|
+METHODS = {"zscore": 3.0, "mad": 3.5, "iqr": 1.5}
+METHOD_LABELS = {"zscore": "Z-score", "mad": "Robust (median / MAD)", "iqr": "IQR fences"}
+RESULT_COLUMNS = ["row", "column", "value", "score"]
+MAD_SCALE = 0.6745
+
+
+def numeric_matrix(df):
+    """(column names, float matrix) of the numeric columns of df."""
+    numeric = df.select_dtypes(include=[np.number])
+    return list(numeric.columns), numeric.to_numpy(dtype=float, na_value=np.nan)
+
+
+def fit(X, method="zscore"):
+    """Per-column (lo, hi, scale) of matrix X for method; scale is NaN where it is 0 or undefined."""
+    if method not in METHODS:
+        raise ValueError(f"unknown anomaly method: {method}")
+    with np.errstate(all="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)   # all-NaN columns
+        if method == "zscore":
+            lo = hi = np.nanmean(X, axis=0)
+            scale = np.nanstd(X, axis=0, ddof=1)
+        elif method == "mad":
+            lo = hi = np.nanmedian(X, axis=0)
+            scale = np.nanmedian(np.abs(X - lo), axis=0) / MAD_SCALE
+        else:
+            lo, hi = np.nanpercentile(X, [25, 75], axis=0)
+            scale = hi - lo
+    scale = np.where(scale > 0, scale, np.nan)   # constant columns can't have outliers
+    return lo, hi, scale
+
+
+def group_codes(df, group_by):
+    """(codes, number of groups) of each row's group; missing keys form groups of their own."""
+    codes = df.groupby(list(group_by), dropna=False, sort=False).ngroup().to_numpy()
+    return codes, int(codes.max()) + 1 if len(codes) else 0
+
+
+def group_quantiles(X, codes, qs):
+    """
+    Per-group quantiles (linear interpolation, NaN ignored) of every column of X.
+
+    Sorts each column by (group, value) once and interpolates at each group's
+    offsets, which is much faster than groupby().quantile() with many groups.
+    Returns one groups-by-columns matrix per q.
+    """
+    n_groups = int(codes.max()) + 1 if len(codes) else 0
+    starts = np.concatenate([[0], np.cumsum(np.bincount(codes, minlength=n_groups))[:-1]])
+    out = [np.full((n_groups, X.shape[1]), np.nan) for _ in qs]
+    for j in range(X.shape[1]):
+        x = X[:, j]
+        order = np.lexsort((x, codes))          # NaNs sort last within each group
+        sorted_x = x[order]
+        valid = np.bincount(codes, weights=~np.isnan(x), minlength=n_groups).astype(int)
+        has = valid > 0
+        for q, res in zip(qs, out):
+            pos = q * (valid[has] - 1)
+            below = np.floor(pos).astype(int)
+            above = np.minimum(below + 1, valid[has] - 1)
+            base = starts[has]
+            lo, hi = sorted_x[base + below], sorted_x[base + above]
+            res[has, j] = lo + (pos - below) * (hi - lo)
+    return out
+
+
+def fit_grouped(X, codes, method="zscore"):
+    """Like fit(), but (lo, hi, scale) are row-by-column matrices taken from each row's group."""
+    if method not in METHODS:
+        raise ValueError(f"unknown anomaly method: {method}")
+    grouped = pd.DataFrame(X).groupby(codes)
+    if method == "zscore":
+        lo = hi = grouped.mean().to_numpy()[codes]
+        scale = grouped.std().to_numpy()[codes]
+    elif method == "mad":
+        lo = hi = grouped.median().to_numpy()[codes]
+        deviations = pd.DataFrame(np.abs(X - lo)).groupby(codes)
+        scale = deviations.median().to_numpy()[codes] / MAD_SCALE
+    else:
+        q1, q3 = group_quantiles(X, codes, (0.25, 0.75))
+        lo, hi = q1[codes], q3[codes]
+        scale = hi - lo
+    with np.errstate(invalid="ignore"):
+        scale = np.where(scale > 0, scale, np.nan)   # single-row and constant groups can't have outliers
+    return lo, hi, scale
+
+
+def score(X, lo, hi, scale):
+    """Signed distance of each value outside its column's band, in scales (0 inside, NaN for nulls)."""
+    with np.errstate(invalid="ignore"):
+        return np.where(X > hi, (X - hi) / scale, np.where(X < lo, (X - lo) / scale, np.where(np.isnan(X), np.nan, 0.0)))
+
+
+def flag(X, columns, index, lo, hi, scale, threshold, row_offset=0):
+    """
+    Long table of the cells of X whose |score| is above threshold.
+
+    Rows come from index (or positions + row_offset when index is None), ordered
+    column by column like the old per-column loop.
+    """
+    scores = score(X, lo, hi, scale)
+    with np.errstate(invalid="ignore"):
+        cols, rows = np.nonzero((np.abs(scores) > threshold).T)
+    return pd.DataFrame({
+        "row": (rows + row_offset) if index is None else index.take(rows),
+        "column": np.asarray(columns, dtype=object).take(cols),
+        "value": X[rows, cols],
+        "score": scores[rows, cols],
+    }, columns=RESULT_COLUMNS)
+
+
+def detect_anomalies(df, method="zscore", threshold=None, group_by=None):
+    """
+    Flag numeric values that are unusually far from the rest of their column.
+
+    With group_by (a list of columns), values are compared with the rest of
+    their group only, and the group columns themselves are not scored.
+    Returns a long frame with columns row (index label in df), column, value and
+    score; see rows_for() to get the flagged rows themselves.
+    """
+    threshold = METHODS[method] if threshold is None else threshold
+    group_by = [col for col in (group_by or []) if col in df.columns]
+    columns, X = numeric_matrix(df.drop(columns=group_by))
+    if not columns:
+        return pd.DataFrame(columns=RESULT_COLUMNS)
+    if group_by:
+        codes, _ = group_codes(df, group_by)
+        lo, hi, scale = fit_grouped(X, codes, method)
+    else:
+        lo, hi, scale = fit(X, method)
+    return flag(X, columns, df.index, lo, hi, scale, threshold)
+
+
+def rows_for(df, anomalies):
+    """The distinct rows of df that have at least one anomaly, for display."""
+    return df.loc[pd.unique(anomalies["row"])]
+
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Headless batch cleaning for Raw to Ready.
+
+Cleans many files with one recipe, in parallel on a process pool, and
+prints a per-file summary with timing and throughput. The recipe uses the same
+options the app stores in cleaning_history.cleaning_options, given as a JSON
+file, a JSON string, or the dict text copied straight from the history table.
+Inputs can be CSV (plain, .gz or .zst), Parquet or Feather; --format picks the
+output format. CSVs bigger than --streaming-mb are cleaned chunk by chunk (see
+streaming.py). A recipe with "fuzzy_dictionary" matches against the saved
+canonical values (see canonical_store.py; "mine" is the --user's dictionary)
+but does not add to them.
+
+Examples:
+    python batch_clean.py exports/*.csv --out-dir cleaned --recipe recipe.json
+    python batch_clean.py exports --out-dir cleaned --workers 8 \\
+        --recipe '{"fill_method": "Fill with Median", "do_duplicates": true}' --format parquet
+"""
+
+import argparse
+import ast
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from anomaly_engine import METHODS
+from canonical_store import DICTIONARY_LABELS, dictionary_scope, load_dictionary
+from cleaning import DEFAULT_OPTIONS, FILL_METHODS, clean_frame
+from db import get_db
+from file_formats import EXPORT_FORMATS, export_formats, file_stem, read_upload, upload_kind, write_frame
+from streaming import CHUNK_ROWS, clean_csv_stream, export_stream
+
+INPUT_SUFFIXES = (".csv", ".csv.gz", ".csv.zst", ".parquet", ".feather")
+
+
+def parse_recipe(text):
+    """Recipe from a file path, a JSON string or a Python dict literal; missing keys take the defaults."""
+    if os.path.exists(text):
+        with open(text) as f:
+            text = f.read()
+    try:
+        recipe = json.loads(text)
+    except ValueError:
+        recipe = ast.literal_eval(text)
+    if not isinstance(recipe, dict):
+        raise ValueError("recipe must be a mapping of cleaning options")
+    unknown = set(recipe) - set(DEFAULT_OPTIONS)
+    if unknown:
+        raise ValueError(f"unknown recipe options: {', '.join(sorted(unknown))}")
+    recipe = {**DEFAULT_OPTIONS, **recipe}
+    if recipe["fill_method"] not in FILL_METHODS:
+        raise ValueError(f"fill_method must be one of: {', '.join(FILL_METHODS)}")
+    if recipe["anomaly_method"] not in METHODS:
+        raise ValueError(f"anomaly_method must be one of: {', '.join(METHODS)}")
+    if not isinstance(recipe["anomaly_group_by"], list):
+        raise ValueError("anomaly_group_by must be a list of column names")
+    if not isinstance(recipe["near_duplicate_columns"], list):
+        raise ValueError("near_duplicate_columns must be a list of column names")
+    if recipe["fuzzy_dictionary"] not in DICTIONARY_LABELS:
+        raise ValueError(f"fuzzy_dictionary must be one of: {', '.join(map(repr, DICTIONARY_LABELS))}")
+    return recipe
+
+
+def find_inputs(paths):
+    """Files named on the command line, plus the supported files in any directories named."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(os.path.join(path, name) for name in os.listdir(path)
+                            if name.lower().endswith(INPUT_SUFFIXES))
+        else:
+            files.append(path)
+    return files
+
+
+def clean_file(path, out_dir, options, streaming_bytes, chunksize=CHUNK_ROWS, fmt="csv", canonicals=None):
+    """Clean one file into out_dir as format fmt; returns its row of the summary report (never raises)."""
+    stem = file_stem(path)
+    out_path = os.path.join(out_dir, f"{stem}_cleaned.{fmt}")
+    row = {"file": path, "output": out_path, "mb": None}
+    size = None
+    start = time.perf_counter()
+    try:
+        size = os.path.getsize(path)
+        row["mb"] = round(size / 1024 ** 2, 2)
+        if size > streaming_bytes and upload_kind(path) == "csv":
+            row["mode"] = "streaming"
+            csv_path = out_path if fmt == "csv" else os.path.join(out_dir, f"{stem}_cleaned.csv.tmp")
+            report = clean_csv_stream(path, csv_path, options, chunksize=chunksize, canonicals=canonicals)
+            if csv_path != out_path:
+                export_stream(csv_path, fmt, out_path, chunksize=chunksize)
+                os.remove(csv_path)
+            anomalies = report.pop("anomalies")
+            report.pop("fill_report")
+            report.pop("date_reports")
+            report.pop("text_reports")
+            report.pop("canonical_updates")
+            report.pop("stage_log")
+            row.update(report)
+        else:
+            row["mode"] = "memory"
+            df = read_upload(path)
+            row.update(rows_before=int(len(df)), nulls_before=int(df.isnull().sum().sum()))
+            df_cleaned, anomalies, reports = clean_frame(df, options, canonicals)
+            write_frame(df_cleaned, fmt, out_path)
+            if not reports["near_duplicates"].empty:
+                reports["near_duplicates"].to_csv(os.path.join(out_dir, f"{stem}_near_duplicates.csv"), index=False)
+            row.update(rows_after=int(len(df_cleaned)), nulls_after=int(df_cleaned.isnull().sum().sum()),
+                       duplicates_before=reports["duplicates_before"], duplicates_after=reports["duplicates_after"])
+        row["anomalies"] = int(anomalies["row"].nunique())
+        if not anomalies.empty:
+            anomalies.to_csv(os.path.join(out_dir, f"{stem}_anomalies.csv"), index=False)
+    except Exception as e:
+        row["error"] = f"{type(e).__name__}: {e}"
+    seconds = time.perf_counter() - start
+    row["seconds"] = round(seconds, 3)
+    row["rows_per_sec"] = round(row.get("rows_before", 0) / seconds) if seconds else None
+    row["mb_per_sec"] = round(size / 1024 ** 2 / seconds, 2) if seconds and size is not None else None
+    return row
+
+
+def run_batch(files, out_dir, options, workers=None, streaming_mb=200, chunksize=CHUNK_ROWS, fmt="csv",
+              canonicals=None):
+    """Clean files concurrently on a process pool; returns the per-file rows in input order."""
+    os.makedirs(out_dir, exist_ok=True)
+    streaming_bytes = streaming_mb * 1024 ** 2
+    rows = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(clean_file, path, out_dir, options, streaming_bytes, chunksize, fmt, canonicals): path
+                   for path in files}
+        for future in as_completed(futures):
+            row = future.result()
+            rows[futures[future]] = row
+            status = row.get("error") or f"{row['rows_before']} -> {row['rows_after']} rows in {row['seconds']:.2f}s"
+            print(f"  {futures[future]}: {status}", file=sys.stderr)
+    return [rows[path] for path in files]
+
+
+def print_summary(rows, wall):
+    print(f"{'file':<40} {'mode':<9} {'MB':>8} {'rows in':>10} {'rows out':>10} {'nulls':>8} "
+          f"{'dupes':>7} {'anom':>6} {'seconds':>8} {'rows/s':>10} {'MB/s':>7}")
+    for row in rows:
+        name = os.path.basename(row["file"])[:40]
+        if "error" in row:
+            print(f"{name:<40} ERROR {row['error']}")
+            continue
+        print(f"{name:<40} {row['mode']:<9} {row['mb']:>8} {row['rows_before']:>10} {row['rows_after']:>10} "
+              f"{row['nulls_before'] - row['nulls_after']:>8} {row['duplicates_before'] - row['duplicates_after']:>7} "
+              f"{row['anomalies']:>6} {row['seconds']:>8.2f} {row['rows_per_sec']:>10} {row['mb_per_sec']:>7}")
+    done = [r for r in rows if "error" not in r]
+    total_rows = sum(r["rows_before"] for r in done)
+    total_mb = sum(r["mb"] for r in done)
+    print(f"\n{len(done)}/{len(rows)} files, {total_rows} rows, {total_mb:.1f} MB in {wall:.2f}s "
+          f"({total_rows / wall if wall else 0:,.0f} rows/s, {total_mb / wall if wall else 0:.1f} MB/s overall)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="+", help="Data files and/or directories of data files")
+    parser.add_argument("--out-dir", required=True, help="Where cleaned files (and anomaly reports) are written")
+    parser.add_argument("--recipe", default="{}", help="Cleaning options: JSON file, JSON string or dict literal")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: number of CPUs)")
+    parser.add_argument("--streaming-mb", type=int, default=200, help="Stream files bigger than this many MB")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="Rows per chunk in streaming mode")
+    parser.add_argument("--format", default="csv", choices=export_formats(),
+                        help="Output format: " + ", ".join(f"{fmt} ({EXPORT_FORMATS[fmt][0]})" for fmt in export_formats()))
+    parser.add_argument("--json", help="Write the summary report to this file as JSON")
+    parser.add_argument("--user", help="Email of the user whose canonical values a \"mine\" fuzzy_dictionary uses")
+    args = parser.parse_args()
+
+    try:
+        options = parse_recipe(args.recipe)
+    except (ValueError, SyntaxError) as e:
+        parser.error(f"bad --recipe: {e}")
+    files = find_inputs(args.inputs)
+    if not files:
+        parser.error("no input files found")
+    canonicals = None
+    if options["fuzzy_dictionary"]:
+        scope = dictionary_scope(options["fuzzy_dictionary"], args.user)
+        if scope is None:
+            parser.error('a "mine" fuzzy_dictionary needs --user')
+        canonicals = load_dictionary(get_db(), scope)
+
+    start = time.perf_counter()
+    rows = run_batch(files, args.out_dir, options, args.workers, args.streaming_mb, args.chunk_rows, args.format,
+                     canonicals)
+    wall = time.perf_counter() - start
+    print_summary(rows, wall)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"recipe": options, "wall_seconds": round(wall, 3), "files": rows}, f, indent=2)
+    return 1 if any("error" in r for r in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Scaling benchmark for the fuzzy standardization engine.
+
+Generates columns of 1k to 1M unique dirty values (base names plus typo variants)
+and times fuzzy_engine.build_mapping against the old quadratic difflib loop.
+The old loop is only run up to --max-baseline uniques because it is O(U^2).
+
+Run from the repository root:
+    python -m benchmarks.bench_fuzzy --sizes 1000 10000 100000 1000000
+"""
+
+import argparse
+import difflib
+import json
+import random
+import time
+
+from benchmarks.dirty_data import make_word, typo
+from fuzzy_engine import build_mapping, CUTOFF
+
+
+def make_uniques(n, seed=0):
+    """n distinct values: about a quarter are base names, the rest typo variants of them."""
+    rng = random.Random(seed)
+    bases = set()
+    while len(bases) < max(n // 4, 1):
+        words = [make_word(rng) for _ in range(rng.randint(1, 3))]
+        bases.add(" ".join(words).title())
+    bases = sorted(bases)
+    values = set(bases)
+    while len(values) < n:
+        values.add(typo(rng.choice(bases), rng))
+    return {v: rng.randint(1, 50) for v in values}
+
+
+def quadratic_mapping(counts, cutoff=CUTOFF):
+    """The previous algorithm: each value against every value seen before it."""
+    mapping = {}
+    for val in sorted(counts, key=lambda v: (-counts[v], v)):
+        match = difflib.get_close_matches(val, mapping.keys(), n=1, cutoff=cutoff)
+        mapping[val] = mapping[match[0]] if match else val
+    return mapping
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--max-baseline", type=int, default=5_000)
+    parser.add_argument("--json", help="Write results to this file as JSON")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'uniques':>10} {'clusters':>10} {'candidates':>12} {'comparisons':>12} {'indexed s':>10} {'quadratic s':>12}")
+    for n in args.sizes:
+        counts = make_uniques(n)
+        start = time.perf_counter()
+        mapping, stats = build_mapping(counts, return_stats=True)
+        indexed = time.perf_counter() - start
+
+        quadratic = None
+        if n <= args.max_baseline:
+            start = time.perf_counter()
+            expected = quadratic_mapping(counts)
+            quadratic = time.perf_counter() - start
+            assert expected == mapping, "indexed engine disagrees with difflib"
+
+        row = {"uniques": n, "clusters": len(set(mapping.values())),
+               "candidates": stats["candidates"], "comparisons": stats["comparisons"],
+               "indexed_seconds": round(indexed, 3),
+               "quadratic_seconds": None if quadratic is None else round(quadratic, 3)}
+        results.append(row)
+        print(f"{n:>10} {row['clusters']:>10} {row['candidates']:>12} {row['comparisons']:>12} {indexed:>10.2f} "
+              f"{'-' if quadratic is None else f'{quadratic:.2f}':>12}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Speedup of the parallel text and fuzzy stages.
+
+Builds a wide dirty table (--copies side-by-side copies of the
+benchmarks.dirty_data text columns, each from its own seed) and times
+cleaning.clean_text_columns and cleaning.fuzzy_text_columns at each --workers
+count, best of --repeat. The "tall" case runs the text steps on three columns
+only (email, date, city) at --copies times the rows, so its speedup comes from
+partitions of each column's distinct values rather than from columns. The
+speedup is the workers=1 time over each time; every run's output is checked
+against workers=1. Fuzzy matching runs on the City and Status copies only: on
+the email and date columns its distinct values grow with the rows (see
+bench_suite).
+
+Run from the repository root:
+    python -m benchmarks.bench_parallel --rows 200000 --workers 1 2 4 8 --json parallel.json
+"""
+
+import argparse
+import json
+import os
+import time
+
+import pandas as pd
+
+from benchmarks.dirty_data import make_dirty_frame
+from cleaning import DEFAULT_OPTIONS, clean_text_columns, fuzzy_text_columns
+
+TEXT_OPTIONS = {**DEFAULT_OPTIONS, "do_normalize_text": True, "do_fix_dates": True, "do_validate_emails": True}
+TEXT_COLUMNS = ["Customer Email", "City", "Status", "Order Date"]
+FUZZY_COLUMNS = ["City", "Status"]
+TALL_COLUMNS = ["Customer Email", "Order Date", "City"]
+
+
+def make_wide_frame(rows, copies):
+    """copies of the dirty text columns side by side, named "City 1", "City 2" etc."""
+    parts = [make_dirty_frame(rows, seed=seed)[TEXT_COLUMNS].add_suffix(f" {seed + 1}") for seed in range(copies)]
+    return pd.concat(parts, axis=1)
+
+
+def make_tall_frame(rows, copies):
+    """The TALL_COLUMNS of a dirty table of copies x rows rows."""
+    return make_dirty_frame(rows * copies)[TALL_COLUMNS]
+
+
+def _text(df, workers):
+    df = df.copy()
+    start = time.perf_counter()
+    clean_text_columns(df, TEXT_OPTIONS, set(df.columns), workers)
+    return time.perf_counter() - start, df
+
+
+def _fuzzy(df, workers):
+    df = df[[col for col in df.columns if col.rsplit(" ", 1)[0] in FUZZY_COLUMNS]].copy()
+    start = time.perf_counter()
+    fuzzy_text_columns(df, set(df.columns), workers=workers)
+    return time.perf_counter() - start, df
+
+
+CASES = {"text": _text, "fuzzy": _fuzzy, "tall": _text}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--copies", type=int, default=4, help="Copies of the text columns (more columns than workers)")
+    parser.add_argument("--workers", type=int, nargs="+", default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", nargs="+", choices=list(CASES), default=list(CASES))
+    parser.add_argument("--json", help="Write results to this file as JSON")
+    args = parser.parse_args()
+
+    wide = make_wide_frame(args.rows, args.copies)
+    print(f"{args.rows} rows, {len(wide.columns)} text columns, {os.cpu_count()} CPUs")
+    print(f"{'case':<8} {'workers':>8} {'seconds':>10} {'speedup':>8}")
+    results = []
+    for case in args.only:
+        df = make_tall_frame(args.rows, args.copies) if case == "tall" else wide
+        baseline, expected = None, None
+        for workers in sorted(set(args.workers) | {1}):
+            times = []
+            for _ in range(args.repeat):
+                seconds, out = CASES[case](df, workers)
+                times.append(seconds)
+            if expected is None:
+                expected = out
+            else:
+                pd.testing.assert_frame_equal(out, expected)
+            best = min(times)
+            baseline = baseline or best
+            row = {"case": case, "rows": len(out), "columns": len(out.columns), "workers": workers,
+                   "seconds": round(best, 3), "speedup": round(baseline / best, 2)}
+            results.append(row)
+            print(f"{case:<8} {workers:>8} {best:>10.2f} {row['speedup']:>8.2f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"cpus": os.cpu_count(), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
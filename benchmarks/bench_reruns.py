@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+End-to-end rerun latency of the Streamlit app.
+
+Streamlit reruns sprint5.py from the top on every click, so most of the wait a
+user sees is work redone on each rerun (database setup, config and image
+loading, parsing and profiling the upload) rather than the cleaning itself.
+This drives sprint5.py headlessly with Streamlit's app testing API
+(streamlit.testing.v1.AppTest): it uploads generated dirty files of each size,
+toggles options, clicks Run Cleaning and times every rerun.
+
+Each session uses its own seed, so the upload and result caches start cold for
+it; the app's database and result cache point at a temporary directory, not
+users.db. Results are written in the same JSON shape as bench_suite, so
+--compare catches rerun regressions the same way.
+
+Run from the repository root (needs streamlit):
+    python -m benchmarks.bench_reruns --rows 10000 100000 --json reruns.json
+    python -m benchmarks.bench_reruns --rows 100000 --compare reruns.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+
+from benchmarks.bench_suite import compare, environment
+from benchmarks.dirty_data import make_dirty_frame
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = os.path.join(ROOT, "sprint5.py")
+
+
+def _click(label):
+    def action(at, upload):
+        next(button for button in at.button if button.label == label).click()
+    return action
+
+
+def _check(*keys):
+    def action(at, upload):
+        for key in keys:
+            at.checkbox(key=key).check()
+    return action
+
+
+def _noop(at, upload):
+    pass
+
+
+def _upload(at, upload):
+    at.file_uploader[0].set_value(upload)
+
+
+def _both(*actions):
+    def action(at, upload):
+        for a in actions:
+            a(at, upload)
+    return action
+
+
+# (interaction, what it changes before the timed rerun), in the order a user would go
+INTERACTIONS = [
+    ("first load", _noop),
+    ("idle rerun", _noop),
+    ("upload file", _upload),
+    ("rerun with file", _noop),
+    ("toggle remove duplicates", _check("do_duplicates")),
+    ("toggle normalize text", _check("do_normalize_text")),
+    ("toggle fix dates and emails", _check("do_fix_dates", "do_validate_emails")),
+    ("run cleaning", _click("Run Cleaning")),
+    ("run cleaning again", _click("Run Cleaning")),
+    ("add anomalies and run", _both(_check("do_anomaly_detection"), _click("Run Cleaning"))),
+    ("rerun after cleaning", _noop),
+]
+
+
+def run_session(upload, timeout):
+    """{interaction: seconds} for one pass through INTERACTIONS; stops at the first exception the app raises."""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP, default_timeout=timeout)
+    times = {}
+    for name, action in INTERACTIONS:
+        if name != "first load":
+            action(at, upload)
+        start = time.perf_counter()
+        at.run()
+        times[name] = time.perf_counter() - start
+        if at.exception:
+            raise RuntimeError(f"app raised during '{name}': {at.exception[0].message}")
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=3, help="Sessions per size (each with a fresh file)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=600, help="Seconds one rerun may take before failing")
+    parser.add_argument("--json", help="Write the results to this file as JSON")
+    parser.add_argument("--compare", help="Results JSON of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="With --compare, exit with status 1 if an interaction is this many times slower")
+    args = parser.parse_args()
+    warnings.simplefilter("ignore")
+
+    # The app reads these when it first imports db and result_cache, i.e. on the first rerun
+    tmp = tempfile.mkdtemp(prefix="rawtoready_bench_")
+    os.environ["RAWTOREADY_DB"] = os.path.join(tmp, "bench.db")
+    os.environ["RAWTOREADY_RESULT_CACHE"] = os.path.join(tmp, "results")
+    os.environ.setdefault("STREAMLIT_LOGGER_LEVEL", "error")
+    os.chdir(ROOT)   # the app loads its config and images by relative path
+
+    results = []
+    print(f"{'interaction':<30} {'rows':>10} {'best s':>9} {'median s':>9}")
+    for rows in args.rows:
+        sessions = []
+        for i in range(args.repeat):
+            data = make_dirty_frame(rows, seed=args.seed + i).to_csv(index=False).encode("utf-8")
+            sessions.append(run_session((f"dirty_{rows}_{i}.csv", data, "text/csv"), args.timeout))
+        for name, _ in INTERACTIONS:
+            times = [session[name] for session in sessions]
+            row = {"case": name, "rows": rows, "repeat": args.repeat, "min_seconds": round(min(times), 5),
+                   "median_seconds": round(statistics.median(times), 5)}
+            results.append(row)
+            print(f"{name:<30} {rows:>10} {row['min_seconds']:>9.4f} {row['median_seconds']:>9.4f}")
+
+    report = {"environment": environment(), "seed": args.seed, "results": results}
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            slower = compare(results, json.load(f), args.threshold)
+        if slower:
+            print(f"\n{len(slower)} interaction(s) slower than {args.threshold}x the baseline: {', '.join(slower)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Micro-benchmarks for the cleaning helpers and the whole pipeline.
+
+Times each helper the app runs (fills, duplicate removal, normalize, dates,
+emails, fuzzy matching, anomaly detection) and the full in-memory and
+streaming pipelines on datasets from benchmarks.dirty_data. Each case is run
+--repeat times; the JSON output has the best and median time of each, plus the
+commit and library versions, so runs can be compared between commits with
+--compare.
+
+Run from the repository root:
+    python -m benchmarks.bench_suite --rows 10000 100000 --json bench_new.json
+    python -m benchmarks.bench_suite --rows 100000 --only dates fuzzy --compare bench_old.json
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from anomaly_engine import METHODS, detect_anomalies
+from benchmarks.dirty_data import Mix, make_dirty_frame
+from cleaning import FILL_METHODS, DEFAULT_OPTIONS, clean_frame, normalize_text, validate_emails
+from date_engine import standardize_dates
+from fuzzy_engine import fuzzy_standardize
+from missing_engine import fill_missing
+from streaming import clean_csv_stream
+
+# Every step but fuzzy matching on. Fuzzy matching also runs on the date and
+# email columns, whose distinct values grow with the rows and make it by far the
+# slowest step, so it has its own case on at most --max-fuzzy-rows rows.
+PIPELINE_OPTIONS = {**DEFAULT_OPTIONS, "fill_method": "Fill with Median", "do_duplicates": True,
+                    "do_standardize_cols": True, "do_normalize_text": True, "do_fix_dates": True,
+                    "do_validate_emails": True, "do_anomaly_detection": True}
+FUZZY_OPTIONS = {**PIPELINE_OPTIONS, "do_fuzzy_standardize": True}
+LIMITED = {"pipeline_fuzzy"}
+
+
+def _stream(df):
+    with tempfile.TemporaryDirectory() as tmp:
+        src = os.path.join(tmp, "in.csv")
+        df.to_csv(src, index=False)
+        start = time.perf_counter()
+        clean_csv_stream(src, os.path.join(tmp, "out.csv"), PIPELINE_OPTIONS)
+        return time.perf_counter() - start   # the CSV write above is not part of the case
+
+
+# name -> function of the dirty frame. A function may return its own timing
+# (seconds) when it needs setup that should not be counted.
+CASES = {
+    **{f"fill[{method}]": (lambda df, method=method: fill_missing(df, method)) for method in FILL_METHODS},
+    "duplicates": lambda df: df.drop_duplicates(),
+    "normalize": lambda df: normalize_text(df["City"], col_name="City"),
+    "emails": lambda df: validate_emails(df["Customer Email"]),
+    "dates": lambda df: standardize_dates(df["Order Date"]),
+    "fuzzy": lambda df: fuzzy_standardize(df["City"]),
+    **{f"anomalies[{method}]": (lambda df, method=method: detect_anomalies(df, method=method)) for method in METHODS},
+    "pipeline": lambda df: clean_frame(df, PIPELINE_OPTIONS),
+    "pipeline_streaming": _stream,
+    "pipeline_fuzzy": lambda df: clean_frame(df, FUZZY_OPTIONS),
+}
+
+
+def run_case(func, df, repeat):
+    """Seconds of each of repeat runs of func(df), after one untimed warm-up run."""
+    func(df)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        own = func(df)
+        elapsed = time.perf_counter() - start
+        times.append(own if isinstance(own, float) else elapsed)
+    return times
+
+
+def environment():
+    """Where and on what the results were measured."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    versions = {"python": platform.python_version(), "pandas": pd.__version__, "numpy": np.__version__}
+    try:
+        import pyarrow
+        versions["pyarrow"] = pyarrow.__version__
+    except ImportError:
+        pass
+    return {"commit": commit, "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "platform": platform.platform(), "cpus": os.cpu_count(), "versions": versions}
+
+
+def compare(results, baseline, threshold):
+    """Print each case next to the baseline's; returns the cases that got slower by more than threshold."""
+    old = {(r["case"], r["rows"]): r for r in baseline["results"]}
+    slower = []
+    print(f"\n{'case':<28} {'rows':>10} {'old s':>9} {'new s':>9} {'ratio':>7}")
+    for r in results:
+        before = old.get((r["case"], r["rows"]))
+        if before is None:
+            continue
+        ratio = r["min_seconds"] / before["min_seconds"] if before["min_seconds"] else float("inf")
+        flag = "  slower" if ratio > threshold else ""
+        print(f"{r['case']:<28} {r['rows']:>10} {before['min_seconds']:>9.4f} {r['min_seconds']:>9.4f} {ratio:>6.2f}x{flag}")
+        if ratio > threshold:
+            slower.append(r["case"])
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-fuzzy-rows", type=int, default=2_000,
+                        help="Rows the pipeline_fuzzy case is run on (the first rows of each dataset)")
+    parser.add_argument("--only", nargs="+", help="Run only the cases whose name starts with one of these")
+    parser.add_argument("--json", help="Write the results to this file as JSON")
+    parser.add_argument("--compare", help="Results JSON of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=1.15,
+                        help="With --compare, exit with status 1 if a case is this many times slower")
+    args = parser.parse_args()
+    warnings.simplefilter("ignore")
+
+    cases = {name: func for name, func in CASES.items()
+             if not args.only or any(name.startswith(prefix) for prefix in args.only)}
+    mix = Mix()
+    results = []
+    print(f"{'case':<28} {'rows':>10} {'best s':>9} {'median s':>9} {'rows/s':>12}")
+    for rows in args.rows:
+        df = make_dirty_frame(rows, mix, args.seed)
+        for name, func in cases.items():
+            data = df.head(args.max_fuzzy_rows) if name in LIMITED else df
+            times = run_case(func, data, args.repeat)
+            best = min(times)
+            # rows is the dataset size (what runs are matched on); rows_timed what the case actually ran on
+            row = {"case": name, "rows": rows, "rows_timed": len(data), "repeat": args.repeat,
+                   "min_seconds": round(best, 5), "median_seconds": round(statistics.median(times), 5),
+                   "rows_per_sec": round(len(data) / best) if best else None}
+            results.append(row)
+            print(f"{name:<28} {len(data):>10} {best:>9.4f} {row['median_seconds']:>9.4f} {row['rows_per_sec'] or 0:>12,}")
+
+    report = {"environment": environment(), "seed": args.seed, "mix": mix.as_dict(), "results": results}
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            slower = compare(results, json.load(f), args.threshold)
+        if slower:
+            print(f"\n{len(slower)} case(s) slower than {args.threshold}x the baseline: {', '.join(slower)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
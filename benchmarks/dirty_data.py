@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Synthetic dirty datasets for benchmarking Raw to Ready.
+
+Generates customer/order-like tables with the problems the app cleans up:
+misspelled and inconsistently cased categories, dates in mixed formats,
+broken emails, injected nulls, duplicate rows and numeric outliers. The amount
+of each is set by a Mix. Output is reproducible for a given seed and size.
+
+Values are drawn from small pools built up front (category variants, one
+string per day in each date format, 20,000 emails), so generating a
+chunk is array indexing only. Big files are written chunk by chunk, so 10M rows
+take no more memory than one chunk.
+
+Run from the repository root:
+    python -m benchmarks.dirty_data --rows 1000000 --out dirty_1m.csv
+    python -m benchmarks.dirty_data --rows 10000000 --out dirty_10m.parquet --null-rate 0.1
+"""
+
+import argparse
+import datetime
+import random
+import string
+
+import numpy as np
+import pandas as pd
+
+from file_formats import EXPORT_FORMATS, ChunkWriter, arrow_schema
+
+CHUNK_ROWS = 500_000
+CITIES = ["New York", "Los Angeles", "Chicago", "Houston", "Phoenix", "Philadelphia", "San Antonio",
+          "San Diego", "Dallas", "Austin", "Seattle", "Denver", "Boston", "Miami", "Atlanta"]
+STATUSES = ["Delivered", "Shipped", "Pending", "Cancelled", "Returned"]
+DOMAINS = ["gmail.com", "yahoo.com", "outlook.com", "example.org", "company.co.uk"]
+DATE_FORMATS = ["%Y-%m-%d", "%m/%d/%Y", "%d/%m/%y", "%b %d, %Y", "%d %B %Y", "%Y%m%d"]
+FIRST_DAY = datetime.date(2015, 1, 1)
+DAYS = 3650
+CONSONANTS = "bcdfghjklmnprstvwyz"
+VOWELS = "aeiou"
+
+
+def make_word(rng):
+    """A pronounceable made-up word, like a town or vendor name."""
+    syllables = rng.randint(2, 4)
+    return "".join(rng.choice(CONSONANTS) + rng.choice(VOWELS) + rng.choice(["", "", rng.choice(CONSONANTS)])
+                   for _ in range(syllables))
+
+
+def typo(word, rng):
+    """word with one random substitution, insertion or deletion, or its case changed."""
+    i = rng.randrange(len(word))
+    op = rng.choice("sidc")
+    c = rng.choice(string.ascii_lowercase)
+    if op == "s":
+        return word[:i] + c + word[i + 1:]
+    if op == "i":
+        return word[:i] + c + word[i:]
+    if op == "d" and len(word) > 1:
+        return word[:i] + word[i + 1:]
+    return word.upper() if rng.random() < 0.5 else word.title()
+
+
+class Mix:
+    """How dirty the data is: each rate is the share of rows (or values) affected."""
+
+    def __init__(self, null_rate=0.05, dup_rate=0.02, typo_rate=0.15, outlier_rate=0.005,
+                 bad_email_rate=0.05, date_formats=len(DATE_FORMATS)):
+        self.null_rate = null_rate
+        self.dup_rate = dup_rate
+        self.typo_rate = typo_rate
+        self.outlier_rate = outlier_rate
+        self.bad_email_rate = bad_email_rate
+        self.date_formats = date_formats
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+def _variants(names, rng, per_name=6):
+    """Misspelled and re-cased versions of each name (the clean names are not included)."""
+    out = []
+    for name in names:
+        seen = {name}
+        while len(seen) < per_name + 1:
+            seen.add(rng.choice([typo(name, rng), name.lower(), name.upper(), f" {name} ", typo(name.lower(), rng)]))
+        out += sorted(seen - {name})
+    return out
+
+
+def _broken(email, rng):
+    user, domain = email.split("@")
+    return rng.choice([f"{user}{domain}", f"{user}@@{domain}", f"{user}@", f"@{domain}", f"{user} @{domain}",
+                       f"{user}@{domain.split('.')[0]}", "n/a", ""])
+
+
+class _Pools:
+    """The value pools rows are drawn from, built once per generator."""
+
+    def __init__(self, mix, seed):
+        rng = random.Random(seed)
+        self.cities = np.array(CITIES + _variants(CITIES, rng), dtype=object)
+        self.statuses = np.array(STATUSES + _variants(STATUSES, rng, per_name=3), dtype=object)
+        self.n_cities, self.n_statuses = len(CITIES), len(STATUSES)
+
+        days = [FIRST_DAY + datetime.timedelta(days=d) for d in range(DAYS)]
+        formats = DATE_FORMATS[:max(mix.date_formats, 1)]
+        self.dates = np.array([[d.strftime(fmt) for d in days] for fmt in formats], dtype=object)
+
+        emails = sorted({f"{make_word(rng)}.{make_word(rng)}{rng.randint(1, 99)}@{rng.choice(DOMAINS)}" for _ in range(20_000)})
+        self.emails = np.array(emails, dtype=object)
+        self.bad_emails = np.array([_broken(e, rng) for e in emails[:2_000]], dtype=object)
+
+
+def iter_chunks(rows, mix=None, seed=0, chunksize=CHUNK_ROWS):
+    """Yield the dirty dataset of rows rows in frames of up to chunksize rows."""
+    mix = mix or Mix()
+    pools = _Pools(mix, seed)
+    rng = np.random.default_rng(seed)
+    done = 0
+    while done < rows:
+        n = min(chunksize, rows - done)
+        yield _chunk(n, done, mix, pools, rng)
+        done += n
+
+
+def _chunk(n, offset, mix, pools, rng):
+    def pick(clean_count, pool):
+        # Clean values, except typo_rate of them replaced by a variant
+        idx = rng.integers(0, clean_count, n)
+        typo = rng.random(n) < mix.typo_rate
+        idx[typo] = rng.integers(clean_count, len(pool), typo.sum())
+        return pool[idx]
+
+    emails = pools.emails[rng.integers(0, len(pools.emails), n)]
+    bad = rng.random(n) < mix.bad_email_rate
+    emails[bad] = pools.bad_emails[rng.integers(0, len(pools.bad_emails), bad.sum())]
+
+    amount = np.round(rng.lognormal(4, 0.6, n), 2)
+    outliers = rng.random(n) < mix.outlier_rate
+    amount[outliers] *= rng.choice([-1, 50, 1000], outliers.sum())
+
+    df = pd.DataFrame({
+        "Order ID": np.arange(offset + 1, offset + n + 1),
+        "Customer Email": emails,
+        "City": pick(pools.n_cities, pools.cities),
+        "Status": pick(pools.n_statuses, pools.statuses),
+        "Order Date": pools.dates[rng.integers(0, len(pools.dates), n), rng.integers(0, DAYS, n)],
+        "Quantity": rng.integers(1, 10, n),
+        "Amount": amount,
+    })
+
+    # Injected nulls, in every column but the id
+    for col in df.columns[1:]:
+        mask = rng.random(n) < mix.null_rate
+        if mask.any():
+            df[col] = df[col].mask(mask)
+
+    # Duplicate rows: copies of earlier rows of the chunk, id included, dropped in at random places
+    dups = int(n * mix.dup_rate)
+    if dups and n > 1:
+        targets = rng.choice(np.arange(1, n), size=min(dups, n - 1), replace=False)
+        sources = (rng.random(len(targets)) * targets).astype(int)
+        for col in df.columns:
+            values = df[col].to_numpy(copy=True)
+            values[targets] = values[sources]
+            df[col] = values
+    return df
+
+
+def make_dirty_frame(rows, mix=None, seed=0):
+    """The whole dirty dataset as one frame."""
+    return pd.concat(iter_chunks(rows, mix, seed), ignore_index=True)
+
+
+def write_dirty_file(path, rows, mix=None, seed=0, chunksize=CHUNK_ROWS):
+    """Write the dirty dataset to path in the format its extension names (see file_formats.EXPORT_FORMATS)."""
+    mix = mix or Mix()
+    fmt = next((fmt for fmt in sorted(EXPORT_FORMATS, key=len, reverse=True) if path.endswith("." + fmt)), None)
+    if fmt is None:
+        raise ValueError(f"unknown output format for {path}: use one of {', '.join(EXPORT_FORMATS)}")
+    chunks = iter_chunks(rows, mix, seed, chunksize)
+    first = next(chunks)
+    # With nulls, Quantity is a float column even in a chunk that happens to have none
+    schema = None if fmt.startswith("csv") else arrow_schema(first.astype({"Quantity": float} if mix.null_rate else {}))
+    with ChunkWriter(fmt, path, schema) as writer:
+        writer.write(first)
+        for chunk in chunks:
+            writer.write(chunk)
+
+
+def main():
+    defaults = Mix()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--out", required=True, help="Output file; the extension picks the format (.csv, .csv.gz, .parquet, ...)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    for name, value in defaults.as_dict().items():
+        parser.add_argument("--" + name.replace("_", "-"), type=type(value), default=value)
+    args = parser.parse_args()
+    mix = Mix(**{name: getattr(args, name) for name in defaults.as_dict()})
+    write_dirty_file(args.out, args.rows, mix, args.seed, args.chunk_rows)
+
+
+if __name__ == "__main__":
+    main()
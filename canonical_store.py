@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Saved canonical values for fuzzy standardization in Raw to Ready.
+
+fuzzy_standardize used to learn every column's canonical values from scratch,
+yet the same kinds of files (same city, vendor and department columns) come
+back every week. The values of each run and the canonical each was mapped to
+are saved in SQLite (see db.py), in a user's own dictionary or the shared one,
+keyed by the column's semantic: its name lowercased with spaces and
+punctuation folded to "_", so "Vendor Name" and "vendor_name" share entries.
+
+A later run resolves the values already saved by lookup and matches only the
+new ones, against a trigram index of the saved values (see
+fuzzy_engine.CanonicalIndex) as well as each other; the new values are then
+saved back. A saved value keeps the canonical it was first saved with.
+
+Snapshots of a dictionary and the indexes built from them are kept for the
+whole server process, until a value is added to it. Columns with more than
+DICTIONARY_MAX_VALUES distinct values in a run (IDs, emails) are not saved.
+"""
+
+import hashlib
+import json
+import re
+import threading
+
+from fuzzy_engine import CanonicalIndex
+
+SHARED = "*"
+DICTIONARY_MAX_VALUES = 20_000
+DICTIONARY_LABELS = {"": "Off", "mine": "My dictionary", "shared": "Shared dictionary"}
+
+
+def semantic(column):
+    """The key a column's values are saved under: its name lowercased, non-alphanumeric runs folded to "_"."""
+    return re.sub(r"[^0-9a-z]+", "_", str(column).lower()).strip("_")
+
+
+def dictionary_scope(choice, email=None):
+    """Scope of the fuzzy_dictionary option choice ("", "mine" or "shared"): email, SHARED, or None when off or logged out."""
+    if choice == "shared":
+        return SHARED
+    if choice == "mine":
+        return email or None
+    return None
+
+
+class CanonicalDictionary:
+    """Snapshot of one scope's saved values, {semantic: {value: canonical}}. Instances are never modified."""
+
+    def __init__(self, entries):
+        self.entries = entries
+        # Identifies the contents: part of the cache keys of the results that used them
+        self.revision = hashlib.blake2b(json.dumps(entries, sort_keys=True).encode("utf-8"),
+                                        digest_size=16).hexdigest()
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return sum(len(values) for values in self.entries.values())
+
+    def __getstate__(self):
+        # Sent to batch workers without the lock or the indexes
+        return {"entries": self.entries, "revision": self.revision}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state, _indexes={}, _lock=threading.Lock())
+
+    def index(self, column):
+        """CanonicalIndex of the values saved for column's semantic (built on first use), or None if there are none."""
+        key = semantic(column)
+        if key not in self.entries:
+            return None
+        with self._lock:
+            if key not in self._indexes:
+                self._indexes[key] = CanonicalIndex(self.entries[key], token=f"{self.revision}:{key}")
+            return self._indexes[key]
+
+
+_snapshots = {}   # scope -> (number of saved values, CanonicalDictionary)
+_lock = threading.Lock()
+
+
+def load_dictionary(db, scope):
+    """CanonicalDictionary of scope from db (a db.Database), reusing the last snapshot while no value was added."""
+    count = db.canonical_count(scope)
+    with _lock:
+        cached = _snapshots.get(scope)
+    if cached is not None and cached[0] == count:
+        return cached[1]
+    entries = {}
+    for key, value, canonical in db.canonical_values(scope):
+        entries.setdefault(key, {})[value] = canonical
+    dictionary = CanonicalDictionary(entries)
+    with _lock:
+        _snapshots[scope] = (count, dictionary)
+    return dictionary
+
+
+def save_updates(db, scope, updates):
+    """
+    Save a run's "canonical_updates" ({column: {value: (canonical, rows)}}, see
+    cleaning.run_stages) under scope; returns how many values were new.
+    """
+    rows = [(semantic(column), value, canonical, n)
+            for column, values in updates.items() if len(values) <= DICTIONARY_MAX_VALUES
+            for value, (canonical, n) in values.items()]
+    return db.save_canonical_values(scope, rows) if rows else 0
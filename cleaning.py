@@ -0,0 +1,446 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Data cleaning helpers for Raw to Ready.
+
+These used to live inside sprint5.py; they are kept here, free of any
+Streamlit code, so the app and the streaming pipeline share one copy.
+"""
+
+import json
+import re
+
+import pandas as pd
+
+from date_engine import standardize_dates
+from fuzzy_engine import CUTOFF, fuzzy_standardize
+from missing_engine import FILL_VALUE, fill_missing
+from anomaly_engine import RESULT_COLUMNS, detect_anomalies
+from near_dup_engine import TABLE_COLUMNS, find_near_duplicates, merge_near_duplicates, near_duplicate_table
+from text_engine import TextColumn
+from parallel_engine import ColumnTask, run_column_tasks
+from instrument import measure
+from fingerprint_engine import RowFingerprints
+
+EMAIL_PATTERN = re.compile(r"[^@]+@[^@]+\.[^@]+")
+INVALID_EMAIL = "invalid@example.com"
+FILL_METHODS = ["Fill with N/A", "Fill with Mean", "Fill with Median", "Fill by most common", "Drop Rows"]
+
+# A cleaning recipe: the same keys the app stores in cleaning_history.cleaning_options
+DEFAULT_OPTIONS = {
+    "fill_method": "Fill with N/A",
+    "do_duplicates": False,
+    "duplicate_keys": [],
+    "do_standardize_cols": False,
+    "do_normalize_text": False,
+    "do_fix_dates": False,
+    "do_validate_emails": False,
+    "do_fuzzy_standardize": False,
+    "fuzzy_dictionary": "",
+    "do_near_duplicates": False,
+    "near_duplicate_columns": [],
+    "near_duplicate_merge": False,
+    "do_anomaly_detection": False,
+    "anomaly_method": "zscore",
+    "anomaly_group_by": [],
+}
+
+
+def text_columns(df):
+    """Columns the text steps (normalize, fuzzy) apply to: object and (Arrow) string columns."""
+    return df.columns[[pd.api.types.is_string_dtype(dtype) for dtype in df.dtypes]]
+
+
+def date_columns(df):
+    return [col for col in df.columns if "date" in col.lower()]
+
+
+def email_columns(df):
+    return [col for col in df.columns if "email" in col.lower()]
+
+
+def standardize_column_names(columns):
+    return [c.strip().lower().replace(" ", "_") for c in columns]
+
+
+def normalize_text(series, col_name=""):
+    """Normalize capitalization for names/cities, but skip emails."""
+    if "email" in col_name.lower():
+        return series
+    return series.astype(str).str.strip().str.lower().str.title()
+
+
+def validate_emails(series):
+    return series.apply(lambda x: x if EMAIL_PATTERN.match(str(x)) else INVALID_EMAIL)
+
+
+def clean_text_column(column, col, steps):
+    """Run steps ("normalize", "dates", "emails", in that order) on the TextColumn column named col; returns its date report or None."""
+    date_report = None
+    if "normalize" in steps:
+        column.apply("normalize", lambda u: normalize_text(u, col_name=col))
+    if "dates" in steps:
+        counts = column.counts()
+
+        def fix_dates(u):
+            nonlocal date_report
+            values, date_report = standardize_dates(u, return_report=True, weights=counts)
+            return values
+        column.apply("dates", fix_dates, elementwise=False)
+    if "emails" in steps:
+        column.apply("emails", validate_emails)
+    return date_report
+
+
+def merge_date_reports(reports):
+    """One date report from those of a column's partitions (None where the dates step didn't run)."""
+    reports = [report for report in reports if report is not None]
+    if not reports:
+        return None
+    return {key: sum(report.get(key, 0) for report in reports) for key in reports[0]}
+
+
+def clean_text_columns(df, options, text_cols, workers=1):
+    """
+    Run the normalize, date and email steps of options on df, in place.
+
+    text_cols are the columns normalize applies to. Every column a step touches
+    is factorized once; the steps run on its unique values in the app's order
+    and the column is rebuilt from the codes at the end. Columns are cleaned
+    on up to workers processes, large ones split into partitions of their
+    values (see parallel_engine): the steps are row-local. Returns (date_reports,
+    text_reports, changed, parallel): text_reports is {column: {step: stats}},
+    changed the number of cells changed and parallel the
+    parallel_engine.run_column_tasks report.
+    """
+    options = {**DEFAULT_OPTIONS, **options}
+    dates = set(date_columns(df)) if options["do_fix_dates"] else set()
+    emails = set(email_columns(df)) if options["do_validate_emails"] else set()
+    tasks = []
+    for col in df.columns:
+        normalize = options["do_normalize_text"] and col in text_cols and "email" not in col.lower()
+        steps = [step for step, on in [("normalize", normalize), ("dates", col in dates), ("emails", col in emails)]
+                 if on]
+        if steps:
+            tasks.append(ColumnTask(col, TextColumn(df[col]), clean_text_column, (col, steps), steps,
+                                    merge=merge_date_reports))
+    results, parallel = run_column_tasks(tasks, workers)
+
+    date_reports, text_reports, changed = {}, {}, 0
+    for task, date_report in zip(tasks, results):
+        df[task.name] = task.column.to_series()
+        if date_report is not None:
+            date_reports[task.name] = date_report
+        text_reports[task.name] = task.column.stats
+        changed += task.column.changed()
+    return date_reports, text_reports, changed, parallel
+
+
+def fuzzy_column(column, collect=False, known=None):
+    """
+    Fuzzy-standardize the TextColumn column; known is a fuzzy_engine.CanonicalIndex of saved values or None.
+
+    With collect=True returns {value: (canonical, rows)} of its values, else None.
+    """
+    counts = column.counts()
+    mapping = None
+
+    def fuzzy(u):
+        nonlocal mapping
+        if not collect:
+            return fuzzy_standardize(u, cutoff=CUTOFF, weights=counts, known=known)
+        values, mapping = fuzzy_standardize(u, cutoff=CUTOFF, weights=counts, known=known, return_mapping=True)
+        return values
+    column.apply("fuzzy", fuzzy, elementwise=False)
+    return mapping
+
+
+def fuzzy_text_columns(df, text_cols, canonicals=None, workers=1):
+    """
+    Fuzzy-standardize text_cols of df in place (on their unique values), on up to workers processes.
+
+    canonicals, if given, is a canonical_store.CanonicalDictionary whose saved
+    values are matched first. Returns ({column: stats}, cells changed,
+    updates, parallel): with canonicals, updates is {column: {value:
+    (canonical, rows)}} for saving back, otherwise empty; parallel is the
+    parallel_engine.run_column_tasks report.
+    """
+    tasks = [ColumnTask(col, TextColumn(df[col]), fuzzy_column,
+                        (canonicals is not None, None if canonicals is None else canonicals.index(col)), ["fuzzy"])
+             for col in df.columns if col in text_cols]
+    results, parallel = run_column_tasks(tasks, workers)
+
+    stats, changed, updates = {}, 0, {}
+    for task, mapping in zip(tasks, results):
+        df[task.name] = task.column.to_series()
+        stats[task.name] = task.column.stats["fuzzy"]
+        changed += task.column.changed()
+        if mapping is not None:
+            updates[task.name] = mapping
+    return stats, changed, updates, parallel
+
+
+# --- The pipeline as a chain of stages ---
+#
+# Each stage takes the state left by the one before ({"df", "fingerprints",
+# "fill_report", "date_reports", "text_reports", "canonical_updates",
+# "near_duplicates", "anomalies", "parallel"}) and returns a new state without modifying the old one, so any
+# stage's output can be kept and reused: a stage's output only depends on the
+# input data and the options of the stages up to it. "fingerprints" is the RowFingerprints index of "df": stages
+# that drop rows take the same rows of it and stages that change columns
+# re-hash just those. Each stage also returns how many cells it changed (cells
+# of dropped rows count).
+
+def _fill_stage(state, options):
+    before = state["df"]
+    df, fill_report = fill_missing(before, method=options["fill_method"], return_report=True)
+    if len(df) < len(before):
+        changed = (len(before) - len(df)) * before.shape[1]
+        if before.index.is_unique:
+            fingerprints = state["fingerprints"].take(before.index.get_indexer(df.index))
+        else:
+            fingerprints = RowFingerprints.of(df)
+    else:
+        changed = sum(fill_report.values())
+        fingerprints = state["fingerprints"].rehash(df, {col for col, n in fill_report.items() if n})
+    return {**state, "df": df, "fingerprints": fingerprints, "fill_report": fill_report}, changed
+
+
+def _dedupe_stage(state, options):
+    # Same rows as drop_duplicates(subset=keys), from the fingerprints instead of re-hashing the rows
+    keep = ~state["fingerprints"].duplicated(options["duplicate_keys"] or None)
+    df = state["df"][keep]
+    changed = (len(state["df"]) - len(df)) * df.shape[1]
+    return {**state, "df": df, "fingerprints": state["fingerprints"].take(keep)}, changed
+
+
+def _columns_stage(state, options):
+    df = state["df"]
+    df = df.set_axis(standardize_column_names(df.columns), axis=1, copy=False)
+    return {**state, "df": df, "fingerprints": state["fingerprints"].rename(list(df.columns))}, 0
+
+
+def _text_stage(state, options):
+    df = state["df"].copy()
+    date_reports, text_reports, changed, parallel = clean_text_columns(df, options, set(text_columns(df)),
+                                                                       options["workers"])
+    fingerprints = state["fingerprints"].rehash(df, set(text_reports))
+    return {**state, "df": df, "fingerprints": fingerprints, "date_reports": date_reports,
+            "text_reports": text_reports, "parallel": {**state["parallel"], "text": parallel}}, changed
+
+
+def _fuzzy_stage(state, options):
+    # Date and email output is text, so text_columns() picks those columns up too
+    df = state["df"].copy()
+    fuzzy, changed, updates, parallel = fuzzy_text_columns(df, set(text_columns(df)), options["canonicals"],
+                                                           options["workers"])
+    text_reports = {col: {**state["text_reports"].get(col, {}), **({"fuzzy": fuzzy[col]} if col in fuzzy else {})}
+                    for col in df.columns if col in state["text_reports"] or col in fuzzy}
+    fingerprints = state["fingerprints"].rehash(df, set(fuzzy))
+    return {**state, "df": df, "fingerprints": fingerprints, "text_reports": text_reports,
+            "canonical_updates": updates, "parallel": {**state["parallel"], "fuzzy": parallel}}, changed
+
+
+def _near_duplicate_stage(state, options):
+    # Compared on the chosen columns (renamed like the columns), or every text column
+    df = state["df"]
+    columns = options["near_duplicate_columns"]
+    if columns and options["do_standardize_cols"]:
+        columns = standardize_column_names(columns)
+    columns = list(columns) or list(text_columns(df))
+    # The fill step's "N/A" placeholders are missing values, not matching ones
+    compared = df[columns].mask(df[columns] == FILL_VALUE)
+    positions, groups, similarity = find_near_duplicates(compared, columns)
+    table = near_duplicate_table(df, positions, groups, similarity, columns)
+    if not options["near_duplicate_merge"] or not len(positions):
+        return {**state, "near_duplicates": table}, 0
+    merged, keep, filled = merge_near_duplicates(df, positions, groups)
+    changed = (len(df) - len(merged)) * df.shape[1] + sum(filled.values())
+    fingerprints = state["fingerprints"].take(keep).rehash(merged, set(filled))
+    return {**state, "df": merged, "fingerprints": fingerprints, "near_duplicates": table}, changed
+
+
+def _anomaly_stage(state, options):
+    group_by = options["anomaly_group_by"]
+    if options["do_standardize_cols"]:
+        group_by = standardize_column_names(group_by)
+    anomalies = detect_anomalies(state["df"], method=options["anomaly_method"], group_by=group_by)
+    return {**state, "anomalies": anomalies}, 0
+
+
+class Stage:
+    """
+    One step of the pipeline.
+
+    keys are the options it reads; switch, if any, is the option (or list of
+    options, any of which) that turns it on. When off the stage passes its
+    input through and its other keys are ignored.
+    """
+
+    def __init__(self, name, label, run, keys, switch=None):
+        self.name = name
+        self.label = label
+        self.run = run
+        self.keys = keys
+        self.switch = switch
+
+    def enabled(self, options):
+        if self.switch is None:
+            return True
+        if isinstance(self.switch, str):
+            return bool(options[self.switch])
+        return any(options[key] for key in self.switch)
+
+    def params(self, options):
+        """The options this stage's output depends on, given its input."""
+        if not self.enabled(options):
+            return {}
+        return {key: options[key] for key in self.keys}
+
+
+TEXT_KEYS = ["do_normalize_text", "do_fix_dates", "do_validate_emails"]
+
+STAGES = [
+    Stage("fill", "Missing values", _fill_stage, ["fill_method"]),
+    Stage("dedupe", "Remove duplicates", _dedupe_stage, ["do_duplicates", "duplicate_keys"], "do_duplicates"),
+    Stage("columns", "Standardize column names", _columns_stage, ["do_standardize_cols"], "do_standardize_cols"),
+    Stage("text", "Normalize text, dates and emails", _text_stage, TEXT_KEYS, TEXT_KEYS),
+    Stage("fuzzy", "Fuzzy standardize", _fuzzy_stage,
+          ["do_fuzzy_standardize", "fuzzy_dictionary", "canonical_revision"], "do_fuzzy_standardize"),
+    Stage("near_duplicates", "Near-duplicate records", _near_duplicate_stage,
+          ["do_near_duplicates", "near_duplicate_columns", "near_duplicate_merge", "do_standardize_cols"],
+          "do_near_duplicates"),
+    Stage("anomalies", "Detect anomalies", _anomaly_stage,
+          ["do_anomaly_detection", "anomaly_method", "anomaly_group_by", "do_standardize_cols"],
+          "do_anomaly_detection"),
+]
+
+
+STAGE_METRICS = ["rows", "seconds", "rows_per_sec", "peak_mb", "cells_changed", "workers", "speedup"]
+
+
+def stage_key(stages, options):
+    """Canonical text of the options that the output of the last of stages depends on."""
+    return json.dumps([[stage.name, stage.params(options)] for stage in stages], sort_keys=True)
+
+
+def duplicate_keys(options):
+    """The key columns duplicates are counted on after cleaning (renamed like the columns), or None for whole rows."""
+    keys = options["duplicate_keys"]
+    if keys and options["do_standardize_cols"]:
+        keys = standardize_column_names(keys)
+    return keys or None
+
+
+def run_stages(df, options, memo=None, memo_key="", fingerprints=None, canonicals=None, workers=1):
+    """
+    Run the pipeline on df as a chain of STAGES.
+
+    memo, if given, is a cache with get(key) and put(key, value, size) (e.g.
+    upload_cache.LRUCache) holding stage outputs under memo_key (which must
+    identify df) plus the options each output depends on. The chain resumes
+    from the last stage whose output is cached, so changing one option only
+    reruns the stages from the first one that reads it.
+
+    fingerprints, if given, is RowFingerprints.of(df) (e.g. kept with the
+    upload), so the rows don't have to be hashed again. canonicals is the
+    canonical_store.CanonicalDictionary the fuzzy stage uses when the
+    "fuzzy_dictionary" option is on; its revision is part of the stage's key.
+    The text and fuzzy stages clean their columns on up to workers processes
+    (see parallel_engine), with the same result as workers=1.
+
+    Returns (df_cleaned, anomalies, reports, stage_log). reports has the
+    per-column "fill_report", "date_reports" and "text_reports",
+    "near_duplicates" (the near_dup_engine.near_duplicate_table of the groups
+    found, empty when the stage is off), "canonical_updates" (the values the
+    fuzzy stage saw and their canonicals, when it used canonicals; see
+    canonical_store.save_updates) and "duplicates_before" /
+    "duplicates_after": duplicate rows (on the duplicate_keys columns, if any)
+    in df and in df_cleaned. stage_log has one
+    row per stage: its label, status ("cached", "computed" or "off") and, for
+    computed stages, STAGE_METRICS (rows in, seconds, rows per second, peak
+    memory growth in MB and cells changed, see instrument.measure; for the
+    column-parallel stages also the workers used and the speedup, detailed
+    per column in reports["parallel"]). With a
+    memo the frames returned may be shared with the cache, so callers must
+    copy them before modifying them.
+    """
+    options = {**DEFAULT_OPTIONS, **options}
+    options["canonicals"] = canonicals if options["fuzzy_dictionary"] else None
+    options["canonical_revision"] = None if options["canonicals"] is None else canonicals.revision
+    options["workers"] = workers   # not in any stage's key: it doesn't change the output
+    keys = [f"{memo_key}|{stage_key(STAGES[:i + 1], options)}" for i in range(len(STAGES))]
+
+    # Find the furthest stage output already in the cache
+    state, start = None, 0
+    if memo is not None:
+        for i in reversed(range(len(STAGES))):
+            state = memo.get(keys[i])
+            if state is not None:
+                start = i + 1
+                break
+    if fingerprints is None:
+        fingerprints = RowFingerprints.of(df)
+    if state is None:
+        state = {"df": df, "fingerprints": fingerprints, "fill_report": {}, "date_reports": {}, "text_reports": {},
+                 "canonical_updates": {}, "near_duplicates": pd.DataFrame(columns=TABLE_COLUMNS),
+                 "anomalies": pd.DataFrame(columns=RESULT_COLUMNS), "parallel": {}}
+
+    stage_log = []
+    for i, stage in enumerate(STAGES):
+        row = {"stage": stage.label, "status": None, **dict.fromkeys(STAGE_METRICS)}
+        if not stage.enabled(options):
+            row["status"] = "off"
+        elif i < start:
+            row["status"] = "cached"
+        else:
+            row["status"] = "computed"
+            before = state["df"]
+            with measure() as m:
+                state, changed = stage.run(state, options)
+            row.update(rows=len(before), seconds=round(m["seconds"], 4),
+                       rows_per_sec=round(len(before) / m["seconds"]) if m["seconds"] else None,
+                       peak_mb=m["peak_mb"], cells_changed=int(changed))
+            if stage.name in state["parallel"]:
+                parallel = state["parallel"][stage.name]
+                row.update(workers=parallel["workers"], speedup=parallel["speedup"])
+            if memo is not None:
+                # A stage that only renames columns shares its input's data
+                size = 0 if state["df"] is before or stage.name == "columns" else (
+                    frame_bytes(state["df"]) + state["fingerprints"].nbytes)
+                memo.put(keys[i], state, size)
+        stage_log.append(row)
+
+    reports = {"fill_report": state["fill_report"], "date_reports": state["date_reports"],
+               "text_reports": state["text_reports"], "near_duplicates": state["near_duplicates"],
+               "canonical_updates": state["canonical_updates"], "parallel": state["parallel"],
+               "duplicates_before": fingerprints.duplicates(options["duplicate_keys"] or None),
+               "duplicates_after": state["fingerprints"].duplicates(duplicate_keys(options))}
+    return state["df"], state["anomalies"], reports, stage_log
+
+
+def stage_frame(stage_log):
+    """A stage_log (from run_stages or the streaming report) as a table for the Summary and History pages."""
+    frame = pd.DataFrame(stage_log, columns=["stage", "status"] + STAGE_METRICS)
+    frame = frame.astype({"rows": "Int64", "rows_per_sec": "Int64", "cells_changed": "Int64", "workers": "Int64"})
+    return frame.rename(columns={
+        "rows_per_sec": "rows/sec", "peak_mb": "peak MB", "cells_changed": "cells changed"})
+
+
+def frame_bytes(df):
+    """Memory held by df, its index and object values included (what the caches count against their limits)."""
+    return int(df.memory_usage(deep=True, index=True).sum())
+
+
+def clean_frame(df, options, canonicals=None):
+    """
+    Run the whole cleaning pipeline on an in-memory frame, in the app's step order.
+
+    options is a recipe (see DEFAULT_OPTIONS; missing keys take the defaults).
+    Returns (df_cleaned, anomalies, reports) where reports holds the per-column
+    "fill_report", "date_reports" and "text_reports" and the duplicate counts
+    (see run_stages; canonicals too). df itself is not modified.
+    """
+    df_cleaned, anomalies, reports, _ = run_stages(df, options, canonicals=canonicals)
+    return df_cleaned, anomalies, reports
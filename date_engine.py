@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Date standardization engine for Raw to Ready.
+
+Instead of trying every format with strptime on every cell, each column is
+factorized once, a sample of its unique values is used to find the dominant
+format(s), and the uniques are parsed in one vectorized pass per format.
+Only the values left over go through the slow per-value strptime loop.
+"""
+
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+# Same formats (and priority) the app has always accepted.
+# They are mutually exclusive, so the order the vectorized passes run in
+# never changes which format a value ends up parsed with.
+DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%y", "%d/%m/%Y", "%b %d, %Y", "%Y.%m.%d")
+OUTPUT_FORMAT = "%Y-%m-%d"
+SAMPLE_SIZE = 1000
+
+# Report keys that are not formats
+SLOW_PATH = "slow_path"
+UNPARSED = "unparsed"
+
+
+def _parse_one(text, formats):
+    """Slow path: try each format with strptime, return (value, format) or (None, None)."""
+    for fmt in formats:
+        try:
+            return datetime.strptime(text, fmt).strftime(OUTPUT_FORMAT), fmt
+        except ValueError:
+            continue
+    return None, None
+
+
+def infer_formats(texts, formats=DATE_FORMATS, sample_size=SAMPLE_SIZE):
+    """Return the formats that match at least one value of a sample, most common first."""
+    if len(texts) > sample_size:
+        texts = pd.Series(texts).sample(sample_size, random_state=0).tolist()
+    hits = {}
+    for text in texts:
+        _, fmt = _parse_one(text, formats)
+        if fmt is not None:
+            hits[fmt] = hits.get(fmt, 0) + 1
+    return sorted(hits, key=lambda f: (-hits[f], formats.index(f)))
+
+
+def standardize_dates(series, formats=DATE_FORMATS, sample_size=SAMPLE_SIZE, return_report=False, weights=None):
+    """
+    Convert the supported date formats to YYYY-MM-DD, leaving anything else untouched.
+
+    Work is done on the unique values and mapped back through the factorized codes.
+    With return_report=True, also returns {format: rows parsed, "unparsed": rows
+    left as they were, "slow_path": rows that needed the per-value fallback}.
+    weights gives the number of rows each entry of series stands for, when
+    series holds the unique values of a column rather than the column itself.
+    """
+    codes, uniques = pd.factorize(series, use_na_sentinel=False)
+    uniques = pd.Series(uniques, dtype=object)
+    texts = pd.Series([str(u) for u in uniques], dtype=object)
+
+    result = uniques.copy()
+    used_format = pd.Series(None, index=uniques.index, dtype=object)
+    pending = pd.Series(True, index=uniques.index)
+    slow = pd.Series(False, index=uniques.index)
+
+    # Vectorized pass per dominant format
+    for fmt in infer_formats(texts.tolist(), formats, sample_size):
+        todo = texts[pending]
+        if todo.empty:
+            break
+        parsed = pd.to_datetime(todo, format=fmt, errors="coerce")
+        ok = parsed.notna()
+        if ok.any():
+            hit = ok[ok].index
+            result[hit] = parsed[ok].dt.strftime(OUTPUT_FORMAT).astype(object)
+            used_format[hit] = fmt
+            pending[hit] = False
+
+    # Slow path for the leftovers (rare formats, out-of-range years, junk)
+    for i in texts[pending].index:
+        value, fmt = _parse_one(texts[i], formats)
+        if fmt is not None:
+            result[i] = value
+            used_format[i] = fmt
+            slow[i] = True
+
+    # Map back through the codes; rows that did not parse keep their original object
+    parsed_rows = used_format.notna().to_numpy().take(codes)
+    values = series.to_numpy(dtype=object, copy=True)
+    values[parsed_rows] = result.to_numpy(dtype=object).take(codes)[parsed_rows]
+    out = pd.Series(values, index=series.index, name=series.name)
+    if not return_report:
+        return out
+
+    rows_per_unique = pd.Series(np.bincount(codes, weights=weights, minlength=len(uniques)).astype(int))
+    counts = rows_per_unique.groupby(used_format.fillna(UNPARSED)).sum()
+    report = {fmt: int(counts.get(fmt, 0)) for fmt in formats}
+    report[UNPARSED] = int(counts.get(UNPARSED, 0))
+    report[SLOW_PATH] = int(rows_per_unique[slow].sum())
+    return out, report
@@ -0,0 +1,407 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+SQLite persistence for Raw to Ready (users, cleaning history and saved canonical values).
+
+The app used to open a new connection for every query, re-run its CREATE TABLE
+statements on every Streamlit rerun and build the history query with an
+f-string. Here:
+
+- The database is in WAL mode, so readers never block the writer or each
+  other, and every connection waits (busy_timeout) instead of failing with
+  "database is locked".
+- Reads use connections from a small pool; all writes go through one shared
+  writer connection behind a lock, so sessions never contend for the write lock.
+- The schema is migrated once per process, tracked by PRAGMA user_version.
+- Every statement is parameterized (sqlite3 caches the prepared statements).
+- History inserts are queued and written off the request path by a background
+  thread, many rows per transaction.
+- The history page reads one page at a time with keyset pagination (no
+  OFFSET scans), and its totals come from SQL aggregates. cleaning_options is
+  stored as JSON, so history can be filtered by option with json_extract.
+- Profile reports of profiled runs (see instrument.capture_profile) are stored with
+  the run but only read when downloaded.
+- Canonical values for fuzzy standardization (see canonical_store) are kept
+  per user or shared, clustered by scope and column semantic for lookups.
+"""
+
+import ast
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+DB_PATH = os.environ.get("RAWTOREADY_DB", "users.db")
+BUSY_TIMEOUT_MS = 30_000
+POOL_SIZE = 8
+HISTORY_BATCH = 200
+HISTORY_FLUSH_SECONDS = 0.2
+PAGE_SIZE = 25
+
+log = logging.getLogger(__name__)
+_FLUSH = object()   # queued by flush(): write what has been gathered without waiting for more
+
+
+def _options_to_json(conn):
+    """cleaning_options used to be saved as str(dict); rewrite those rows as JSON."""
+    rows = conn.execute("SELECT id, cleaning_options FROM cleaning_history "
+                        "WHERE cleaning_options IS NOT NULL AND json_valid(cleaning_options) = 0").fetchall()
+    updates = []
+    for record_id, text in rows:
+        try:
+            options = ast.literal_eval(text)
+        except (ValueError, SyntaxError):
+            options = {"unparsed": text}
+        updates.append((json.dumps(options, sort_keys=True), record_id))
+    conn.executemany("UPDATE cleaning_history SET cleaning_options = ? WHERE id = ?", updates)
+
+
+# Schema versions: MIGRATIONS[i] (SQL, or a function of the connection) takes
+# the database from user_version i to i + 1
+MIGRATIONS = [
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE,
+        email TEXT UNIQUE,
+        password_hash TEXT
+    );
+    CREATE TABLE IF NOT EXISTS cleaning_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_email TEXT,
+        filename TEXT,
+        rows_before INTEGER,
+        rows_after INTEGER,
+        nulls_before INTEGER,
+        nulls_after INTEGER,
+        duplicates_before INTEGER,
+        duplicates_after INTEGER,
+        anomalies_detected INTEGER,
+        cleaning_options TEXT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+    """,
+    # The history page lists one user's runs, newest first
+    """
+    CREATE INDEX IF NOT EXISTS idx_history_user_time ON cleaning_history (user_email, timestamp DESC, id DESC);
+    """,
+    _options_to_json,
+    # Per-stage timings of each run (JSON list, see cleaning.run_stages)
+    """
+    ALTER TABLE cleaning_history ADD COLUMN stage_metrics TEXT;
+    """,
+    # Text report of a profiled run (see instrument.profile_report)
+    """
+    ALTER TABLE cleaning_history ADD COLUMN profile_report TEXT;
+    """,
+    # Canonical values learned by fuzzy standardization (see canonical_store); scope is a user's email or "*"
+    """
+    CREATE TABLE IF NOT EXISTS canonical_values (
+        scope TEXT NOT NULL,
+        semantic TEXT NOT NULL,
+        value TEXT NOT NULL,
+        canonical TEXT NOT NULL,
+        row_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (scope, semantic, value)
+    ) WITHOUT ROWID;
+    """,
+]
+
+def _statements(script):
+    """The statements of a migration script, run one by one so they share the caller's transaction."""
+    # executescript() would commit first; the scripts above have no ";" inside literals
+    return [statement.strip() for statement in script.split(";") if statement.strip()]
+
+
+HISTORY_FIELDS = ["user_email", "filename", "rows_before", "rows_after", "nulls_before", "nulls_after",
+                  "duplicates_before", "duplicates_after", "anomalies_detected", "cleaning_options",
+                  "stage_metrics", "profile_report"]
+
+SQL = {
+    "insert_user": "INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)",
+    "find_user": "SELECT * FROM users WHERE email = ? AND password_hash = ?",
+    "insert_history": f"INSERT INTO cleaning_history ({', '.join(HISTORY_FIELDS)}) "
+                      f"VALUES ({', '.join('?' for _ in HISTORY_FIELDS)})",
+    # {where} is built by _history_where() from fixed clauses; all values are bound
+    "history_page": """
+        SELECT id, filename, rows_before, rows_after, nulls_before, nulls_after,
+               duplicates_before, duplicates_after, anomalies_detected, timestamp, cleaning_options,
+               stage_metrics, profile_report IS NOT NULL AS has_profile
+        FROM cleaning_history
+        WHERE {where}
+        ORDER BY timestamp DESC, id DESC
+        LIMIT ?
+    """,
+    "history_totals": """
+        SELECT COUNT(*) AS runs,
+               COALESCE(SUM(rows_before), 0) AS rows_cleaned,
+               COALESCE(SUM(nulls_before - nulls_after), 0) AS nulls_fixed,
+               COALESCE(SUM(duplicates_before - duplicates_after), 0) AS duplicates_removed,
+               COALESCE(SUM(anomalies_detected), 0) AS anomalies_found
+        FROM cleaning_history
+        WHERE {where}
+    """,
+    "history_weekly": """
+        SELECT date(timestamp, 'weekday 0', '-6 days') AS week, COUNT(*) AS runs
+        FROM cleaning_history
+        WHERE {where}
+        GROUP BY week
+        ORDER BY week
+    """,
+    "profile_report": "SELECT profile_report FROM cleaning_history WHERE id = ? AND user_email = ?",
+    "canonical_count": "SELECT COUNT(*) FROM canonical_values WHERE scope = ?",
+    "canonical_values": """
+        SELECT semantic, value, canonical
+        FROM canonical_values
+        WHERE scope = ?
+        ORDER BY semantic, row_count DESC, value
+    """,
+    # A value keeps the canonical it was first saved with
+    "save_canonical": """
+        INSERT INTO canonical_values (scope, semantic, value, canonical, row_count) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (scope, semantic, value) DO UPDATE SET row_count = MAX(row_count, excluded.row_count)
+    """,
+    "rename_history": "UPDATE cleaning_history SET filename = ? WHERE id = ? AND user_email = ?",
+    "delete_history": "DELETE FROM cleaning_history WHERE id = ? AND user_email = ?",
+}
+
+
+def _history_where(email, filters):
+    """WHERE clause and parameters for one user's runs whose cleaning_options match filters."""
+    clauses, params = ["user_email = ?"], [email]
+    for option, value in (filters or {}).items():
+        clauses.append("json_extract(cleaning_options, ?) = ?")
+        params += [f"$.{option}", value]
+    return " AND ".join(clauses), params
+
+
+class Database:
+    """Connection pool, schema migration and the background history writer for one SQLite file."""
+
+    def __init__(self, path=DB_PATH, pool_size=POOL_SIZE):
+        self.path = path
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self._write_lock = threading.Lock()
+        self._writer = None
+        self._migrated = False
+        self._migrate_lock = threading.Lock()
+        self._history = queue.Queue()
+        self._history_thread = None
+        self._thread_lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False,
+                               isolation_level=None)
+        conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")   # safe with WAL: a crash can lose the last commits, not corrupt
+        return conn
+
+    def migrate(self):
+        """Bring the schema up to date; does the work once per process."""
+        if self._migrated:
+            return
+        with self._migrate_lock:
+            if self._migrated:
+                return
+            with self._write_lock:
+                conn = self._writer_conn()
+                while True:
+                    # Read inside the write transaction: another process (the app, batch_clean) may have
+                    # run the step since we last looked
+                    conn.execute("BEGIN IMMEDIATE")
+                    try:
+                        version = conn.execute("PRAGMA user_version").fetchone()[0]
+                        if version >= len(MIGRATIONS):
+                            conn.execute("COMMIT")
+                            break
+                        step = MIGRATIONS[version]
+                        if callable(step):
+                            step(conn)
+                        else:
+                            for statement in _statements(step):
+                                conn.execute(statement)
+                        conn.execute(f"PRAGMA user_version = {version + 1}")
+                        conn.execute("COMMIT")
+                    except BaseException:
+                        if conn.in_transaction:
+                            conn.execute("ROLLBACK")
+                        raise
+            self._migrated = True
+
+    def _writer_conn(self):
+        if self._writer is None:
+            self._writer = self._connect()
+        return self._writer
+
+    @contextmanager
+    def reading(self):
+        """A pooled connection for reads."""
+        self.migrate()
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            yield conn
+        finally:
+            try:
+                self._pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    @contextmanager
+    def writing(self):
+        """The shared writer connection, inside a transaction."""
+        self.migrate()
+        with self._write_lock:
+            conn = self._writer_conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    # --- users ---
+
+    def register_user(self, username, email, password_hash):
+        """False if the username or email is already taken."""
+        try:
+            with self.writing() as conn:
+                conn.execute(SQL["insert_user"], (username, email, password_hash))
+            return True
+        except sqlite3.IntegrityError:
+            return False
+
+    def find_user(self, email, password_hash):
+        with self.reading() as conn:
+            return conn.execute(SQL["find_user"], (email, password_hash)).fetchone()
+
+    # --- cleaning history ---
+
+    def record_history(self, row):
+        """
+        Queue one run ({field: value} for HISTORY_FIELDS) to be written in the background.
+
+        cleaning_options (a dict) and stage_metrics (a list of per-stage dicts,
+        optional) are stored as JSON; profile_report (text) is optional too.
+        """
+        stage_metrics = row.get("stage_metrics")
+        row = {**row, "cleaning_options": json.dumps(row["cleaning_options"], sort_keys=True),
+               "stage_metrics": None if stage_metrics is None else json.dumps(stage_metrics),
+               "profile_report": row.get("profile_report")}
+        self._history.put(tuple(row[field] for field in HISTORY_FIELDS))
+        self._start_history_thread()
+
+    def flush(self):
+        """Block until every queued history row is written."""
+        if self._history_thread is not None:
+            self._history.put(_FLUSH)
+            self._history.join()
+
+    def history_page(self, email, filters=None, after=None, limit=PAGE_SIZE):
+        """
+        One page of a user's runs, newest first, and the cursor of the next page (None on the last page).
+
+        filters is {option: value} matched against cleaning_options; after is
+        the cursor returned with the previous page.
+        """
+        self.flush()   # read your own writes
+        where, params = _history_where(email, filters)
+        if after is not None:
+            where += " AND (timestamp, id) < (?, ?)"
+            params += list(after)
+        with self.reading() as conn:
+            page = pd.read_sql_query(SQL["history_page"].format(where=where), conn, params=params + [limit + 1])
+        if len(page) <= limit:
+            return page, None
+        page = page.iloc[:limit]
+        return page, (page["timestamp"].iloc[-1], int(page["id"].iloc[-1]))
+
+    def history_summary(self, email, filters=None):
+        """({runs, rows_cleaned, nulls_fixed, duplicates_removed, anomalies_found}, runs per week frame)."""
+        self.flush()
+        where, params = _history_where(email, filters)
+        with self.reading() as conn:
+            cursor = conn.execute(SQL["history_totals"].format(where=where), params)
+            totals = dict(zip([d[0] for d in cursor.description], cursor.fetchone()))
+            weekly = pd.read_sql_query(SQL["history_weekly"].format(where=where), conn, params=params)
+        return totals, weekly
+
+    def profile_report(self, record_id, email):
+        """The profile report saved with one of the user's runs, or None."""
+        self.flush()
+        with self.reading() as conn:
+            found = conn.execute(SQL["profile_report"], (record_id, email)).fetchone()
+        return found[0] if found else None
+
+    def rename_history(self, record_id, email, filename):
+        with self.writing() as conn:
+            conn.execute(SQL["rename_history"], (filename, record_id, email))
+
+    def delete_history(self, record_id, email):
+        with self.writing() as conn:
+            conn.execute(SQL["delete_history"], (record_id, email))
+
+    # --- canonical values ---
+
+    def canonical_count(self, scope):
+        with self.reading() as conn:
+            return conn.execute(SQL["canonical_count"], (scope,)).fetchone()[0]
+
+    def canonical_values(self, scope):
+        """[(semantic, value, canonical)] saved under scope, most used first within each semantic."""
+        with self.reading() as conn:
+            return conn.execute(SQL["canonical_values"], (scope,)).fetchall()
+
+    def save_canonical_values(self, scope, rows):
+        """Save [(semantic, value, canonical, row count)] under scope; returns how many values were new."""
+        with self.writing() as conn:
+            before = conn.execute(SQL["canonical_count"], (scope,)).fetchone()[0]
+            conn.executemany(SQL["save_canonical"], [(scope, *row) for row in rows])
+            return conn.execute(SQL["canonical_count"], (scope,)).fetchone()[0] - before
+
+    def _start_history_thread(self):
+        with self._thread_lock:
+            if self._history_thread is None or not self._history_thread.is_alive():
+                self._history_thread = threading.Thread(target=self._write_history, name="history-writer",
+                                                        daemon=True)
+                self._history_thread.start()
+
+    def _write_history(self):
+        """Writer loop: wait for a row, gather whatever else arrives shortly after, insert them in one go."""
+        while True:
+            items = [self._history.get()]
+            deadline = time.monotonic() + HISTORY_FLUSH_SECONDS
+            while len(items) < HISTORY_BATCH and items[-1] is not _FLUSH:
+                try:
+                    items.append(self._history.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            rows = [item for item in items if item is not _FLUSH]
+            try:
+                if rows:
+                    with self.writing() as conn:
+                        conn.executemany(SQL["insert_history"], rows)
+            except sqlite3.Error:
+                log.exception("failed to save %d cleaning history rows", len(rows))
+            finally:
+                for _ in items:
+                    self._history.task_done()
+
+
+_db = Database()
+
+
+def get_db():
+    """The process-wide Database for DB_PATH."""
+    return _db
@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Upload and download formats for Raw to Ready.
+
+Uploads can be CSV (plain, .gz or .zst), Parquet or Feather. Downloads can be
+any of EXPORT_FORMATS and are written to a file chunk by chunk, so exporting
+never holds more than one chunk's worth of CSV text (or Arrow table) on top of
+the frame itself. The old download built the whole CSV string and then a
+second full bytes copy of it.
+
+Parquet, Feather and zstd need PyArrow, which is optional. Arrow-backed columns
+(see upload_cache) go into Parquet and Feather without a copy.
+"""
+
+import gzip
+import importlib.util
+import os
+
+import pandas as pd
+
+ARROW_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+EXPORT_CHUNK_ROWS = 100_000
+
+# Format id (also the file extension) -> (label, MIME type)
+EXPORT_FORMATS = {
+    "csv": ("CSV", "text/csv"),
+    "csv.gz": ("CSV (gzip)", "application/gzip"),
+    "csv.zst": ("CSV (zstd)", "application/zstd"),
+    "parquet": ("Parquet", "application/vnd.apache.parquet"),
+    "feather": ("Feather", "application/vnd.apache.arrow.file"),
+}
+ARROW_FORMATS = {"csv.zst", "parquet", "feather"}
+CSV_FORMATS = {"csv", "csv.gz", "csv.zst"}
+
+_COMPRESSION = {".gz": "gzip", ".zst": "zstd"}
+_COLUMNAR = {".parquet": "parquet", ".feather": "feather"}
+
+
+def export_formats():
+    """The download formats this installation can write."""
+    return [fmt for fmt in EXPORT_FORMATS if ARROW_AVAILABLE or fmt not in ARROW_FORMATS]
+
+
+def upload_types():
+    """File extensions the uploader accepts."""
+    return ["csv", "gz", "zst", "parquet", "feather"] if ARROW_AVAILABLE else ["csv", "gz"]
+
+
+def _name(source):
+    return source if isinstance(source, (str, os.PathLike)) else getattr(source, "name", "")
+
+
+def upload_kind(source):
+    """"csv", "parquet" or "feather", from the file name."""
+    ext = os.path.splitext(str(_name(source)).lower())[1]
+    return _COLUMNAR.get(ext, "csv")
+
+
+def file_stem(source):
+    """File name without its directory, extension and compression suffix ("a/b.csv.gz" -> "b")."""
+    stem = os.path.basename(str(_name(source)))
+    for _ in range(2):
+        base, ext = os.path.splitext(stem)
+        if ext.lower() not in _COMPRESSION and ext.lower() not in _COLUMNAR and ext.lower() != ".csv":
+            break
+        stem = base
+    return stem
+
+
+class _KeepOpen:
+    """Proxy for a file object that ignores close(): pandas closes the stream it read, which would close the upload."""
+
+    def __init__(self, f):
+        self._f = f
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+    def close(self):
+        pass
+
+
+def open_csv(source):
+    """
+    (source, read_csv kwargs) for a plain, gzip or zstd CSV path or file object.
+
+    File objects are rewound first. pandas can only read zstd with the zstandard
+    package, so when PyArrow is there it decompresses the stream instead.
+    """
+    if hasattr(source, "seek"):
+        source.seek(0)
+    compression = _COMPRESSION.get(os.path.splitext(str(_name(source)).lower())[1])
+    if compression == "zstd" and ARROW_AVAILABLE:
+        import pyarrow as pa
+        raw = pa.OSFile(os.fspath(source)) if isinstance(source, (str, os.PathLike)) else pa.PythonFile(_KeepOpen(source), mode="r")
+        return pa.CompressedInputStream(raw, "zstd"), {}
+    return source, ({"compression": compression} if compression else {})
+
+
+def read_upload(source, arrow=False, **kwargs):
+    """
+    Parse an uploaded file of any supported format.
+
+    With arrow=True, CSVs are parsed by PyArrow's multithreaded reader and every
+    format comes back with Arrow-backed dtypes.
+    """
+    kind = upload_kind(source)
+    backend = {"dtype_backend": "pyarrow"} if arrow else {}
+    if kind != "csv":
+        if hasattr(source, "seek"):
+            source.seek(0)
+        frame = pd.read_parquet(source, **backend) if kind == "parquet" else pd.read_feather(source, **backend)
+        return frame.head(kwargs["nrows"]) if "nrows" in kwargs else frame
+    source, csv_kwargs = open_csv(source)
+    if arrow and "nrows" not in kwargs:   # the pyarrow engine can't stop early
+        return pd.read_csv(source, engine="pyarrow", **backend, **csv_kwargs, **kwargs)
+    return pd.read_csv(source, **csv_kwargs, **kwargs)
+
+
+def arrow_schema(df):
+    """Arrow schema df is exported with: object columns become strings, the rest map from their dtype."""
+    import pyarrow as pa
+    empty = df.iloc[:0].astype({col: "string" for col, dtype in df.dtypes.items() if dtype == object})
+    return pa.Schema.from_pandas(empty, preserve_index=False).remove_metadata()
+
+
+def _to_arrow(chunk, schema):
+    """Arrow table of chunk; object columns that are not all text (e.g. numbers and "N/A") are stringified."""
+    import pyarrow as pa
+    text = {}
+    for col, dtype in chunk.dtypes.items():
+        if dtype == object and pd.api.types.infer_dtype(chunk[col], skipna=True) not in ("string", "empty"):
+            values = chunk[col]
+            text[col] = values.where(values.isna(), values.astype(str))
+    if text:
+        chunk = chunk.assign(**text)
+    return pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+
+
+def _open_binary(fmt, dest):
+    if fmt == "csv.gz":
+        return gzip.open(dest, "wb", compresslevel=6)
+    if fmt == "csv.zst":
+        import pyarrow as pa
+        return pa.CompressedOutputStream(dest, "zstd")
+    return open(dest, "wb")
+
+
+class ChunkWriter:
+    """
+    Writes chunks of a frame to the file at dest in format fmt.
+
+    Use it as a context manager. Parquet and Feather need the Arrow schema of
+    the whole output up front (see arrow_schema) so every chunk is written with
+    the same column types.
+    """
+
+    def __init__(self, fmt, dest, schema=None):
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"unknown export format: {fmt}")
+        if fmt in ARROW_FORMATS and not ARROW_AVAILABLE:
+            raise ImportError(f"{EXPORT_FORMATS[fmt][0]} export needs pyarrow")
+        self.fmt = fmt
+        self.dest = dest
+        self.schema = schema
+        self._out = None
+        self._first = True
+
+    def __enter__(self):
+        if self.fmt in CSV_FORMATS:
+            self._out = _open_binary(self.fmt, self.dest)
+        elif self.fmt == "parquet":
+            import pyarrow.parquet as pq
+            self._out = pq.ParquetWriter(self.dest, self.schema)
+        else:
+            import pyarrow as pa
+            self._out = pa.ipc.new_file(self.dest, self.schema, options=pa.ipc.IpcWriteOptions(compression="lz4"))
+        return self
+
+    def write(self, chunk):
+        if self.fmt in CSV_FORMATS:
+            self._out.write(chunk.to_csv(index=False, header=self._first).encode("utf-8"))
+        else:
+            self._out.write_table(_to_arrow(chunk, self.schema))
+        self._first = False
+
+    def __exit__(self, *exc):
+        self._out.close()
+
+
+def write_frame(df, fmt, dest, chunksize=EXPORT_CHUNK_ROWS):
+    """Write df to the file at dest in format fmt, chunksize rows at a time."""
+    schema = None if fmt in CSV_FORMATS else arrow_schema(df)
+    with ChunkWriter(fmt, dest, schema) as writer:
+        # range(0, 1) for an empty frame: a CSV still gets its header
+        for start in range(0, max(len(df), 1), chunksize):
+            writer.write(df.iloc[start:start + chunksize])
+
+
+def compress_file(src, fmt, dest, block_size=1 << 20):
+    """Copy the CSV file at src to dest as a plain, gzip or zstd CSV, one block at a time."""
+    with open(src, "rb") as f, _open_binary(fmt, dest) as out:
+        for block in iter(lambda: f.read(block_size), b""):
+            out.write(block)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Row fingerprints for duplicate detection in Raw to Ready.
+
+df.duplicated() and drop_duplicates() hash and compare every full row each
+time they run, and a cleaning run used to call them three times (before
+cleaning, to remove duplicates, and again for the summary). Here each column is
+hashed once into a 64-bit value per cell; a row's fingerprint combines the
+hashes of its columns (all of them, or the chosen key columns). The index
+follows the frame through the pipeline: a step that drops rows takes the same
+rows of the index, and a step that changes a few columns re-hashes only those.
+
+Two different rows share a fingerprint with probability about 2**-64 per pair
+(one expected collision among ~4 billion distinct rows), in which case the
+later one would be counted as a duplicate.
+"""
+
+import numpy as np
+import pandas as pd
+
+_MULTIPLIER = np.uint64(0x100000001B3)   # FNV-1a prime
+_SEED = np.uint64(0xCBF29CE484222325)
+
+
+def hash_column(series):
+    """64-bit hash of each value of series (equal values, nulls included, hash alike)."""
+    if series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) not in ("string", "empty"):
+        # Object values are hashed as text, so 1 and "1" would hash alike: number the distinct
+        # values the way duplicated() compares them and hash the numbers instead
+        codes, _ = pd.factorize(series, use_na_sentinel=False)
+        return pd.util.hash_array(codes)
+    return pd.util.hash_pandas_object(series, index=False).to_numpy()
+
+
+class RowFingerprints:
+    """Per-column cell hashes of a frame, aligned with its rows. Instances are never modified."""
+
+    def __init__(self, hashes):
+        self.hashes = hashes   # {column: uint64 array}, in the frame's column order
+
+    @classmethod
+    def of(cls, df):
+        return cls({col: hash_column(df[col]) for col in df.columns})
+
+    def __len__(self):
+        return len(next(iter(self.hashes.values()))) if self.hashes else 0
+
+    @property
+    def nbytes(self):
+        return sum(h.nbytes for h in self.hashes.values())
+
+    def take(self, rows):
+        """Index of the rows selected by rows (a boolean mask or positions)."""
+        return RowFingerprints({col: h[rows] for col, h in self.hashes.items()})
+
+    def rehash(self, df, columns):
+        """Index of df, which has the same rows as this one and differs from it only in columns."""
+        return RowFingerprints({col: hash_column(df[col]) if col in columns else self.hashes[col]
+                                for col in df.columns})
+
+    def rename(self, columns):
+        """Index with its columns renamed to columns (a list, in order)."""
+        return RowFingerprints(dict(zip(columns, self.hashes.values())))
+
+    def rows(self, columns=None):
+        """One fingerprint per row, of columns (default: all columns)."""
+        out = np.full(len(self), _SEED, dtype=np.uint64)
+        for col in columns or self.hashes:
+            out ^= self.hashes[col]
+            out *= _MULTIPLIER   # wraps around: multiplication mod 2**64
+        return out
+
+    def duplicated(self, columns=None):
+        """Like df.duplicated(subset=columns): True for each row that repeats an earlier one."""
+        return pd.Series(self.rows(columns)).duplicated().to_numpy()
+
+    def duplicates(self, columns=None):
+        return int(self.duplicated(columns).sum())
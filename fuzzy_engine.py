@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Fuzzy standardization engine for Raw to Ready.
+
+The old fuzzy_standardize compared every unique value against every value seen
+before it with difflib, which is O(U^2) SequenceMatcher calls per column. Here the
+values are indexed by their padded character trigrams and only the values that
+share enough trigrams to possibly reach the cutoff are scored with difflib.
+
+Two strings a, b with SequenceMatcher ratio >= cutoff have a longest common
+subsequence of at least cutoff * (|a| + |b|) / 2 characters, so they are at most
+d = |a| + |b| - 2 * LCS insertions/deletions apart. Each edit destroys at most
+NGRAM trigrams, which gives a minimum trigram overlap for every possible pair.
+Only the rarest trigrams of each value (its "prefix") need to be indexed and
+probed to find every pair that can meet that overlap, so no match is lost.
+Postings are split by length bucket so values that are too short or too long
+to reach the cutoff are never counted.
+
+Canonical values saved from earlier runs (see canonical_store) are passed in as
+a CanonicalIndex: values found in it are resolved by lookup, and the rest are
+matched against its trigram index as well as against the run's own values.
+"""
+
+import math
+import difflib
+from collections import Counter, OrderedDict, defaultdict
+
+import pandas as pd
+
+CUTOFF = 0.85
+NGRAM = 3
+MIN_HITS = 3
+LENGTH_BUCKET = 4
+_PAD_LEFT = "\x02" * (NGRAM - 1)
+_PAD_RIGHT = "\x03" * (NGRAM - 1)
+SHARED_INDEXES = 16
+
+
+def _grams(text):
+    """Padded character n-grams of text, numbered so repeated grams stay distinct."""
+    padded = _PAD_LEFT + text + _PAD_RIGHT
+    seen = Counter()
+    grams = []
+    for i in range(len(padded) - NGRAM + 1):
+        g = padded[i:i + NGRAM]
+        grams.append(g + str(seen[g]) if g in seen else g)
+        seen[g] += 1
+    return grams
+
+
+def _pair_overlap(length, other, cutoff):
+    """Fewest shared grams two strings of these lengths can have and still reach cutoff (None if they can't)."""
+    total = length + other
+    lcs = math.ceil(cutoff * total / 2 - 1e-9)
+    if lcs > min(length, other):
+        return None
+    edits = total - 2 * lcs
+    return max(length, other) + NGRAM - 1 - NGRAM * edits
+
+
+def _length_range(length, cutoff):
+    """Lengths a string can have and still reach cutoff against a string of this length."""
+    return range(math.ceil(length * cutoff / (2 - cutoff)), math.floor(length * (2 - cutoff) / cutoff) + 1)
+
+
+def _min_overlap(length, cutoff):
+    """Fewest shared grams between a string of this length and any string it can match."""
+    overlaps = [_pair_overlap(length, other, cutoff) for other in _length_range(length, cutoff)]
+    overlaps = [o for o in overlaps if o is not None]
+    return min(overlaps) if overlaps else 1
+
+
+class FuzzyIndex:
+    """
+    Incremental trigram index of values already assigned to a canonical value.
+
+    Values are added in a fixed order; each new value is matched against the
+    values already in the index and takes the canonical of its best match.
+    """
+
+    def __init__(self, gram_order, cutoff=CUTOFF):
+        self.cutoff = cutoff
+        self.gram_order = gram_order          # gram -> rank, rarest first
+        self.values = []
+        self.gram_sets = []
+        self.canonical = []
+        self.min_hits = []
+        self.postings = defaultdict(list)     # (gram, length bucket) -> ids
+        self.unfiltered = []                  # ids the gram filter is not safe for
+        self._overlap_cache = {}
+        self._needed_cache = {}
+        self.candidates = 0
+        self.comparisons = 0
+
+    def _overlap(self, length):
+        if length not in self._overlap_cache:
+            self._overlap_cache[length] = _min_overlap(length, self.cutoff)
+        return self._overlap_cache[length]
+
+    def _needed(self, length):
+        """{other length: shared grams required} for a string of this length."""
+        if length not in self._needed_cache:
+            needed = {}
+            for other in _length_range(length, self.cutoff):
+                overlap = _pair_overlap(length, other, self.cutoff)
+                needed[other] = math.inf if overlap is None else overlap
+            self._needed_cache[length] = needed
+        return self._needed_cache[length]
+
+    def _prefix(self, grams, length):
+        """
+        The rarest grams of a value, and how many of them a matching value must share.
+
+        If two values share at least `overlap` grams, the first k of those shared grams
+        (in the global rarity order) sit in the first len(grams) - overlap + k grams of
+        both values. Returns (None, 0) when the overlap bound is too weak to filter on.
+        """
+        overlap = self._overlap(length)
+        hits = min(MIN_HITS, overlap)
+        if hits < 1:
+            return None, 0
+        ranked = sorted(grams, key=lambda g: (self.gram_order.get(g[:NGRAM], 0), g))
+        return ranked[:len(grams) - overlap + hits], hits
+
+    def best_match(self, value, grams):
+        """Return the id of the closest indexed value with ratio >= cutoff, or None."""
+        return self.match(value, grams)[1]
+
+    def match(self, value, grams):
+        """(score, value) of the closest indexed value with ratio >= cutoff and its id, or (None, None)."""
+        prefix, min_hits = self._prefix(grams, len(value))
+        if prefix is None:
+            candidates = range(len(self.values))
+        else:
+            lengths = _length_range(len(value), self.cutoff)
+            buckets = range(lengths.start // LENGTH_BUCKET, (lengths.stop - 1) // LENGTH_BUCKET + 1)
+            postings = self.postings
+            probed = []
+            for g in prefix:
+                for b in buckets:
+                    ids = postings.get((g, b))
+                    if ids:
+                        probed.extend(ids)
+            other_hits = self.min_hits
+            candidates = [i for i, n in Counter(probed).items() if n >= min(min_hits, other_hits[i])]
+            candidates += self.unfiltered
+        self.candidates += len(candidates)
+
+        gram_set = set(grams)
+        needed = self._needed(len(value))
+        values, gram_sets = self.values, self.gram_sets
+        matcher = difflib.SequenceMatcher()
+        matcher.set_seq2(value)
+        best, best_id = None, None
+        for i in candidates:
+            other = values[i]
+            if prefix is not None and len(gram_set & gram_sets[i]) < needed.get(len(other), math.inf):
+                continue
+            self.comparisons += 1
+            # Same checks, and the same (score, value) tie-break, as difflib.get_close_matches
+            matcher.set_seq1(other)
+            if matcher.real_quick_ratio() >= self.cutoff and \
+               matcher.quick_ratio() >= self.cutoff:
+                score = matcher.ratio()
+                if score >= self.cutoff and (best is None or (score, other) > best):
+                    best, best_id = (score, other), i
+        return best, best_id
+
+    def add(self, value, grams, canonical):
+        i = len(self.values)
+        self.values.append(value)
+        self.gram_sets.append(set(grams))
+        self.canonical.append(canonical)
+        prefix, min_hits = self._prefix(grams, len(value))
+        self.min_hits.append(min_hits)
+        if prefix is None:
+            self.unfiltered.append(i)
+        else:
+            for g in prefix:
+                self.postings[(g, len(value) // LENGTH_BUCKET)].append(i)
+        return i
+
+
+def _gram_order(grams):
+    """gram -> rank, rarest first, over {value: grams}."""
+    doc_freq = Counter(g[:NGRAM] for value_grams in grams.values() for g in set(value_grams))
+    return {g: rank for rank, (g, _) in enumerate(sorted(doc_freq.items(), key=lambda kv: (kv[1], kv[0])))}
+
+
+class CanonicalIndex:
+    """
+    Saved values and their canonicals ({value: canonical}), with a FuzzyIndex of them.
+
+    Built once and shared by many build_mapping calls (with the same cutoff);
+    it is not modified by them. token, if given, identifies the contents: a
+    copy sent to a worker process is built there once per token.
+    """
+
+    def __init__(self, canonicals, cutoff=CUTOFF, token=None):
+        self.canonicals = canonicals
+        self.token = token
+        grams = {value: _grams(value) for value in canonicals}
+        self.index = FuzzyIndex(_gram_order(grams), cutoff=cutoff)
+        for value, canonical in canonicals.items():
+            self.index.add(value, grams[value], canonical)
+
+    def __len__(self):
+        return len(self.canonicals)
+
+    def __reduce__(self):
+        # Pickled as its values, not its index
+        return _shared_index, (self.canonicals, self.index.cutoff, self.token)
+
+
+_shared_indexes = OrderedDict()   # token -> CanonicalIndex unpickled in this process
+
+
+def _shared_index(canonicals, cutoff, token):
+    if token is None:
+        return CanonicalIndex(canonicals, cutoff, token)
+    if token not in _shared_indexes:
+        _shared_indexes[token] = CanonicalIndex(canonicals, cutoff, token)
+        if len(_shared_indexes) > SHARED_INDEXES:
+            _shared_indexes.popitem(last=False)
+    _shared_indexes.move_to_end(token)
+    return _shared_indexes[token]
+
+
+def build_mapping(counts, cutoff=CUTOFF, return_stats=False, known=None):
+    """
+    Map each value in counts (value -> number of rows) to its canonical value.
+
+    Values are visited most frequent first, ties broken alphabetically, so the
+    result does not depend on the order the values appear in the data and the
+    most common spelling of a cluster becomes its canonical value. known, if
+    given, is a CanonicalIndex of saved values: they keep their saved
+    canonical, and they are matched ahead of the values of counts.
+    """
+    ordered = sorted(counts.items(), key=lambda kv: (-kv[1], kv[0]))
+    mapping = {}
+    if known is not None:
+        mapping = {value: known.canonicals[value] for value, _ in ordered if value in known.canonicals}
+        ordered = [(value, n) for value, n in ordered if value not in mapping]
+    grams = {value: _grams(value) for value, _ in ordered}
+
+    index = FuzzyIndex(_gram_order(grams), cutoff=cutoff)
+    saved_matches = 0
+    for value, _ in ordered:
+        best, match = index.match(value, grams[value])
+        canonical = value if match is None else index.canonical[match]
+        if known is not None:
+            saved, saved_match = known.index.match(value, grams[value])
+            if saved is not None and (best is None or saved > best):
+                canonical = known.index.canonical[saved_match]
+                saved_matches += 1
+        index.add(value, grams[value], canonical)
+        mapping[value] = canonical
+
+    if return_stats:
+        stats = {"uniques": len(counts), "candidates": index.candidates, "comparisons": index.comparisons}
+        if known is not None:
+            stats.update(known=len(counts) - len(ordered), saved_matches=saved_matches)
+        return mapping, stats
+    return mapping
+
+
+def fuzzy_standardize(series, cutoff=CUTOFF, weights=None, known=None, return_mapping=False):
+    """
+    Group similar text values together, replacing each with its cluster's canonical value.
+
+    weights gives the number of rows each entry of series stands for, when
+    series holds the unique values of a column rather than the column itself.
+    known is a CanonicalIndex of saved values (see build_mapping). With
+    return_mapping=True also returns {value: (canonical, rows)} of every value.
+    """
+    series = series.astype(str).str.strip()
+    if weights is None:
+        counts = series.value_counts(dropna=True)
+    else:
+        counts = pd.Series(weights, index=series.index).groupby(series.to_numpy()).sum()
+    mapping = build_mapping(dict(zip(counts.index, counts.to_numpy())), cutoff=cutoff, known=known)
+    if return_mapping:
+        return series.map(mapping), {value: (mapping[value], int(n)) for value, n in counts.items()}
+    return series.map(mapping)
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Lightweight timing and memory measurement for Raw to Ready's cleaning stages.
+
+measure() is cheap enough to wrap every stage of every run: a perf_counter
+pair, plus a background thread that samples the process's resident memory
+(RSS) while the stage runs to find its peak. RSS is read from /proc, so the
+memory figure is only there on Linux; elsewhere it is None. Sampling can miss
+a spike shorter than the interval, so the peak is a close lower bound.
+
+capture_profile() is the heavy, opt-in counterpart for investigating one slow run:
+cProfile plus tracemalloc around the block, written up by profile_report() as
+a plain-text report (per-stage breakdown, top functions, top allocation
+sites). It slows the run down several times, so the app only uses it when
+RAWTOREADY_PROFILE is set or an admin (RAWTOREADY_ADMINS) asks for it.
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+SAMPLE_SECONDS = 0.005
+PROFILE_TOP = 30
+
+# "1" profiles every cleaning run; admins can also turn it on per run in the app
+PROFILE_ALL = os.environ.get("RAWTOREADY_PROFILE", "") not in ("", "0")
+ADMINS = {email.strip().lower() for email in os.environ.get("RAWTOREADY_ADMINS", "").split(",") if email.strip()}
+
+try:
+    _PAGE_BYTES = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):   # no sysconf (Windows)
+    _PAGE_BYTES = None
+
+
+def rss_bytes():
+    """Resident memory of this process, or None where it can't be read cheaply."""
+    if _PAGE_BYTES is None:
+        return None
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_BYTES
+    except OSError:
+        return None
+
+
+class _PeakSampler(threading.Thread):
+    def __init__(self, start_rss):
+        super().__init__(name="rss-sampler", daemon=True)
+        self.peak = start_rss
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(SAMPLE_SECONDS):
+            rss = rss_bytes()
+            if rss is not None:   # a failed read is skipped, not the end of sampling
+                self.peak = max(self.peak, rss)
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+@contextmanager
+def measure():
+    """
+    Time the block and track its peak memory.
+
+    Yields a dict that is filled in when the block exits: seconds, and peak_mb,
+    the highest RSS seen during the block minus the RSS at its start (None off
+    Linux).
+    """
+    result = {}
+    start_rss = rss_bytes()
+    sampler = None
+    if start_rss is not None:
+        sampler = _PeakSampler(start_rss)
+        sampler.start()
+    start = time.perf_counter()
+    try:
+        yield result
+    finally:
+        result["seconds"] = time.perf_counter() - start
+        result["peak_mb"] = None
+        if sampler is not None:
+            sampler.stop()
+            peak = max(sampler.peak, rss_bytes() or 0)
+            result["peak_mb"] = round((peak - start_rss) / 1024 ** 2, 1)
+
+
+def is_admin(email):
+    return bool(email) and email.lower() in ADMINS
+
+
+@contextmanager
+def capture_profile(top=PROFILE_TOP):
+    """
+    Profile the block's CPU time (cProfile) and allocations (tracemalloc).
+
+    Yields a dict filled in when the block exits: seconds, peak_mb (peak
+    traced Python memory; None when another tracemalloc trace was already
+    running, since its peak is left alone), functions (pstats text of the top functions by
+    cumulative time) and allocations (the top allocation sites still holding
+    memory at the end, as text). Only the calling thread is profiled.
+    """
+    result = {}
+    profiler = cProfile.Profile()
+    tracing = tracemalloc.is_tracing()   # someone else's trace: leave it running, peak included
+    if not tracing:
+        tracemalloc.start()
+    try:
+        profiler.enable()
+    except ValueError:   # another profiler is already active in this thread
+        profiler = None
+    start = time.perf_counter()
+    try:
+        yield result
+    finally:
+        result["seconds"] = time.perf_counter() - start
+        if profiler is not None:
+            profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        result["peak_mb"] = None
+        if not tracing:
+            result["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 ** 2, 1)
+            tracemalloc.stop()
+
+        if profiler is None:
+            result["functions"] = "(not available: another profiler was active)"
+        else:
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).strip_dirs().sort_stats("cumulative").print_stats(top)
+            result["functions"] = out.getvalue().strip()
+        stats = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)]).statistics("lineno")
+        result["allocations"] = "\n".join(str(stat) for stat in stats[:top])
+
+
+def profile_report(result, stage_log, title=""):
+    """The text report of one profiled run: result from capture_profile(), stage_log from the pipeline."""
+    peak = "not measured" if result["peak_mb"] is None else f"{result['peak_mb']} MB"
+    lines = [f"Raw to Ready profile report{': ' + title if title else ''}",
+             f"Total: {result['seconds']:.3f} s, peak traced memory {peak}",
+             "(times are inflated by the profiler; compare stages with each other)", "",
+             "== Stages ==",
+             f"{'stage':<34} {'status':<9} {'rows':>10} {'seconds':>9} {'peak MB':>8} {'cells changed':>14}"]
+    for row in stage_log:
+        cells = [row.get(key) for key in ("rows", "seconds", "peak_mb", "cells_changed")]
+        rows, seconds, peak, changed = ("" if value is None else value for value in cells)
+        lines.append(f"{row['stage']:<34} {row['status']:<9} {rows:>10} {seconds:>9} {peak:>8} {changed:>14}")
+    lines += ["", "== Top functions (cumulative time) ==", result["functions"],
+              "", "== Top allocation sites (memory held at the end) ==", result["allocations"] or "(none)"]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Missing-value engine for Raw to Ready.
+
+The old fill_missing looped over every column, re-counted its nulls, called
+dropna on the whole frame from inside that loop for "Drop Rows", and filled
+with chained fillna(..., inplace=True), which copies and no longer works under
+copy-on-write. Here the null mask is computed once for the whole frame, the
+statistics for every column that needs one are computed in one batched call
+(mean/median over the numeric block, factorized counts for modes), and all
+fills are applied with a single where() over the frame.
+"""
+
+import numbers
+
+import numpy as np
+import pandas as pd
+
+FILL_VALUE = "N/A"
+
+
+def column_modes(df, columns):
+    """
+    Most common value of each column, smallest value on ties (like Series.mode()[0]).
+
+    Counts with factorize + bincount instead of mode(), which builds and sorts a
+    Series of every tied value. Columns with no values are left out.
+    """
+    modes = {}
+    for col in columns:
+        codes, uniques = df[col].factorize()
+        uniques = uniques.to_numpy()
+        counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+        if not len(counts):
+            continue
+        top = uniques[counts == counts.max()]
+        try:
+            modes[col] = top.min() if len(top) > 1 else top[0]
+        except TypeError:   # mixed types that can't be ordered: mode() keeps them unsorted too
+            modes[col] = top[0]
+    return modes
+
+
+def _arrow_holds(dtype, value):
+    """Whether an Arrow-backed column of dtype can take value without changing type."""
+    if pd.api.types.is_string_dtype(dtype):
+        return isinstance(value, str)
+    if pd.api.types.is_bool_dtype(dtype):
+        return isinstance(value, (bool, np.bool_))
+    if pd.api.types.is_integer_dtype(dtype):
+        return isinstance(value, numbers.Real) and float(value).is_integer()
+    if pd.api.types.is_float_dtype(dtype):
+        return isinstance(value, numbers.Real) and not isinstance(value, (bool, np.bool_))
+    return False
+
+
+def _arrow_upcast(df, cols, values):
+    """
+    df with its Arrow-backed columns among cols widened so they can take their fill value.
+
+    where() upcasts NumPy columns by itself (e.g. to object for "N/A"), but Arrow
+    arrays reject values of another type, so the same upcast is done up front:
+    integers to double for a fractional mean or median, anything else to object.
+    """
+    casts = {}
+    for col in cols:
+        dtype = df.dtypes[col]
+        if not isinstance(dtype, pd.ArrowDtype):
+            continue
+        value = values if isinstance(values, str) else values[col]
+        if _arrow_holds(dtype, value):
+            continue
+        widen = pd.api.types.is_integer_dtype(dtype) and isinstance(value, numbers.Real)
+        casts[col] = "double[pyarrow]" if widen else object
+    return df.astype(casts) if casts else df
+
+
+def _where_fill(df, isnull, cols, values):
+    """
+    df with the nulls of cols replaced by values (a scalar, or a Series by column).
+
+    One where() over the whole frame: blocks without a null to fill are passed
+    through untouched, and pandas only upcasts the columns that take a value
+    they can't hold (e.g. "N/A" into a float column).
+    """
+    df = _arrow_upcast(df, cols, values)
+    cond = ~(isnull.to_numpy() & df.columns.isin(cols))
+    if isinstance(values, str):
+        return df.where(cond, values)
+    # Built with an explicit dtype: where(axis=1) would build an object frame and re-infer every column's dtype
+    other = pd.DataFrame(np.broadcast_to(values.reindex(df.columns).to_numpy(), df.shape),
+                         index=df.index, columns=df.columns, dtype=values.dtype, copy=False)
+    return df.where(cond, other)
+
+
+def fill_missing(df, method="Fill with N/A", return_report=False):
+    """
+    Fill (or drop) missing values with method; returns a new frame.
+
+    With return_report=True, also returns {column: nulls fixed} for every
+    column that had nulls (0 where the method doesn't apply, e.g. the mean of
+    a text column).
+    """
+    isnull = df.isnull()
+    null_counts = isnull.sum()
+    null_cols = null_counts.index[null_counts.to_numpy() > 0].tolist()
+    # Arrow booleans count as numeric, but NumPy booleans can't hold nulls: keep them out as before
+    numeric_cols = [col for col, dtype in df.dtypes.items()
+                    if col in null_cols and pd.api.types.is_numeric_dtype(dtype)
+                    and not pd.api.types.is_bool_dtype(dtype)]
+
+    filled_cols = []
+    if not null_cols:
+        out = df.copy()
+    elif method == "Drop Rows":
+        out = df[~isnull.any(axis=1).to_numpy()]
+        filled_cols = null_cols
+    elif method == "Fill with N/A":
+        out = _where_fill(df, isnull, null_cols, FILL_VALUE)
+        filled_cols = null_cols
+    elif method in ("Fill with Mean", "Fill with Median") and numeric_cols:
+        block = df[numeric_cols]
+        values = (block.mean() if method == "Fill with Mean" else block.median()).dropna()
+        out = _where_fill(df, isnull, values.index, values)
+        filled_cols = values.index.tolist()
+    elif method == "Fill by most common":
+        modes = column_modes(df, null_cols)
+        # Numbers go in as floats so numeric columns stay numeric; the rest as objects
+        numeric = pd.Series({col: modes[col] for col in numeric_cols if col in modes}, dtype=float)
+        other = pd.Series({col: val for col, val in modes.items() if col not in numeric.index}, dtype=object)
+        out = df
+        for values in (numeric, other):
+            if len(values):
+                out = _where_fill(out, isnull, values.index, values)
+        out = df.copy() if out is df else out
+        filled_cols = list(modes)
+    else:
+        out = df.copy()
+
+    if return_report:
+        fixed = {col: int(null_counts[col]) if col in filled_cols else 0 for col in null_cols}
+        return out, fixed
+    return out
@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Near-duplicate record detection for Raw to Ready.
+
+"Remove duplicates" only drops rows that are exactly equal. Records that differ
+by a typo, spacing or capitalization in a field or two are found here without
+comparing every pair of rows:
+
+1. Each field value is lowercased, its whitespace collapsed, and cut into
+   character trigrams tagged with the field. A MinHash signature (NUM_PERM
+   minimums of random hash functions over the trigrams) is computed once per
+   distinct value of each field; a row's signature is the elementwise minimum
+   of its fields' signatures, which is the MinHash of the union of their
+   trigrams.
+2. Locality-sensitive hashing: the signature is cut into BANDS bands, and rows
+   whose band is identical land in the same bucket. Two rows whose trigram sets
+   have Jaccard similarity J share a bucket with probability
+   1 - (1 - J**r)**BANDS (r = NUM_PERM / BANDS), which is high for near
+   duplicates and tiny for unrelated rows.
+3. Each bucket's rows are paired with its first row (so a bucket of k rows
+   gives k - 1 candidates, never k**2). Candidates whose signatures agree in
+   fewer than MIN_JACCARD of their positions (the MinHash estimate of their
+   Jaccard similarity) are dropped; the rest are scored field by field with
+   difflib (each distinct pair of values is scored once). A field that is
+   null in either row is left out of the average, so a record missing a
+   value still matches the copy that has it. Pairs whose average field
+   similarity reaches the cutoff are joined into groups.
+
+All steps are linear in the number of rows, apart from a sort per band.
+"""
+
+import difflib
+
+import numpy as np
+import pandas as pd
+
+NUM_PERM = 32
+BANDS = 8
+NGRAM = 3
+CUTOFF = 0.9
+MIN_JACCARD = 0.5
+TABLE_COLUMNS = ["group", "row", "similarity"]   # then the compared columns
+
+_EMPTY = np.uint32(0xFFFFFFFF)   # signature of a null value: neutral for the minimum
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _normalize(values):
+    return pd.Series(values, dtype=object).astype(str).str.lower().str.split().str.join(" ").to_numpy(dtype=object)
+
+
+def _permutations(seed=0):
+    """Odd multipliers and offsets of the NUM_PERM multiply-shift hash functions."""
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 2 ** 63, NUM_PERM, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    b = rng.integers(0, 2 ** 63, NUM_PERM, dtype=np.uint64)
+    return a, b
+
+
+def _mix(h):
+    """splitmix64 finalizer: spreads every input bit over the whole 64-bit hash."""
+    h = (h ^ (h >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    h = (h ^ (h >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return h ^ (h >> np.uint64(31))
+
+
+def gram_hashes(texts, field):
+    """(hashes, owners): 64-bit hash of every character trigram of each padded text, tagged with field."""
+    padded = [f" {text} " for text in texts]
+    lengths = np.fromiter(map(len, padded), dtype=np.int64, count=len(padded))
+    chars = np.frombuffer("".join(padded).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    grams = np.maximum(lengths - NGRAM + 1, 0)
+    owners = np.repeat(np.arange(len(padded)), grams)
+    # Position of each trigram's first character in chars
+    first = np.cumsum(grams) - grams
+    starts = np.cumsum(lengths) - lengths
+    pos = np.arange(len(owners)) - np.repeat(first - starts, grams)
+    h = _mix(np.full(len(pos), field + 1, dtype=np.uint64))
+    for k in range(NGRAM):
+        h = _mix(h ^ chars[pos + k])
+    return h, owners
+
+
+def value_signatures(texts, field, perms):
+    """(len(texts), NUM_PERM) uint32 MinHash signatures of normalized texts, their trigrams tagged with field."""
+    signatures = np.full((len(texts), NUM_PERM), _EMPTY, dtype=np.uint32)
+    hashes, owners = gram_hashes(texts, field)
+    if not len(hashes):
+        return signatures
+    starts = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]])
+    a, b = perms
+    for p in range(NUM_PERM):
+        values = ((hashes * a[p] + b[p]) >> np.uint64(32)).astype(np.uint32)
+        signatures[owners[starts], p] = np.minimum.reduceat(values, starts)
+    return signatures
+
+
+def _candidates(band_signatures):
+    """Candidate (i, j) row pairs, i < j, of rows with identical band signatures: each paired with its bucket's first row."""
+    key = np.zeros(len(band_signatures), dtype=np.uint64)
+    for column in band_signatures.T:
+        key = (key ^ column.astype(np.uint64)) * _MIX
+    order = np.argsort(key, kind="stable")
+    sorted_key = key[order]
+    new_bucket = np.r_[True, sorted_key[1:] != sorted_key[:-1]]
+    first = order[np.maximum.accumulate(np.where(new_bucket, np.arange(len(order)), 0))]
+    members = ~new_bucket
+    return first[members], order[members]
+
+
+def _field_scores(codes, texts, i, j):
+    """difflib ratio of each pair's values in one field (nan where either is null: the field is not compared)."""
+    ci, cj = codes[i], codes[j]
+    scores = np.full(len(i), np.nan)
+    both = (ci >= 0) & (cj >= 0)
+    if both.any():
+        low, high = np.minimum(ci[both], cj[both]), np.maximum(ci[both], cj[both])
+        unique, inverse = np.unique(low.astype(np.int64) * len(texts) + high, return_inverse=True)
+        ratios = np.array([1.0 if a == b else difflib.SequenceMatcher(None, texts[a], texts[b]).ratio()
+                           for a, b in zip(*divmod(unique, len(texts)))])
+        scores[both] = ratios[inverse]
+    return scores
+
+
+def _groups(n, i, j):
+    """Connected-component label (smallest member position) of each row, by label propagation over the pairs."""
+    labels = np.arange(n)
+    while True:
+        low = np.minimum(labels[i], labels[j])
+        before = labels.copy()
+        np.minimum.at(labels, i, low)
+        np.minimum.at(labels, j, low)
+        labels = labels[labels]
+        if np.array_equal(labels, before):
+            return labels
+
+
+def find_near_duplicates(df, columns=None, cutoff=CUTOFF, seed=0):
+    """
+    Groups of rows of df that are near-duplicates on columns (default: the text columns).
+
+    Returns (positions, groups, similarity): positions of the rows that belong
+    to a group, the group (position of its first row) of each, and each row's
+    best average field similarity to another member of its group.
+    """
+    if columns is None:
+        columns = [col for col, dtype in df.dtypes.items() if pd.api.types.is_string_dtype(dtype)]
+    n = len(df)
+    empty = np.empty(0, dtype=np.intp)
+    if n < 2 or not columns:
+        return empty, empty, np.empty(0)
+
+    perms = _permutations(seed)
+    fields = []   # (codes, normalized texts, signatures of the distinct values) per column
+    for f, col in enumerate(columns):
+        codes, uniques = pd.factorize(df[col])
+        if not len(uniques):
+            continue   # nothing but nulls: it can't tell rows apart
+        texts = _normalize(uniques)
+        # Raw values that normalize alike share a code, so they score 1.0 without difflib
+        norm_codes, texts = pd.factorize(texts)
+        codes = np.where(codes >= 0, norm_codes[np.maximum(codes, 0)], -1)
+        fields.append((codes, np.asarray(texts, dtype=object), value_signatures(texts, f, perms)))
+    if not fields:
+        return empty, empty, np.empty(0)
+
+    # Row signatures are built one band at a time, so only n x rows_per_band of them are in memory
+    rows_per_band = NUM_PERM // BANDS
+
+    def band_signatures(band):
+        cols = slice(band * rows_per_band, (band + 1) * rows_per_band)
+        out = np.full((n, rows_per_band), _EMPTY, dtype=np.uint32)
+        for codes, _, signatures in fields:
+            values = signatures[np.maximum(codes, 0), cols]
+            values[codes < 0] = _EMPTY
+            np.minimum(out, values, out=out)
+        return out
+
+    pair_i, pair_j = [], []
+    for band in range(BANDS):
+        bi, bj = _candidates(band_signatures(band))
+        pair_i.append(np.minimum(bi, bj))
+        pair_j.append(np.maximum(bi, bj))
+    i, j = np.concatenate(pair_i), np.concatenate(pair_j)
+    if not len(i):
+        return empty, empty, np.empty(0)
+    pairs = np.unique(i.astype(np.int64) * n + j)
+    i, j = pairs // n, pairs % n
+
+    # Estimated Jaccard similarity of each candidate: the share of signature positions that agree
+    agree = np.zeros(len(i), dtype=np.int64)
+    for band in range(BANDS):
+        signatures = band_signatures(band)
+        agree += (signatures[i] == signatures[j]).sum(axis=1)
+    likely = agree >= MIN_JACCARD * NUM_PERM
+    i, j = i[likely], j[likely]
+
+    scores = np.stack([_field_scores(codes, texts, i, j) for codes, texts, _ in fields])
+    compared = ~np.isnan(scores).all(axis=0)
+    similarity = np.where(compared, np.nanmean(np.where(compared, scores, 0.0), axis=0), 0.0)
+    match = similarity >= cutoff
+    i, j, similarity = i[match], j[match], similarity[match]
+    if not len(i):
+        return empty, empty, np.empty(0)
+
+    labels = _groups(n, i, j)
+    best = np.zeros(n)
+    np.maximum.at(best, i, similarity)
+    np.maximum.at(best, j, similarity)
+    positions = np.flatnonzero(best > 0)
+    return positions, labels[positions], best[positions]
+
+
+def near_duplicate_table(df, positions, groups, similarity, columns):
+    """The long table shown in the app: group number, row label, similarity and the compared values."""
+    table = pd.DataFrame({"group": pd.factorize(groups, sort=True)[0] + 1, "row": df.index[positions],
+                          "similarity": np.round(similarity, 3)})
+    for col in columns:
+        table[col] = df[col].to_numpy()[positions]
+    return table.sort_values(["group", "row"], kind="stable").reset_index(drop=True)
+
+
+def merge_near_duplicates(df, positions, groups):
+    """
+    df with each group collapsed into its first row, nulls in it filled from the group's other rows.
+
+    Returns (merged frame, boolean mask of the rows of df kept, {column: values filled}).
+    """
+    keep = np.ones(len(df), dtype=bool)
+    keep[positions[positions != groups]] = False
+    merged = df.iloc[positions].groupby(groups, sort=True).first()   # first non-null value of each column, per group
+    heads = np.unique(groups)
+    out = df.copy()
+    filled = {}
+    for col in df.columns:
+        gaps = df[col].iloc[heads].isna().to_numpy() & merged[col].notna().to_numpy()
+        if gaps.any():
+            values = out[col].to_numpy(copy=True)
+            values[heads[gaps]] = merged[col].to_numpy()[gaps]
+            out[col] = values
+            filled[col] = int(gaps.sum())
+    return out[keep], keep, filled
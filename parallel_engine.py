@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Column-parallel execution for Raw to Ready.
+
+The text and fuzzy stages loop over columns (normalize, dates and emails per
+column, fuzzy matching per text column), and the columns don't depend on each
+other, so they are handed to a pool of worker processes here:
+
+- Each column is factorized in the app's process (see text_engine.TextColumn).
+  Its codes and unique values are written into one shared-memory block (the
+  uniques as UTF-32 text plus lengths and a null mask), which the worker maps
+  instead of receiving a pickled copy; the new uniques come back the same way.
+  Columns holding other objects than text send their uniques pickled.
+- Every column gets a cost estimate (distinct values x their mean length x
+  the weight of its steps, STEP_COST). Columns are started most expensive
+  first, at most `workers` at a time (longest-processing-time-first, which
+  keeps the cores busy until the end); columns costing less than INLINE_COST
+  run in the app's process while the workers are busy, since shipping them
+  would cost more than the work.
+- Row-local work (ColumnTask with a merge, e.g. normalize, dates and emails)
+  on a column costing more than its share of the workers is split into
+  partitions of its distinct values, so tall files with few columns keep
+  every worker busy too. Partition k gets a contiguous slice of the uniques
+  holding about the same number of characters as the others (as pd.factorize
+  numbers values in order of first appearance, these are the values first
+  seen in the k-th range of rows) and the codes of the rows holding them: a
+  copy, so the codes are copied once in all, plus one boolean mask per
+  partition. Each value is cleaned once, and the partitions' new uniques are
+  put back side by side; the column is rebuilt from its codes once as before.
+  Each partition works on its own slice only: the dates step infers formats
+  from that slice (the formats are mutually exclusive, so every value parses
+  the same way), and the date reports and step stats are summed. Missing
+  values are not partitioned: the fill stage runs before, on the whole
+  frame, with one vectorized where().
+- The result of a stage is the same as with workers=1, which runs everything
+  in process without shared memory.
+
+Each run returns a report: per column (or partition) its cost, time and where it ran, and
+the speedup (the time the columns took one after the other, over the wall
+time of the stage's column work). benchmarks/bench_parallel.py measures the
+speedup of whole stages against workers=1.
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+from contextlib import suppress
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from text_engine import TextColumn, merge_stats
+
+PARALLEL_WORKERS = int(os.environ.get("RAWTOREADY_WORKERS", str(os.cpu_count() or 1)))
+STEP_COST = {"normalize": 1.0, "emails": 1.5, "dates": 4.0, "fuzzy": 12.0}
+INLINE_COST = 200_000   # below this many (weighted) characters a column is cheaper to clean in process
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+class ColumnTask:
+    """
+    func(column, *args) run on the TextColumn of one column; steps name what it does, for the cost estimate.
+
+    merge, if given, marks func as row-local (each value's result depends on
+    that value only): the column may then be split into partitions of its uniques, and
+    merge(list of the partitions' results) gives the task's result.
+    """
+
+    def __init__(self, name, column, func, args=(), steps=(), merge=None, part=""):
+        self.name = name
+        self.column = column
+        self.func = func
+        self.args = args
+        self.steps = list(steps)
+        self.merge = merge
+        self.part = part
+        self.cost = estimate_cost(column, steps)
+
+
+def _chars(uniques):
+    return uniques.astype(str).str.len().to_numpy() if len(uniques) else np.empty(0, dtype=np.int64)
+
+
+def estimate_cost(column, steps):
+    """Rough work of steps on column: characters of its distinct values, weighted by STEP_COST, plus one per row."""
+    chars = _chars(column.uniques).sum()   # numbers etc. by their text
+    return float(chars) * sum(STEP_COST.get(step, 1.0) for step in steps) + len(column)
+
+
+def _partitions(task, workers, share):
+    """
+    task as partitions of its uniques (ColumnTasks over consecutive slices of them and
+    the rows holding them) if it is row-local and costs more than share, else [task].
+    """
+    parts = min(workers, int(task.cost // max(share, INLINE_COST)))
+    column = task.column
+    if task.merge is None or parts < 2 or len(column.uniques) < parts:
+        return [task]
+    weights = np.cumsum(_chars(column.uniques) + 1)
+    bounds = np.unique(np.r_[0, np.searchsorted(weights, weights[-1] * np.arange(1, parts) / parts), len(weights)])
+    uniques = column.uniques.to_numpy(dtype=object)
+    split = []
+    for k, (lo, hi) in enumerate(zip(bounds[:-1], bounds[1:])):
+        mask = (column.codes >= lo) & (column.codes < hi)
+        part = TextColumn.from_parts(column.codes[mask] - lo, uniques[lo:hi])
+        split.append(ColumnTask(task.name, part, task.func, task.args, task.steps, part=f"{k + 1}/{len(bounds) - 1}"))
+    return split
+
+
+def _reassemble(task, parts):
+    """Put the partitions' new uniques and stats back into task's column."""
+    task.column.uniques = pd.Series(np.concatenate([part.column.uniques.to_numpy(dtype=object) for part in parts]),
+                                    dtype=object)
+    for part in parts:
+        merge_stats(task.column.stats, part.column.stats)
+
+
+def _pool_for(workers):
+    """The process-wide pool, grown to at least workers processes."""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers < workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            # Never fork the app's process: it runs threads (Streamlit, the history writer)
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method))
+            _pool_workers = workers
+        return _pool
+
+
+def _discard_pool():
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool, _pool_workers = None, 0
+
+
+# --- Column buffers in shared memory ---
+#
+# Layout of a block: codes (int64 x n_codes), null mask of the uniques
+# (uint8 x n_uniques), lengths of the non-null uniques (int64 x n_texts), then
+# their text as UTF-32. Offsets are rounded up to 8 bytes.
+
+def _align(n):
+    return (n + 7) // 8 * 8
+
+
+def _publish(codes, uniques):
+    """Write codes and uniques (object array) into a new shared block; returns (handle, block)."""
+    null = pd.isna(uniques)
+    texts = uniques[~null]
+    objects = None
+    data = b""
+    # Only text and NaN are encoded: None, NA and NaT stay themselves, and so do numbers etc.
+    if pd.api.types.infer_dtype(texts, skipna=False) not in ("string", "empty") or \
+            not all(isinstance(v, float) for v in uniques[null]):
+        objects, texts = uniques, texts[:0]   # sent pickled with the handle instead
+    else:
+        try:
+            data = "".join(texts).encode("utf-32-le")
+        except UnicodeEncodeError:   # lone surrogates (e.g. from a badly decoded file) have no UTF-32 form
+            objects, texts = uniques, texts[:0]
+    lengths = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+    parts = [codes.astype(np.int64, copy=False).view(np.uint8), null.astype(np.uint8), lengths.view(np.uint8),
+             np.frombuffer(data, dtype=np.uint8)]
+    offsets, size = [], 0
+    for part in parts:
+        offsets.append(size)
+        size = _align(size + len(part))
+    block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    for part, offset in zip(parts, offsets):
+        block.buf[offset:offset + len(part)] = part
+    handle = {"name": block.name, "n_codes": len(codes), "n_uniques": len(uniques), "n_texts": len(texts),
+              "offsets": offsets, "data_bytes": len(data), "objects": objects}
+    return handle, block
+
+
+def _read(handle, block):
+    """(codes, uniques) of a block written by _publish. codes is a view of the block."""
+    offsets = handle["offsets"]
+    codes = np.ndarray(handle["n_codes"], dtype=np.int64, buffer=block.buf, offset=offsets[0])
+    if handle["objects"] is not None:
+        return codes, handle["objects"]
+    null = np.ndarray(handle["n_uniques"], dtype=np.uint8, buffer=block.buf, offset=offsets[1]).astype(bool)
+    lengths = np.ndarray(handle["n_texts"], dtype=np.int64, buffer=block.buf, offset=offsets[2])
+    text = bytes(block.buf[offsets[3]:offsets[3] + handle["data_bytes"]]).decode("utf-32-le")
+    ends = np.cumsum(lengths).tolist()
+    uniques = np.full(handle["n_uniques"], np.nan, dtype=object)
+    uniques[~null] = [text[end - n:end] for end, n in zip(ends, lengths.tolist())]
+    return codes, uniques
+
+
+def _run_shared(func, args, handle):
+    """Worker side: run func on the column in the shared block; returns (handle of the new uniques, stats, result, seconds)."""
+    block = shared_memory.SharedMemory(name=handle["name"])
+    column = None
+    try:
+        column = TextColumn.from_parts(*_read(handle, block))
+        start = time.perf_counter()
+        result = func(column, *args)
+        seconds = time.perf_counter() - start
+        out, out_block = _publish(np.empty(0, dtype=np.int64), column.uniques.to_numpy(dtype=object))
+        stats = column.stats
+    finally:
+        column = None   # its codes are a view of the block, which can't be closed while one exists
+        # A view the task still holds (e.g. in the exception being raised) must not hide that exception;
+        # the app's process unlinks the block either way
+        with suppress(BufferError):
+            block.close()
+    out_block.close()   # the app's process reads and unlinks it
+    return out, stats, result, seconds
+
+
+def _free(future):
+    """Unlink the result block of a finished worker call whose result won't be collected."""
+    if future.cancel() or future.exception() is not None:
+        return
+    block = shared_memory.SharedMemory(name=future.result()[0]["name"])
+    block.close()
+    block.unlink()
+
+
+def _collect(task, out):
+    """Put a worker's new uniques into the task's column; unlinks their block."""
+    block = shared_memory.SharedMemory(name=out["name"])
+    try:
+        uniques = _read(out, block)[1]
+    finally:
+        block.close()
+        block.unlink()
+    task.column.uniques = pd.Series(uniques, dtype=object)
+
+
+def run_column_tasks(tasks, workers=1):
+    """
+    Run every ColumnTask, its column changed in place, on up to workers processes.
+
+    Returns (the value each task's func returned, in order, report). The report
+    has the number of workers, columns and partitions run, the wall and summed
+    column seconds, their ratio ("speedup") and a row per column or partition
+    (see the module docstring).
+    """
+    start = time.perf_counter()
+    share = sum(task.cost for task in tasks) / max(workers, 1)
+    split = [_partitions(task, workers, share) if workers > 1 else [task] for task in tasks]
+    units = [unit for parts in split for unit in parts]   # what is actually run: whole columns or partitions
+    outputs = [None] * len(units)
+    rows = [{"column": unit.name, "part": unit.part, "steps": ", ".join(unit.steps), "cost": round(unit.cost),
+             "seconds": None, "where": "in process"} for unit in units]
+
+    def run_inline(i):
+        unit = units[i]
+        t = time.perf_counter()
+        outputs[i] = unit.func(unit.column, *unit.args)
+        rows[i]["seconds"] = time.perf_counter() - t
+
+    order = sorted(range(len(units)), key=lambda i: -units[i].cost)
+    shipped = [i for i in order if units[i].cost >= INLINE_COST]
+    inline = [i for i in order if units[i].cost < INLINE_COST]
+    if workers <= 1 or len(shipped) < 2:
+        inline, shipped = order, []
+
+    blocks = {}
+    try:
+        if shipped:
+            pool = _pool_for(workers)
+            pending, queue = {}, list(shipped)
+
+            def submit():
+                while queue and len(pending) < workers:
+                    i = queue.pop(0)
+                    handle, blocks[i] = _publish(units[i].column.codes, units[i].column.uniques.to_numpy(dtype=object))
+                    pending[pool.submit(_run_shared, units[i].func, units[i].args, handle)] = i
+
+            try:
+                submit()
+                for i in inline:   # the cheap columns, while the workers are busy
+                    run_inline(i)
+                inline = []
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        i = pending.pop(future)
+                        out, stats, outputs[i], seconds = future.result()
+                        _collect(units[i], out)
+                        units[i].column.stats.update(stats)
+                        rows[i].update(seconds=seconds, where="worker")
+                        blocks.pop(i).unlink()
+                    submit()
+            except BrokenProcessPool:
+                # A worker died (e.g. out of memory): finish the remaining columns here
+                _discard_pool()
+                inline += [i for i in shipped if rows[i]["where"] != "worker"]
+            finally:
+                # After an error in one column the others are still running: wait for them and free their results
+                for future in pending:
+                    with suppress(Exception):
+                        _free(future)
+        for i in inline:
+            run_inline(i)
+    finally:
+        for block in blocks.values():
+            block.close()
+            block.unlink()
+
+    results, i = [], 0
+    for task, parts in zip(tasks, split):
+        if parts == [task]:
+            results.append(outputs[i])
+        else:
+            _reassemble(task, parts)
+            results.append(task.merge(outputs[i:i + len(parts)]))
+        i += len(parts)
+
+    wall = time.perf_counter() - start
+    busy = sum(row["seconds"] or 0 for row in rows)
+    report = {"workers": workers if shipped else 1, "columns": len(tasks), "partitions": len(units),
+              "in_workers": sum(row["where"] == "worker" for row in rows),
+              "wall_seconds": round(wall, 4), "column_seconds": round(busy, 4),
+              "speedup": round(busy / wall, 2) if wall else None,
+              "detail": [{**row, "seconds": None if row["seconds"] is None else round(row["seconds"], 4)}
+                         for row in rows]}
+    return results, report
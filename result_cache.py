@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Cleaning result cache for Raw to Ready.
+
+Running Run Cleaning again on the same file with the same options (to
+re-download, after a page refresh, or when a colleague uploads the same export)
+used to run the whole pipeline again, fuzzy matching included. Results are kept
+on disk here, keyed by the upload's content hash and a canonical form of the
+cleaning options, so a repeat run only reads them back.
+
+Each entry is a directory holding the cleaned frame, the anomalies and the
+frames among the reports as Parquet, and the other reports as JSON; nothing is
+unpickled, so a damaged or planted entry can't run code. Object columns mixing
+text and numbers (e.g. a numeric column holding "N/A") are stored as text plus
+a type code per value. A frame Parquet can't give back with the same dtypes is
+not cached, and neither is anything when PyArrow is not installed. The
+directory is private to the user running the app and bounded in size; the
+least recently used entries are evicted first. The cache is shared by every
+session and survives server restarts.
+"""
+
+import hashlib
+import json
+import logging
+import numbers
+import os
+import shutil
+import stat
+import threading
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from cleaning import DEFAULT_OPTIONS
+from file_formats import ARROW_AVAILABLE
+
+_CACHE_HOME = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+RESULT_CACHE_DIR = os.environ.get("RAWTOREADY_RESULT_CACHE", os.path.join(_CACHE_HOME, "rawtoready", "results"))
+RESULT_CACHE_MB = int(os.environ.get("RAWTOREADY_RESULT_CACHE_MB", "2048"))
+# Bump when a change to the cleaning code changes its output, so old results are not served
+PIPELINE_VERSION = 7
+
+_META = "meta.json"
+# Type codes of the values of a mixed object column; a null is stored as code 0
+_KINDS = {str: 1, int: 2, float: 3, bool: 4, np.int64: 2, np.float64: 3, np.bool_: 4}
+
+log = logging.getLogger(__name__)
+
+
+def canonical_options(options):
+    """The options as a stable string: defaults filled in, keys sorted."""
+    return json.dumps({**DEFAULT_OPTIONS, **options}, sort_keys=True)
+
+
+def result_key(upload_key, options):
+    """Cache key of cleaning the upload (see upload_cache.load_csv) with options."""
+    text = f"{PIPELINE_VERSION}|{upload_key}|{canonical_options(options)}"
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class Uncacheable(Exception):
+    """A result that can't be stored exactly as Parquet and JSON."""
+
+
+def _encode_mixed(series):
+    """(text, type codes) of an object column of text, numbers, booleans and nulls."""
+    codes = series.map(type).map(_KINDS)
+    codes[series.isna().to_numpy()] = 0
+    if codes.isna().any():
+        raise Uncacheable(f"column {series.name!r} holds values other than text, numbers and nulls")
+    return series.astype(str).where(codes != 0), codes.to_numpy(dtype=np.int8)
+
+
+def _decode_mixed(text, codes):
+    values = np.full(len(text), np.nan, dtype=object)
+    text = text.to_numpy(dtype=object)
+    for code, parse in [(1, str), (2, int), (3, float), (4, lambda t: t == "True")]:
+        rows = codes == code
+        values[rows] = [parse(t) for t in text[rows]]
+    return values
+
+
+def _write_frame(df, path):
+    """
+    Write df as Parquet at path + ".parquet" and return its meta: the file and its mixed columns.
+
+    Raises Uncacheable if the file would not read back with df's dtypes (e.g. an
+    object column of ints comes back as int64).
+    """
+    import pyarrow.parquet as pq
+
+    mixed = [col for col in df.columns[(df.dtypes == object).to_numpy()]
+             if pd.api.types.infer_dtype(df[col], skipna=True) not in ("string", "empty")]
+    if mixed:
+        df = df.copy()
+        codes = {}
+        for col in mixed:
+            df[col], codes[col] = _encode_mixed(df[col])
+        pd.DataFrame(codes).to_parquet(path + ".types.parquet")
+    try:
+        df.to_parquet(path + ".parquet")
+    except (ValueError, TypeError) as e:   # pyarrow's ArrowInvalid / ArrowTypeError, non-text column names
+        raise Uncacheable(str(e)) from e
+    back = pq.read_schema(path + ".parquet").empty_table().to_pandas().dtypes
+    if not back.equals(df.dtypes):
+        raise Uncacheable("Parquet changes the dtypes")
+    return {"file": os.path.basename(path), "mixed": mixed}
+
+
+def _read_frame(entry, meta):
+    path = os.path.join(entry, meta["file"])
+    df = pd.read_parquet(path + ".parquet")
+    # Parquet nulls come back as None in object columns; the pipeline's frames use NaN
+    for col in df.columns[(df.dtypes == object).to_numpy()]:
+        if df[col].hasnans:
+            df[col] = df[col].where(df[col].notna(), np.nan)
+    if meta["mixed"]:
+        codes = pd.read_parquet(path + ".types.parquet")
+        for col in meta["mixed"]:
+            df[col] = _decode_mixed(df[col], codes[col].to_numpy())
+    return df
+
+
+def _json_default(value):
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, numbers.Integral):
+        return int(value)
+    if isinstance(value, numbers.Real):
+        return float(value)
+    raise Uncacheable(f"can't store {type(value).__name__} in a report")
+
+
+def _check_private(root):
+    """Create root (mode 0o700) if needed; raise PermissionError unless it is a directory only this user can write."""
+    os.makedirs(root, mode=0o700, exist_ok=True)
+    st = os.lstat(root)
+    owner_ok = not hasattr(os, "getuid") or st.st_uid == os.getuid()
+    if not stat.S_ISDIR(st.st_mode) or not owner_ok or st.st_mode & 0o022:
+        raise PermissionError(f"{root} must be a directory owned and only writable by the current user")
+
+
+class ResultCache:
+    """Directory of cleaning results, bounded by total size with least-recently-used eviction."""
+
+    def __init__(self, root=RESULT_CACHE_DIR, max_bytes=RESULT_CACHE_MB * 1024 ** 2):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """(df_cleaned, anomalies, reports) stored under key, or None."""
+        entry = os.path.join(self.root, key)
+        try:
+            _check_private(self.root)
+            with open(os.path.join(entry, _META), encoding="utf-8") as f:
+                meta = json.load(f)
+            reports = {**meta["reports"], **{name: _read_frame(entry, frame)
+                                             for name, frame in meta["report_frames"].items()}}
+            result = (_read_frame(entry, meta["cleaned"]), _read_frame(entry, meta["anomalies"]), reports)
+            os.utime(os.path.join(entry, _META))   # mark as recently used
+        except FileNotFoundError:   # not cached, or evicted while reading
+            return self._miss()
+        except PermissionError as e:
+            log.warning("result cache disabled: %s", e)
+            return self._miss()
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            # A damaged entry (pyarrow's ArrowInvalid and JSON errors are ValueErrors), e.g. from a process
+            # killed or a full disk while it was written: drop it, so the result is computed and stored again
+            shutil.rmtree(entry, ignore_errors=True)
+            return self._miss()
+        with self._lock:
+            self.hits += 1
+        return result
+
+    def _miss(self):
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, df_cleaned, anomalies, reports):
+        """Store a result, then evict the least recently used entries beyond max_bytes."""
+        if not ARROW_AVAILABLE:
+            return
+        try:
+            _check_private(self.root)
+        except PermissionError as e:
+            log.warning("result cache disabled: %s", e)
+            return
+        # Written into a scratch directory and renamed into place, so readers never see half an entry
+        scratch = os.path.join(self.root, f".{key}.{uuid.uuid4().hex}")
+        os.makedirs(scratch)
+        try:
+            frames = {name: value for name, value in reports.items() if isinstance(value, pd.DataFrame)}
+            meta = {"cleaned": _write_frame(df_cleaned, os.path.join(scratch, "cleaned")),
+                    "anomalies": _write_frame(anomalies, os.path.join(scratch, "anomalies")),
+                    "report_frames": {name: _write_frame(frame, os.path.join(scratch, f"report_{i}"))
+                                      for i, (name, frame) in enumerate(frames.items())},
+                    "reports": {name: value for name, value in reports.items() if name not in frames}}
+            with open(os.path.join(scratch, _META), "w", encoding="utf-8") as f:
+                json.dump(meta, f, default=_json_default)
+            if _dir_bytes(scratch) > self.max_bytes:
+                return   # would evict everything else and still not fit
+            try:
+                os.rename(scratch, os.path.join(self.root, key))
+            except OSError:
+                return   # another session stored the same result first
+        except Uncacheable:
+            return   # computed again next time
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+        self._evict()
+
+    def _entries(self):
+        """[(last used, bytes, path)] of the stored entries, oldest first."""
+        entries = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            try:
+                if not name.startswith("."):
+                    entries.append((os.path.getmtime(os.path.join(path, _META)), _dir_bytes(path), path))
+            except OSError:
+                continue
+        return sorted(entries)
+
+    def _evict(self):
+        with self._lock:
+            entries = self._entries()
+            size = sum(nbytes for _, nbytes, _ in entries)
+            for _, nbytes, path in entries:
+                if size <= self.max_bytes:
+                    break
+                shutil.rmtree(path, ignore_errors=True)
+                size -= nbytes
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            shutil.rmtree(self.root, ignore_errors=True)
+
+    def stats(self):
+        entries = self._entries() if os.path.isdir(self.root) else []
+        with self._lock:
+            return {"entries": len(entries), "size_mb": round(sum(e[1] for e in entries) / 1024 ** 2, 1),
+                    "max_mb": round(self.max_bytes / 1024 ** 2, 1), "hits": self.hits,
+                    "misses": self.misses, "evictions": self.evictions}
+
+
+def _dir_bytes(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+_results = ResultCache()
+
+
+def get_result(upload_key, options):
+    """Cached (df_cleaned, anomalies, reports) of cleaning this upload with options, or None."""
+    return _results.get(result_key(upload_key, options))
+
+
+def put_result(upload_key, options, df_cleaned, anomalies, reports):
+    _results.put(result_key(upload_key, options), df_cleaned, anomalies, reports)
+
+
+def result_stats():
+    return _results.stats()
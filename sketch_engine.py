@@ -0,0 +1,283 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Approximate dataset profiling with mergeable sketches.
+
+The "Show Dataset Details" table used to be df.describe(include="all"), which
+keeps every distinct value of every text column in memory and sorts every
+numeric column. Here each column gets a fixed-size summary built in one pass
+over the rows, chunk by chunk:
+
+- HyperLogLog (p=14, about 0.8% error) for the number of distinct values,
+- a KLL-style compactor sketch for the percentiles (rank error well under 1%),
+- Misra-Gries heavy hitters for the most frequent value and its count,
+- exact count, mean, standard deviation, min and max (merged with Chan's
+  formula).
+
+Every sketch can be merged with another of the same kind, so a frame can be
+summarised chunk by chunk (or a file while it streams past) and the parts
+combined. DatasetSketch.describe() returns a frame shaped like
+df.describe(include="all").transpose().
+"""
+
+import numpy as np
+import pandas as pd
+
+SKETCH_CHUNK_ROWS = 200_000
+HLL_PRECISION = 14
+QUANTILE_K = 2048
+HEAVY_HITTERS = 512
+PERCENTILES = [0.25, 0.5, 0.75]
+
+
+class HyperLogLog:
+    """Distinct count estimate from the 64-bit hashes of the values."""
+
+    def __init__(self, p=HLL_PRECISION):
+        self.p = p
+        self.registers = np.zeros(1 << p, dtype=np.uint8)
+
+    def add_hashes(self, hashes):
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        if not len(hashes):
+            return
+        bits = 64 - self.p
+        index = (hashes >> np.uint64(bits)).astype(np.intp)
+        rest = hashes & np.uint64((1 << bits) - 1)
+        # rank: position of the first 1 bit in the remaining bits (bits + 1 when all zero)
+        with np.errstate(divide="ignore"):
+            rank = np.where(rest == 0, bits + 1, bits - np.floor(np.log2(rest.astype(np.float64))))
+        np.maximum.at(self.registers, index, np.minimum(rank, bits + 1).astype(np.uint8))
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    @property
+    def nbytes(self):
+        return self.registers.nbytes
+
+    def count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.exp2(-self.registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * np.log(m / zeros)   # linear counting is more accurate for small counts
+        return int(round(estimate))
+
+
+class QuantileSketch:
+    """
+    Percentiles of a stream of numbers in O(k log n) memory.
+
+    Level h holds values standing for 2**h original values each. A level that
+    reaches k values is sorted and every other value (from a random start) is
+    promoted to the next level, so each value's rank stays within a small
+    error of its true rank.
+    """
+
+    def __init__(self, k=QUANTILE_K, seed=0):
+        self.k = k
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def add(self, values):
+        self.levels[0] = np.concatenate([self.levels[0], np.asarray(values, dtype=np.float64)])
+        self._compact()
+
+    def merge(self, other):
+        for h, values in enumerate(other.levels):
+            if h == len(self.levels):
+                self.levels.append(values.copy())
+            else:
+                self.levels[h] = np.concatenate([self.levels[h], values])
+        self._compact()
+
+    @property
+    def nbytes(self):
+        return sum(level.nbytes for level in self.levels)
+
+    def _compact(self):
+        h = 0
+        while h < len(self.levels):
+            values = self.levels[h]
+            if len(values) >= self.k:
+                values = np.sort(values)
+                keep = values[len(values) - len(values) % 2:]   # an odd one out stays at this level
+                promoted = values[self._rng.integers(2):len(values) - len(keep):2]
+                self.levels[h] = keep
+                if h + 1 == len(self.levels):
+                    self.levels.append(promoted)
+                else:
+                    self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+            h += 1
+
+    def quantiles(self, qs):
+        values = np.concatenate(self.levels)
+        if not len(values):
+            return [np.nan] * len(qs)
+        weights = np.concatenate([np.full(len(level), 2.0 ** h) for h, level in enumerate(self.levels)])
+        order = np.argsort(values, kind="stable")
+        values, cumulative = values[order], np.cumsum(weights[order])
+        ranks = np.searchsorted(cumulative, np.asarray(qs) * cumulative[-1], side="left")
+        return values[np.minimum(ranks, len(values) - 1)].tolist()
+
+
+class HeavyHitters:
+    """
+    Misra-Gries summary: the values seen more than n / (capacity + 1) times.
+
+    Counts are lower bounds, at most n / (capacity + 1) below the true count
+    (exact while the column has no more than capacity distinct values).
+    """
+
+    def __init__(self, capacity=HEAVY_HITTERS):
+        self.capacity = capacity
+        self.counts = pd.Series(dtype="int64")
+
+    def add_counts(self, counts):
+        """counts: a value_counts() Series of a chunk."""
+        # concat + unsorted groupby: Series.add would sort the union of the two indexes. The empty
+        # starting Series is left out so Arrow-backed counts don't concat with an int64 one
+        parts = [self.counts, counts] if len(self.counts) else [counts]
+        combined = pd.concat(parts).groupby(level=0, sort=False).sum()
+        if len(combined) > self.capacity:
+            threshold = combined.nlargest(self.capacity + 1).iloc[-1]
+            combined = combined[combined > threshold] - threshold
+        self.counts = combined.astype("int64")
+
+    def merge(self, other):
+        self.add_counts(other.counts)
+
+    @property
+    def nbytes(self):
+        return int(self.counts.memory_usage(deep=True))
+
+    def top(self):
+        """(most frequent value, its count), or (nan, nan) when nothing was seen."""
+        if self.counts.empty:
+            return np.nan, np.nan
+        return self.counts.idxmax(), int(self.counts.max())
+
+
+class ColumnSketch:
+    """One column's summary: numeric (moments and percentiles) or categorical (distinct count and top value)."""
+
+    def __init__(self, kind):
+        self.kind = kind   # "numeric", "datetime" or "categorical"
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.quantiles = QuantileSketch() if kind != "categorical" else None
+        self.distinct = HyperLogLog() if kind == "categorical" else None
+        self.heavy = HeavyHitters() if kind == "categorical" else None
+
+    def add(self, series):
+        if self.kind == "categorical":
+            counts = series.value_counts(sort=False)   # leaves out nulls
+            if counts.empty:
+                return
+            self.count += int(counts.sum())
+            # Hash each distinct value of the chunk once, not every row
+            self.distinct.add_hashes(pd.util.hash_array(counts.index.to_numpy(dtype=object)))
+            self.heavy.add_counts(counts)
+            return
+        values = series.dropna()
+        if values.empty:
+            return
+        if self.kind == "datetime":
+            array = values.to_numpy(dtype="datetime64[ns]").view("int64").astype(np.float64)
+        else:
+            array = values.to_numpy(dtype=np.float64)
+        self._add_moments(len(array), float(array.mean()), float(((array - array.mean()) ** 2).sum()),
+                          float(array.min()), float(array.max()))
+        self.quantiles.add(array)
+
+    def _add_moments(self, n, mean, m2, low, high):
+        total = self.count + n
+        delta = mean - self.mean
+        self.m2 += m2 + delta * delta * self.count * n / total
+        self.mean += delta * n / total
+        self.count = total
+        self.min, self.max = min(self.min, low), max(self.max, high)
+
+    def merge(self, other):
+        if other.count == 0:
+            return
+        if self.kind == "categorical":
+            self.count += other.count
+            self.distinct.merge(other.distinct)
+            self.heavy.merge(other.heavy)
+            return
+        self._add_moments(other.count, other.mean, other.m2, other.min, other.max)
+        self.quantiles.merge(other.quantiles)
+
+    @property
+    def nbytes(self):
+        parts = [self.quantiles, self.distinct, self.heavy]
+        return sum(part.nbytes for part in parts if part is not None)
+
+    def describe(self):
+        if self.kind == "categorical":
+            top, freq = self.heavy.top()
+            unique = min(self.distinct.count(), self.count) if self.count else 0
+            return {"count": self.count, "unique": unique, "top": top, "freq": freq}
+        if self.count == 0:
+            return {"count": 0}
+        row = {"count": self.count, "mean": self.mean, "min": self.min,
+               **dict(zip([f"{q:.0%}" for q in PERCENTILES], self.quantiles.quantiles(PERCENTILES))),
+               "max": self.max}
+        if self.kind == "datetime":
+            return {key: value if key == "count" else pd.Timestamp(int(value)) for key, value in row.items()}
+        row["std"] = float(np.sqrt(self.m2 / (self.count - 1))) if self.count > 1 else np.nan
+        return row
+
+
+def _kind(dtype):
+    if pd.api.types.is_bool_dtype(dtype):
+        return "categorical"
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return "datetime"
+    if pd.api.types.is_numeric_dtype(dtype):
+        return "numeric"
+    return "categorical"
+
+
+class DatasetSketch:
+    """ColumnSketches of every column of a table, updated chunk by chunk."""
+
+    def __init__(self, dtypes):
+        self.columns = {col: ColumnSketch(_kind(dtype)) for col, dtype in dtypes.items()}
+        self.rows = 0
+
+    def add(self, chunk):
+        self.rows += len(chunk)
+        for col, sketch in self.columns.items():
+            sketch.add(chunk[col])
+
+    def merge(self, other):
+        self.rows += other.rows
+        for col, sketch in other.columns.items():
+            self.columns[col].merge(sketch)
+
+    @property
+    def nbytes(self):
+        return sum(sketch.nbytes for sketch in self.columns.values())
+
+    def describe(self):
+        """Frame shaped like df.describe(include="all").transpose(), from the sketches."""
+        order = ["count", "unique", "top", "freq", "mean", "std", "min"] + [f"{q:.0%}" for q in PERCENTILES] + ["max"]
+        rows = {col: sketch.describe() for col, sketch in self.columns.items()}
+        frame = pd.DataFrame.from_dict(rows, orient="index")
+        return frame[[key for key in order if key in frame.columns]].astype(object)
+
+
+def sketch_frame(df, chunksize=SKETCH_CHUNK_ROWS):
+    """DatasetSketch of df, built over its rows in chunks of chunksize."""
+    sketch = DatasetSketch(df.dtypes.to_dict())
+    for start in range(0, len(df), chunksize):
+        sketch.add(df.iloc[start:start + chunksize])
+    return sketch
@@ -4,8 +4,23 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-from datetime import datetime
-import re, difflib, time, toml, sqlite3, hashlib, os
+import re, time, toml, hashlib, json, os, tempfile
+from contextlib import nullcontext, suppress
+from cleaning import FILL_METHODS, DEFAULT_OPTIONS, STAGE_METRICS, STAGES, run_stages, stage_frame, text_columns
+from anomaly_engine import METHODS, METHOD_LABELS, rows_for
+from upload_cache import (ARROW_AVAILABLE, load_csv, cache_stats, clean_incremental, exact_describe,
+                          stage_cache_stats)
+from result_cache import get_result, put_result, result_stats
+from streaming import clean_csv_stream, export_stream
+from file_formats import EXPORT_FORMATS, export_formats, read_upload, upload_kind, upload_types, write_frame
+from text_engine import report_frame
+from db import PAGE_SIZE, get_db
+from canonical_store import DICTIONARY_LABELS, dictionary_scope, load_dictionary, save_updates
+from instrument import PROFILE_ALL, capture_profile, is_admin, profile_report
+from parallel_engine import PARALLEL_WORKERS
+
+# Uploads bigger than this are cleaned in streaming mode by default
+STREAMING_THRESHOLD_MB = int(os.environ.get("RAWTOREADY_STREAMING_MB", "200"))
 
 # ============================
 # CONFIGURATION
@@ -18,61 +33,17 @@ if os.path.exists(".streamlit/config.toml"):
 # ============================
 # DATABASE SETUP
 # ============================
-DB_PATH = "users.db"
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE,
-            email TEXT UNIQUE,
-            password_hash TEXT
-        )
-    """)
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS cleaning_history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_email TEXT,
-            filename TEXT,
-            rows_before INTEGER,
-            rows_after INTEGER,
-            nulls_before INTEGER,
-            nulls_after INTEGER,
-            duplicates_before INTEGER,
-            duplicates_after INTEGER,
-            anomalies_detected INTEGER,
-            cleaning_options TEXT,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    conn.commit(); conn.close()
+# Shared connections, one-time migration and background history writes: see db.py
+db = get_db()
 
 def hash_password(pw): 
     return hashlib.sha256(pw.encode()).hexdigest()
 
 def register_user(username, email, pw):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    try:
-        c.execute("INSERT INTO users (username, email, password_hash) VALUES (?,?,?)",
-                  (username, email, hash_password(pw)))
-        conn.commit(); return True
-    except sqlite3.IntegrityError:
-        return False
-    finally:
-        conn.close()
+    return db.register_user(username, email, hash_password(pw))
 
 def login_user(email, pw):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT * FROM users WHERE email=? AND password_hash=?", 
-              (email, hash_password(pw)))
-    user = c.fetchone()
-    conn.close()
-    return user
-
-init_db()
+    return db.find_user(email, hash_password(pw))
 
 # ============================
 # SESSION INITIALIZATION
@@ -197,85 +168,29 @@ def show_profile():
         time.sleep(1)
         st.rerun()
 
-# ============================
-# HELPER FUNCTIONS (DATA CLEANING)
-# ============================
-def standardize_dates(series):
-    def parse_date(x):
-        for fmt in ("%Y-%m-%d", "%d/%m/%y", "%d/%m/%Y", "%b %d, %Y", "%Y.%m.%d"):
-            try:
-                return datetime.strptime(str(x), fmt).strftime("%Y-%m-%d")
-            except:
-                continue
-        return x
-    return series.apply(parse_date)
-
-def normalize_text(series, col_name=""):
-    """Normalize capitalization for names/cities, but skip emails."""
-    if "email" in col_name.lower():
-        return series
-    return series.astype(str).str.strip().str.lower().str.title()
-
-def validate_emails(series):
-    return series.apply(lambda x: x if re.match(r"[^@]+@[^@]+\.[^@]+", str(x)) else "invalid@example.com")
-
-def fill_missing(df, method="Fill with N/A"):
-    df_copy = df.copy()
-    for col in df_copy.columns:
-        if df_copy[col].isnull().sum() > 0:
-            if method == "Drop Rows":
-                df_copy.dropna(inplace=True)
-            elif method == "Fill with N/A":
-                df_copy[col].fillna("N/A", inplace=True)
-            elif method == "Fill with Mean" and pd.api.types.is_numeric_dtype(df_copy[col]):
-                df_copy[col].fillna(df_copy[col].mean(), inplace=True)
-            elif method == "Fill with Median" and pd.api.types.is_numeric_dtype(df_copy[col]):
-                df_copy[col].fillna(df_copy[col].median(), inplace=True)
-            elif method == "Fill by most common":
-                df_copy[col].fillna(df_copy[col].mode()[0], inplace=True)
-    return df_copy
-
-def fuzzy_standardize(series, cutoff=0.85):
-    series = series.astype(str).str.strip()
-    unique_vals = series.dropna().unique()
-    mapping = {}
-
-    for val in unique_vals:
-        match = difflib.get_close_matches(val, mapping.keys(), n=1, cutoff=cutoff)
-        if match:
-            mapping[val] = mapping[match[0]]
-        else:
-            mapping[val] = val
-    return series.map(mapping)
-
-def detect_anomalies(df, threshold=3):
-    anomalies = pd.DataFrame()
-    for col in df.select_dtypes(include=[np.number]).columns:
-        if df[col].std() == 0:  # avoid divide by zero
-            continue
-        z_scores = (df[col] - df[col].mean()) / df[col].std()
-        anomaly_mask = np.abs(z_scores) > threshold
-        if anomaly_mask.any():
-            col_anomalies = df[anomaly_mask].copy()
-            col_anomalies["Anomaly_Column"] = col
-            col_anomalies["Anomaly_Value"] = df[col][anomaly_mask]
-            anomalies = pd.concat([anomalies, col_anomalies])
-    return anomalies
-
 # ---------------------------
 # Reset state when a new file is uploaded
 # ---------------------------
 def reset_cleaning_options():
-    st.session_state["do_duplicates"] = False
-    st.session_state["do_standardize_cols"] = False
-    st.session_state["do_normalize_text"] = False
-    st.session_state["do_fix_dates"] = False
-    st.session_state["do_validate_emails"] = False
-    st.session_state["do_fuzzy_standardize"] = False
-    st.session_state["do_anomaly_detection"] = False
-    st.session_state["fill_method"] = "Fill with N/A"
+    for key, val in DEFAULT_OPTIONS.items():
+        st.session_state[key] = val
     st.session_state["cleaned_ready"] = False
 
+
+# ---------------------------
+# Temp files of a run (never shared between sessions or runs)
+# ---------------------------
+def temp_path(suffix):
+    fd, path = tempfile.mkstemp(prefix="rawtoready_", suffix=suffix)
+    os.close(fd)
+    return path
+
+
+def remove_file(path):
+    if path:
+        with suppress(FileNotFoundError):
+            os.remove(path)
+
 # ============================
 # MAIN APP
 # ============================
@@ -299,37 +214,93 @@ elif menu == "Profile":
 elif menu == "Cleaning History":
     if st.session_state.get("logged_in", False):
         st.markdown("## 🕒 Cleaning History")
+        email = st.session_state["email"]
+
+        # --- Filter by cleaning options (matched in SQL against the stored JSON) ---
+        step_labels = {key: key.removeprefix("do_").replace("_", " ").capitalize()
+                       for key, value in DEFAULT_OPTIONS.items() if isinstance(value, bool)}
+        with st.expander("🔎 Filter by cleaning options"):
+            f1, f2, f3 = st.columns(3)
+            fill_filter = f1.selectbox("Missing values", ["Any"] + FILL_METHODS, key="history_fill")
+            method_filter = f2.selectbox("Anomaly method", ["Any"] + list(METHODS), key="history_method",
+                                         format_func=lambda m: METHOD_LABELS.get(m, m))
+            step_filter = f3.multiselect("Steps used", list(step_labels), format_func=step_labels.get,
+                                         key="history_steps")
+        filters = {key: True for key in step_filter}
+        if fill_filter != "Any":
+            filters["fill_method"] = fill_filter
+        if method_filter != "Any":
+            filters["anomaly_method"] = method_filter
+
+        # Keyset pagination: a stack of page cursors, reset when the filters change
+        if st.session_state.get("history_filters") != filters:
+            st.session_state["history_filters"] = filters
+            st.session_state["history_cursors"] = [None]
+        cursors = st.session_state["history_cursors"]
+
+        totals, weekly = db.history_summary(email, filters)
+
+        if totals["runs"] == 0:
+            if filters:
+                st.info("No cleaning runs match these options.")
+            else:
+                st.info("No cleaning history found yet. Clean a dataset to start building your history!")
+        else:
+            m1, m2, m3, m4 = st.columns(4)
+            m1.metric("Runs", f"{totals['runs']:,}")
+            m2.metric("Rows Cleaned", f"{totals['rows_cleaned']:,}")
+            m3.metric("Nulls Fixed", f"{totals['nulls_fixed']:,}")
+            m4.metric("Anomalies Found", f"{totals['anomalies_found']:,}")
+            if len(weekly) > 1:
+                st.markdown("**Runs per week**")
+                st.bar_chart(weekly.set_index("week")["runs"])
+
+            df_history, next_cursor = db.history_page(email, filters, after=cursors[-1])
+            if df_history.empty and len(cursors) > 1:
+                # The last rows of this page were deleted: step back
+                cursors.pop()
+                st.rerun()
+            st.dataframe(df_history.drop(columns=["id", "stage_metrics", "has_profile"]), use_container_width=True)
 
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        df_history = pd.read_sql_query(
-            f"""
-            SELECT id, filename, rows_before, rows_after, nulls_before, nulls_after,
-                   duplicates_before, duplicates_after, anomalies_detected, timestamp
-            FROM cleaning_history
-            WHERE user_email='{st.session_state['email']}'
-            ORDER BY timestamp DESC
-            """,
-            conn
-        )
-        conn.close()
+            p1, p2, p3 = st.columns([1, 2, 1])
+            if p1.button("⬅️ Newer", disabled=len(cursors) == 1):
+                cursors.pop()
+                st.rerun()
+            p2.caption(f"Page {len(cursors)} of {-(-totals['runs'] // PAGE_SIZE)}")
+            if p3.button("Older ➡️", disabled=next_cursor is None):
+                cursors.append(next_cursor)
+                st.rerun()
 
-        if df_history.empty:
-            st.info("No cleaning history found yet. Clean a dataset to start building your history!")
-        else:
-            st.dataframe(df_history.drop(columns=["id"]), use_container_width=True)
+            # Seconds per stage across the runs on this page, to spot a stage getting slower
+            timings = pd.DataFrame([{"run": f"{row.timestamp} #{row.id}", "stage": stage["stage"],
+                                     "seconds": stage["seconds"]}
+                                    for row in df_history.itertuples() if row.stage_metrics
+                                    for stage in json.loads(row.stage_metrics) if stage["seconds"] is not None])
+            if not timings.empty:
+                with st.expander("⏱️ Stage timings"):
+                    st.caption("Seconds spent in each cleaning stage, for the runs on this page. "
+                               "Cached and skipped stages are not shown.")
+                    st.bar_chart(timings.pivot_table(index="run", columns="stage", values="seconds", aggfunc="sum"))
 
             st.markdown("---")
             st.markdown("### ✏️ Manage Records")
 
-            # Select record
+            # Select record (from the rows on this page)
+            labels = {row.id: f"{row.filename} ({row.timestamp})" for row in df_history.itertuples()}
             record_id = st.selectbox(
                 "Select a record to edit or delete",
-                df_history["id"],
-                format_func=lambda x: f"{df_history.loc[df_history['id']==x, 'filename'].values[0]} ({df_history.loc[df_history['id']==x, 'timestamp'].values[0]})"
+                list(labels),
+                format_func=labels.get
             )
 
             selected_record = df_history[df_history["id"] == record_id].iloc[0]
+            if selected_record["stage_metrics"]:
+                with st.expander("Stage metrics of this run"):
+                    st.dataframe(stage_frame(json.loads(selected_record["stage_metrics"])), hide_index=True)
+            if selected_record["has_profile"]:
+                st.download_button("📄 Download profile report", db.profile_report(int(record_id), email) or "",
+                                   file_name=f"profile_{record_id}.txt", mime="text/plain",
+                                   help="CPU profile, allocation sites and per-stage breakdown captured during this run.")
 
             # --- Edit Form (filename only) ---
             with st.form("edit_form", clear_on_submit=False):
@@ -337,14 +308,7 @@ elif menu == "Cleaning History":
                 submitted = st.form_submit_button("💾 Save Changes")
 
                 if submitted:
-                    conn = sqlite3.connect(DB_PATH)
-                    c = conn.cursor()
-                    c.execute(
-                        "UPDATE cleaning_history SET filename=? WHERE id=?",
-                        (new_filename, record_id)
-                    )
-                    conn.commit()
-                    conn.close()
+                    db.rename_history(int(record_id), email, new_filename)
                     st.success("✅ Record updated successfully!")
                     time.sleep(1)
                     st.rerun()
@@ -352,11 +316,7 @@ elif menu == "Cleaning History":
             # --- Delete Option ---
             st.subheader("Delete Record")
             if st.button("🗑️ Delete This Record"):
-                conn = sqlite3.connect(DB_PATH)
-                c = conn.cursor()
-                c.execute("DELETE FROM cleaning_history WHERE id=?", (record_id,))
-                conn.commit()
-                conn.close()
+                db.delete_history(int(record_id), email)
                 st.warning("⚠️ Record deleted successfully.")
                 time.sleep(1)
                 st.rerun()
@@ -381,7 +341,7 @@ elif menu == "Home":
         unsafe_allow_html=True
     )
 
-    tab1, tab2, tab3 = st.tabs(["Raw Data Preview", "Cleaned Data Preview", "Anomalies Detected"])
+    tab1, tab2, tab3, tab4 = st.tabs(["Raw Data Preview", "Cleaned Data Preview", "Anomalies Detected", "Near-Duplicates"])
 
     # You can keep your data cleaning code here under each tab
     # e.g., upload CSV, clean data, display before/after, etc.
@@ -396,7 +356,8 @@ elif menu == "Home":
 
     # Step 1: Upload
     st.sidebar.markdown("### 📥 Step 1: Upload your Dataset")
-    uploaded_file = st.sidebar.file_uploader("CSV Files are accepted", type=["csv"])
+    uploaded_file = st.sidebar.file_uploader("CSV, Parquet and Feather files are accepted (CSVs may be .gz or .zst)",
+                                             type=upload_types())
 
     # Reset cleaning options if a new file is uploaded
     if uploaded_file is not None and "last_uploaded" not in st.session_state:
@@ -410,19 +371,46 @@ elif menu == "Home":
     # If file uploaded
     # ---------------------------
     if uploaded_file:
-        df = pd.read_csv(uploaded_file)
-
-        # Save original stats
-        rows_before = int(len(df))
-        nulls_before = int(df.isnull().sum().sum())
-        duplicates_before = int(df.duplicated().sum())
+        columnar = upload_kind(uploaded_file) != "csv"
+        streaming = st.sidebar.checkbox(
+            "Streaming mode (large files)",
+            value=not columnar and uploaded_file.size > STREAMING_THRESHOLD_MB * 1024 ** 2,
+            disabled=columnar,
+            help="Cleans the file in chunks instead of loading it all into memory. Use it for CSV files bigger than a few hundred MB."
+        )
+        arrow = st.sidebar.checkbox(
+            "Arrow ingest",
+            value=False,
+            disabled=streaming or not ARROW_AVAILABLE,
+            help="Parses the CSV with PyArrow's multithreaded reader into Arrow-backed columns. "
+                 "Faster and much lighter on memory for text-heavy files. Requires pyarrow."
+        )
+        workers = st.sidebar.number_input(
+            "Parallel workers",
+            min_value=1,
+            max_value=max(PARALLEL_WORKERS, os.cpu_count() or 1),
+            value=PARALLEL_WORKERS,
+            help="Processes that clean text columns side by side (normalizing, dates, emails, fuzzy matching). "
+                 "Large columns are also split into slices of their distinct values for normalizing, dates and emails, so tall "
+                 "files with few columns benefit too. The result is the same with 1."
+        )
+        if streaming:
+            # Only a preview is parsed here; the full stats come from the streaming run
+            df = read_upload(uploaded_file, nrows=1000)
+            profile = None
+        else:
+            # Parsed frame and original stats are cached by file contents across reruns
+            df, profile, upload_key = load_csv(uploaded_file, arrow=arrow)
+            rows_before = profile["rows"]
+            nulls_before = profile["nulls"]
+            duplicates_before = profile["duplicates"]
 
         # Step 2: Options
         st.sidebar.markdown("### ⚙️ Step 2: Choose Cleaning Options")
         st.sidebar.caption("Select all options that apply to your dataset. Hover over each ❓ for guidance.")
         fill_method = st.sidebar.selectbox(
             "Missing Values",
-            ["Fill with N/A", "Fill with Mean", "Fill with Median", "Fill by most common", "Drop Rows"],
+            FILL_METHODS,
              key="fill_method",
              help=("💡 Tip: For small datasets, filling values is better. If your dataset is big, you can consider dropping the rows.")
         )
@@ -430,6 +418,9 @@ elif menu == "Home":
         with st.sidebar.expander("Advanced Options"):
             st.checkbox("Remove duplicates", key="do_duplicates",
                         help="Removes rows that are exact duplicates. Recommended if your dataset has repeated entries.")
+            st.multiselect("Find duplicates by", list(df.columns), key="duplicate_keys",
+                           help="Rows count as duplicates when they match on these columns (e.g. an order ID), "
+                                "keeping the first. Leave empty to compare whole rows.")
             st.checkbox("Standardize column names", key="do_standardize_cols",
                         help="Converts column names to lowercase and replaces spaces with underscores for consistency.")
             st.checkbox("Normalize text", key="do_normalize_text",
@@ -440,8 +431,28 @@ elif menu == "Home":
                         help="Ensures all emails follow a proper format. Invalid ones become `invalid@example.com`.")
             st.checkbox("Fuzzy standardize values", key="do_fuzzy_standardize",
                         help="Groups similar text values together (e.g., 'NYC', 'New York City', 'N.Y.C.' → 'NYC').")
+            st.selectbox("Remember fuzzy matches in", list(DICTIONARY_LABELS), key="fuzzy_dictionary",
+                         format_func=DICTIONARY_LABELS.get,
+                         help="Saves each column's values with the value they were standardized to, and reuses them "
+                              "for files with the same column names, so only new spellings need matching. "
+                              "Your own dictionary needs you to be logged in.")
+            st.checkbox("Find near-duplicate records", key="do_near_duplicates", disabled=streaming,
+                        help="Finds rows that are the same record apart from typos, spacing or capitalization "
+                             "in a field or two. Not available in streaming mode.")
+            st.multiselect("Compare near-duplicates on", list(df.columns), key="near_duplicate_columns",
+                           disabled=streaming,
+                           help="The fields compared (e.g. name, email and city). Leave empty to compare every text column.")
+            st.checkbox("Merge near-duplicates", key="near_duplicate_merge", disabled=streaming,
+                        help="Keeps the first row of each group, with its empty fields filled in from the others. "
+                             "Otherwise the groups are only listed in the Near-Duplicates tab.")
             st.checkbox("Detect anomalies", key="do_anomaly_detection",
                         help="Flags unusual numeric values using statistical detection. Useful for spotting outliers (extreme values).")
+            st.selectbox("Anomaly method", list(METHODS), key="anomaly_method", format_func=METHOD_LABELS.get,
+                         help="Z-score suits bell-shaped data. Robust and IQR are not thrown off by the outliers themselves or by skewed data.")
+            st.multiselect("Detect anomalies within groups of", list(text_columns(df)), key="anomaly_group_by",
+                           disabled=streaming,
+                           help="Compares each value only with rows of the same segment (e.g. region or product line), "
+                                "so small segments are not drowned out by large ones. Not available in streaming mode.")
 
     
         # Tabs for Raw vs Cleaned data
@@ -453,23 +464,54 @@ elif menu == "Home":
                 st.markdown("**Column Info:**")
                 st.caption("This table shows each column in the dataset along with its detected data type.")
                 table_md = "| Column | Data Type |\n|--------|-----------|\n"
-                for col in df.columns:
-                    table_md += f"| {col} | {df[col].dtype} |\n"
+                dtypes = df.dtypes.astype(str).to_dict() if profile is None else profile["dtypes"]
+                for col, dtype in dtypes.items():
+                    table_md += f"| {col} | {dtype} |\n"
                 st.markdown(table_md)
 
-                st.markdown("**Summary Statistics:**")
-                st.caption(
-                     """
-                    This table provides descriptive statistics for each column in the dataset:
+                if profile is None:
+                    st.caption("Streaming mode: column types are from the first 1000 rows, "
+                               "and summary statistics are not computed for the whole file.")
+                else:
+                    st.markdown("**Summary Statistics:**")
+                    st.caption(
+                         """
+                        This table provides descriptive statistics for each column in the dataset:
+
+                        - **Numerical columns** (numbers) show: count, mean, standard deviation, minimum, maximum, and percentiles.
+                        - **Categorical columns** (labels or text) show: count, number of unique values, most frequent value (*top*), and its frequency.
+                        """, unsafe_allow_html=True
+                    )
+                    if st.checkbox("Exact statistics", key="exact_stats",
+                                   help="Unique counts, top values and percentiles are estimated (within about 1%) "
+                                        "so this table shows up instantly. Tick to compute them exactly; "
+                                        "this can take a while on large files."):
+                        st.dataframe(exact_describe(df, upload_key))
+                    else:
+                        st.dataframe(profile["describe"])
+
+                    if "ingest" in profile:
+                        st.markdown("**Arrow vs Default Parsing:**")
+                        st.caption("Time to parse this file and memory taken by the parsed data, for each parser.")
+                        st.dataframe(profile["ingest"])
 
-                    - **Numerical columns** (numbers) show: count, mean, standard deviation, minimum, maximum, and percentiles.
-                    - **Categorical columns** (labels or text) show: count, number of unique values, most frequent value (*top*), and its frequency.
-                    """, unsafe_allow_html=True
-                )
-                st.dataframe(df.describe(include="all").transpose())
+                    stats = cache_stats()
+                    st.caption(f"Upload cache: {stats['hits']} hits, {stats['misses']} misses, "
+                               f"{stats['entries']} files ({stats['size_mb']} / {stats['max_mb']} MB)")
 
         # Step 3: Run Cleaning
         st.sidebar.markdown("#### 🧹 Step 3: Apply Cleaning")
+        export_format = st.sidebar.selectbox(
+            "Download format", export_formats(), key="export_format",
+            format_func=lambda fmt: EXPORT_FORMATS[fmt][0],
+            help="Parquet and Feather load much faster into pandas, Spark or BI tools. Compressed CSVs are smaller to download."
+        )
+        # Profiling (cProfile + tracemalloc, see instrument.py): on for every run, or per run for admins
+        if is_admin(st.session_state["email"]) and not PROFILE_ALL:
+            st.sidebar.checkbox("Profile this run", key="profile_run",
+                                help="Captures a CPU and memory profile of the cleaning run, saved with its history "
+                                     "record. Makes the run several times slower.")
+        profiling = PROFILE_ALL or st.session_state.get("profile_run", False)
         if st.sidebar.button("Run Cleaning"):
             # Custom CSS for Loader
             loader_css = st.empty()
@@ -511,71 +553,92 @@ elif menu == "Home":
                 </style>
             """, unsafe_allow_html=True)
 
-            # Cleaning steps
-            df_cleaned = df.copy()
-            df_cleaned = fill_missing(df_cleaned, method=fill_method)
-
-            if st.session_state["do_duplicates"]:
-                df_cleaned.drop_duplicates(inplace=True)
-
-            if st.session_state["do_standardize_cols"]:
-                df_cleaned.columns = [c.strip().lower().replace(" ", "_") for c in df_cleaned.columns]
-
-            if st.session_state["do_normalize_text"]:
-                for col in df_cleaned.select_dtypes(include=["object"]).columns:
-                    df_cleaned[col] = normalize_text(df_cleaned[col], col_name=col)
-
-            if st.session_state["do_fix_dates"]:
-                for col in df_cleaned.columns:
-                    if "date" in col.lower():
-                        df_cleaned[col] = standardize_dates(df_cleaned[col])
-
-            if st.session_state["do_validate_emails"]:
-                for col in df_cleaned.columns:
-                    if "email" in col.lower():
-                        df_cleaned[col] = validate_emails(df_cleaned[col])
-
-            if st.session_state["do_fuzzy_standardize"]:
-                for col in df_cleaned.select_dtypes(include=["object"]).columns:
-                    df_cleaned[col] = fuzzy_standardize(df_cleaned[col], cutoff=0.85)
-
-            anomalies = pd.DataFrame()
-            if st.session_state["do_anomaly_detection"]:
-                anomalies = detect_anomalies(df_cleaned)
-
+            # The recipe: same keys as cleaning.DEFAULT_OPTIONS, stored with the history record
+            cleaning_options = {key: st.session_state[key] for key in DEFAULT_OPTIONS}
+            if streaming:
+                cleaning_options["anomaly_group_by"] = []
+                cleaning_options["do_near_duplicates"] = False
+
+            # Canonical values saved by earlier runs (see canonical_store.py); results depend on them too
+            canonicals = dictionary = None
+            if cleaning_options["do_fuzzy_standardize"] and cleaning_options["fuzzy_dictionary"]:
+                dictionary = dictionary_scope(cleaning_options["fuzzy_dictionary"],
+                                              st.session_state["email"] if st.session_state.get("logged_in") else None)
+                if dictionary is None:
+                    st.warning("Log in to use your own dictionary of fuzzy matches. This run matches without it.")
+                else:
+                    canonicals = load_dictionary(db, dictionary)
+            result_options = cleaning_options if canonicals is None else {
+                **cleaning_options, "canonical_revision": canonicals.revision}
+
+            profiler = capture_profile() if profiling else nullcontext()
+            with profiler as prof:
+                if streaming:
+                    # Clean chunk by chunk into a temp file; only a preview is loaded back
+                    # Kept for this session's downloads until its next streaming run
+                    remove_file(st.session_state.pop("stream_output", None))
+                    out_path = st.session_state["stream_output"] = temp_path(".csv")
+                    report = clean_csv_stream(uploaded_file, out_path, cleaning_options, canonicals=canonicals,
+                                              workers=workers)
+                    df_cleaned = pd.read_csv(out_path, nrows=1000)
+                    anomalies = report["anomalies"]
+                    date_reports = report["date_reports"]
+                    text_reports = report["text_reports"]
+                    fill_report = report["fill_report"]
+                    rows_before = report["rows_before"]
+                    nulls_before = report["nulls_before"]
+                    duplicates_before = report["duplicates_before"]
+                    near_duplicates = None
+                    canonical_updates = report["canonical_updates"]
+                    parallel = {}
+                    stage_log = report["stage_log"]
+                else:
+                    # Same file and same options as an earlier run (any session): read the result back.
+                    # A profiled run skips both caches, so the profile covers the whole pipeline.
+                    cached = None if profiling else get_result(upload_key, result_options)
+                    if cached is None:
+                        if profiling:
+                            df_cleaned, anomalies, reports, stage_log = run_stages(
+                                df, cleaning_options, fingerprints=profile["fingerprints"], canonicals=canonicals,
+                                workers=workers)
+                        else:
+                            # Otherwise only the stages from the first changed option on are run again
+                            df_cleaned, anomalies, reports, stage_log = clean_incremental(
+                                df, upload_key, cleaning_options, profile["fingerprints"], canonicals, workers)
+                        put_result(upload_key, result_options, df_cleaned, anomalies, reports)
+                    else:
+                        df_cleaned, anomalies, reports = cached
+                        stage_log = [{"stage": stage.label, "status": "cached" if stage.enabled(cleaning_options) else "off",
+                                      **dict.fromkeys(STAGE_METRICS)} for stage in STAGES]
+                    fill_report = reports["fill_report"]
+                    date_reports = reports["date_reports"]
+                    text_reports = reports["text_reports"]
+                    near_duplicates = reports["near_duplicates"]
+                    canonical_updates = reports["canonical_updates"]
+                    parallel = reports["parallel"]
+                    # Counted on the chosen key columns, from the row fingerprints (see fingerprint_engine.py)
+                    duplicates_before = reports["duplicates_before"]
+
+            profile_text = profile_report(prof, stage_log, uploaded_file.name) if profiling else None
             loader_css.empty()
-            success_overlay = st.empty()
-
-            (success_overlay.markdown("""
-            <div style="
-                position: fixed;
-                top: 0; left: 0;
-                width: 100vw; height: 100vh;
-                display: flex;
-                flex-direction: column;
-                align-items: center;
-                justify-content: center;
-                background-color: rgba(255,255,255,0.95);
-                font-size: 42px;
-                font-weight: bold;
-                color: #28A745;
-                z-index: 99999;
-            ">
-                Cleaning Completed Successfully!
-            </div>
-            """, unsafe_allow_html=True))
-
-            time.sleep(1)
-            success_overlay.empty()
+            st.toast("Cleaning Completed Successfully!", icon="✅")
+            if canonicals is not None:
+                saved = save_updates(db, dictionary, canonical_updates)
+                if saved:
+                    st.toast(f"{saved} new values saved to the {DICTIONARY_LABELS[cleaning_options['fuzzy_dictionary']].lower()}")
 
             with tab2:
                 st.dataframe(df_cleaned.head(10))
 
             with tab3:
-                if "anomalies" in locals() and not anomalies.empty:
-                    rows_with_anomalies = anomalies.index.nunique()
+                if not anomalies.empty:
+                    rows_with_anomalies = anomalies["row"].nunique()
                     st.warning(f"{rows_with_anomalies} rows contain anomalies ⚠️")
-                    st.dataframe(anomalies)
+                    st.caption("One line per flagged value. Score is how far the value lies outside the normal range of its column.")
+                    st.dataframe(anomalies, hide_index=True)
+                    if not streaming:
+                        with st.expander("Show flagged rows"):
+                            st.dataframe(rows_for(df_cleaned, anomalies))
                 
                     # Recommendation for Anomalies
                     st.markdown("""
@@ -597,10 +660,31 @@ elif menu == "Home":
                     rows_with_anomalies = 0
                     st.success("No anomalies detected ✅")
 
+            with tab4:
+                if near_duplicates is None:
+                    st.info("Near-duplicate detection is not available in streaming mode.")
+                elif not cleaning_options["do_near_duplicates"]:
+                    st.info("Tick \"Find near-duplicate records\" under Advanced Options to look for them.")
+                elif not near_duplicates.empty:
+                    groups = near_duplicates["group"].nunique()
+                    st.warning(f"{groups} groups of near-duplicate records found ({len(near_duplicates)} rows) ⚠️")
+                    st.caption("Rows of a group differ only slightly in the compared fields. "
+                               "Similarity is a row's average field similarity to the closest other row of its group.")
+                    if cleaning_options["near_duplicate_merge"]:
+                        st.caption("Each group was merged into its first row in the cleaned data.")
+                    st.dataframe(near_duplicates, hide_index=True)
+                else:
+                    st.success("No near-duplicate records found ✅")
+
             # Save cleaned stats
-            rows_after = int(len(df_cleaned))
-            nulls_after = int(df_cleaned.isnull().sum().sum())
-            duplicates_after = int(df_cleaned.duplicated().sum())
+            if streaming:
+                rows_after = report["rows_after"]
+                nulls_after = report["nulls_after"]
+                duplicates_after = report["duplicates_after"]
+            else:
+                rows_after = int(len(df_cleaned))
+                nulls_after = int(df_cleaned.isnull().sum().sum())
+                duplicates_after = reports["duplicates_after"]
             anomalies_count = rows_with_anomalies
 
             # Compute deltas
@@ -608,42 +692,19 @@ elif menu == "Home":
             delta_nulls = nulls_before - nulls_after
             delta_duplicates = duplicates_before - duplicates_after
 
-            # Save cleaning history if logged in
+            # Save cleaning history if logged in (written in the background, see db.py)
             if st.session_state["logged_in"]:
-                try:
-                    conn = sqlite3.connect(DB_PATH)
-                    c = conn.cursor()
-
-                    cleaning_options = {
-                        "fill_method": fill_method,
-                        "do_duplicates": st.session_state["do_duplicates"],
-                        "do_standardize_cols": st.session_state["do_standardize_cols"],
-                        "do_normalize_text": st.session_state["do_normalize_text"],
-                        "do_fix_dates": st.session_state["do_fix_dates"],
-                        "do_validate_emails": st.session_state["do_validate_emails"],
-                        "do_fuzzy_standardize": st.session_state["do_fuzzy_standardize"],
-                        "do_anomaly_detection": st.session_state["do_anomaly_detection"]
-                    }
-
-                    c.execute("""
-                        INSERT INTO cleaning_history 
-                        (user_email, filename, rows_before, rows_after, nulls_before, nulls_after, 
-                         duplicates_before, duplicates_after, anomalies_detected, cleaning_options)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """, (
-                        st.session_state["email"],
-                        uploaded_file.name,
-                        rows_before, rows_after,
-                        nulls_before, nulls_after,
-                        duplicates_before, duplicates_after,
-                        anomalies_count,
-                        str(cleaning_options)
-                    ))
-                    conn.commit()
-                except Exception as e:
-                    st.error(f"Failed to save history: {e}")
-                finally:
-                    conn.close()
+                db.record_history({
+                    "user_email": st.session_state["email"],
+                    "filename": uploaded_file.name,
+                    "rows_before": rows_before, "rows_after": rows_after,
+                    "nulls_before": nulls_before, "nulls_after": nulls_after,
+                    "duplicates_before": duplicates_before, "duplicates_after": duplicates_after,
+                    "anomalies_detected": anomalies_count,
+                    "cleaning_options": cleaning_options,
+                    "stage_metrics": stage_log,
+                    "profile_report": profile_text,
+                })
 
 
             # Display status text
@@ -699,10 +760,72 @@ elif menu == "Home":
                     st.markdown(status_text(anomalies_count, metric_type="bad"), unsafe_allow_html=True)
                     st.progress(anomalies_count / max(rows_after, 1))
 
+            if not streaming:
+                stats = result_stats()
+                outcome = "served from cache" if cached is not None else "computed and cached"
+                st.caption(f"Result cache: this result was {outcome}. {stats['hits']} hits, {stats['misses']} misses, "
+                           f"{stats['entries']} results ({stats['size_mb']} / {stats['max_mb']} MB)")
+
+            with st.expander("Pipeline Stages"):
+                st.caption("Time, throughput (input rows per second), peak memory growth and cells changed by "
+                           "each stage of this run. These are saved with the run in your Cleaning History.")
+                st.dataframe(stage_frame(stage_log), hide_index=True)
+                for stage, run in parallel.items():
+                    split = f" split into {run['partitions']} tasks" if run["partitions"] > run["columns"] else ""
+                    where = (f"{run['in_workers']} of them in {run['workers']} worker processes" if run["in_workers"]
+                             else "all in the app's process (too small to be worth shipping to workers)")
+                    st.caption(f"{stage.capitalize()} stage: {run['columns']} columns{split}, {where}. "
+                               f"{run['column_seconds']}s of column work in {run['wall_seconds']}s ({run['speedup']}x).")
+                    st.dataframe(pd.DataFrame(run["detail"]), hide_index=True)
+                if profile_text:
+                    st.download_button("📄 Download profile report", profile_text, file_name="profile_report.txt",
+                                       mime="text/plain", key="download_profile")
+                if not streaming:
+                    stats = stage_cache_stats()
+                    st.caption("Stage outputs are kept for each upload and set of options. When an option changes, "
+                               "only the stages from the first one that uses it are run again; the rest are cached. "
+                               f"Stage cache: {stats['hits']} hits, {stats['misses']} misses, "
+                               f"{stats['entries']} stage outputs ({stats['size_mb']} / {stats['max_mb']} MB)")
+
+            if fill_report:
+                with st.expander("Missing Values Report"):
+                    st.caption("Number of missing values fixed in each column that had any.")
+                    st.dataframe(pd.Series(fill_report, name="nulls fixed"))
+
+            if date_reports:
+                with st.expander("Date Parsing Report"):
+                    st.caption("Number of values in each date column that were parsed with each format.")
+                    st.dataframe(pd.DataFrame(date_reports).transpose())
+
+            if text_reports:
+                with st.expander("Text Transform Report"):
+                    st.caption("Text steps run once per distinct value. Speedup is measured against "
+                               "running the same step on every row (timed on a sample).")
+                    st.dataframe(report_frame(text_reports), hide_index=True)
+
             # Step 4: Download
             st.subheader("📥 Step 4: Save")
-            csv = df_cleaned.to_csv(index=False).encode("utf-8")
-            st.download_button("Download Cleaned CSV", csv, "cleaned_data.csv", "text/csv")
+            # Built only when the button is clicked, in a temp file of its own (chunk by chunk in
+            # streaming mode) that is deleted once it has been read back for the download
+            label, mime = EXPORT_FORMATS[export_format]
+
+            def export_file(df_cleaned=df_cleaned, export_format=export_format,
+                            source=out_path if streaming else None):
+                if source is not None and export_format == "csv":
+                    with open(source, "rb") as f:
+                        return f.read()
+                path = temp_path(f".{export_format}")
+                try:
+                    if source is None:
+                        write_frame(df_cleaned, export_format, path)
+                    else:
+                        export_stream(source, export_format, path)
+                    with open(path, "rb") as f:
+                        return f.read()
+                finally:
+                    remove_file(path)
+
+            st.download_button(f"Download Cleaned {label}", export_file, f"cleaned_data.{export_format}", mime)
 
     else:
-        st.info(" Upload a CSV file in the sidebar to get started!")
+        st.info(" Upload a dataset in the sidebar to get started!")
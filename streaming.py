@@ -0,0 +1,506 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Streaming cleaning pipeline for Raw to Ready.
+
+The in-memory path holds the parsed upload plus several cleaned copies of it,
+so files bigger than the container's memory cannot be cleaned there. Here the
+CSV is read in chunks and written back out chunk by chunk:
+
+1. A scan pass works out a dtype for every column that is the same in every
+   chunk, and the statistics the fills need (mean, median, mode).
+2. The clean pass applies the row-local steps (fills, normalize, dates, emails,
+   column names) to each chunk and drops rows whose fingerprint was already seen.
+3. If fuzzy standardization is on, the clean pass writes to a spool file while
+   counting text values; the mappings are built from those counts and a third
+   pass maps the spool into the output.
+4. If anomaly detection is on, the output is read back once to flag outliers.
+   The z-score uses exact running moments; the robust methods use medians and
+   quartiles of a sample of each column (exact up to MEDIAN_SAMPLE values).
+5. Downloads in another format are converted from the output chunk by chunk
+   (export_stream).
+
+Peak memory depends on the chunk size, not the file size. The exceptions are
+the row fingerprints used for duplicates (8 bytes per distinct row), the mode
+and fuzzy value counts (one entry per distinct value of the affected columns)
+and the median sample, which is capped at MEDIAN_SAMPLE values per column.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from cleaning import DEFAULT_OPTIONS, clean_text_columns, duplicate_keys, standardize_column_names
+from fuzzy_engine import build_mapping, CUTOFF
+from missing_engine import FILL_VALUE
+from anomaly_engine import METHODS, RESULT_COLUMNS, fit, flag
+from text_engine import TextColumn, merge_stats
+from file_formats import CSV_FORMATS, ChunkWriter, arrow_schema, compress_file, open_csv
+from instrument import measure
+
+CHUNK_ROWS = int(os.environ.get("RAWTOREADY_CHUNK_ROWS", "100000"))
+MEDIAN_SAMPLE = 1_000_000
+
+# read_csv settings for reading back our own output: "N/A" is a fill value, not a null
+_REREAD = {"keep_default_na": False, "na_values": [""]}
+
+
+class FingerprintSet:
+    """
+    Set of 64-bit row hashes, kept as a few sorted numpy arrays (8 bytes per row).
+
+    Arrays are merged like a binary counter, so there are at most log2(n) of them
+    and every hash is merged O(log n) times.
+    """
+
+    def __init__(self):
+        self.levels = []
+
+    def __len__(self):
+        return sum(len(level) for level in self.levels)
+
+    def add(self, hashes):
+        """Add hashes and return a mask of the ones not seen before (repeats within the batch count once)."""
+        new = ~pd.Series(hashes).duplicated().to_numpy()
+        for level in self.levels:
+            pos = np.searchsorted(level, hashes).clip(max=len(level) - 1)
+            new &= level[pos] != hashes
+        if new.any():
+            self.levels.append(np.sort(hashes[new]))
+            while len(self.levels) > 1 and len(self.levels[-2]) <= len(self.levels[-1]):
+                top = self.levels.pop()
+                self.levels[-1] = np.sort(np.concatenate([self.levels[-1], top]))
+        return new
+
+
+def row_fingerprints(chunk, columns=None):
+    """
+    64-bit hash per row of its values (of columns, default all) as text, so the
+    dtype a chunk was parsed with doesn't matter.
+    """
+    if columns is not None:
+        chunk = chunk[columns]
+    return pd.util.hash_pandas_object(chunk.astype(str), index=False).to_numpy()
+
+
+class RunningMoments:
+    """Count, mean and sum of squared deviations per column, merged chunk by chunk (Chan et al.)."""
+
+    def __init__(self):
+        self.n = pd.Series(dtype=float)
+        self.mean = pd.Series(dtype=float)
+        self.m2 = pd.Series(dtype=float)
+
+    def update(self, block):
+        n_b = block.count().astype(float)
+        mean_b = block.mean()
+        m2_b = ((block - mean_b) ** 2).sum()
+        n_a = self.n.reindex(n_b.index, fill_value=0.0)
+        mean_a = self.mean.reindex(n_b.index, fill_value=0.0)
+        m2_a = self.m2.reindex(n_b.index, fill_value=0.0)
+        n = n_a + n_b
+        delta = (mean_b.fillna(0.0) - mean_a)
+        safe_n = n.where(n > 0, 1.0)
+        mean = mean_a + delta * n_b / safe_n
+        m2 = m2_a + m2_b + delta ** 2 * n_a * n_b / safe_n
+        self.n = n.combine_first(self.n)
+        self.mean = mean.combine_first(self.mean)
+        self.m2 = m2.combine_first(self.m2)
+
+    def std(self):
+        """Sample standard deviation (ddof=1), like Series.std()."""
+        return np.sqrt(self.m2 / (self.n - 1).where(self.n > 1))
+
+
+class ColumnSample:
+    """
+    Uniform sample of up to `size` values per numeric column, merged chunk by chunk.
+
+    Bottom-k random keys: every value gets a random key and the `size` smallest
+    keys are kept, so the sample is exact while a column has fewer values.
+    """
+
+    def __init__(self, size=MEDIAN_SAMPLE, seed=0):
+        self.size = size
+        self.rng = np.random.default_rng(seed)
+        self.samples = {}     # column -> (keys, values)
+
+    def update(self, numeric):
+        for col in numeric.columns:
+            values = numeric[col].dropna().to_numpy(dtype=float)
+            keys = self.rng.random(len(values))
+            if col in self.samples:
+                keys = np.concatenate([self.samples[col][0], keys])
+                values = np.concatenate([self.samples[col][1], values])
+            if len(values) > self.size:
+                keep = np.argpartition(keys, self.size)[:self.size]
+                keys, values = keys[keep], values[keep]
+            self.samples[col] = (keys, values)
+
+    def values(self, col):
+        return self.samples[col][1] if col in self.samples else np.empty(0)
+
+
+def _read(source, chunksize, **kwargs):
+    source, csv_kwargs = open_csv(source)
+    return pd.read_csv(source, chunksize=chunksize, **csv_kwargs, **kwargs)
+
+
+def _note_kinds(chunk, chunk_nulls, kinds):
+    """Record the dtype kind of every column of chunk that has a value in it."""
+    for col in chunk.columns:
+        if chunk_nulls[col] < len(chunk):
+            kinds.setdefault(col, set()).add(chunk[col].dtype.kind)
+
+
+def _plan_dtypes(kinds, nulls):
+    """The dtype each column would get if the whole file were parsed at once."""
+    dtypes = {}
+    for col in nulls.index:
+        col_kinds = kinds.get(col, set())
+        if not col_kinds or col_kinds <= {"f"}:
+            dtypes[col] = "float64"
+        elif col_kinds <= {"i", "u"} and nulls[col] == 0:
+            dtypes[col] = "int64"
+        elif col_kinds <= {"i", "u", "f"}:
+            dtypes[col] = "float64"
+        elif col_kinds == {"b"} and nulls[col] == 0:
+            dtypes[col] = "bool"
+        else:
+            dtypes[col] = "object"
+    return dtypes
+
+
+def scan(source, chunksize=CHUNK_ROWS, fill_method="Fill with N/A"):
+    """
+    First pass: column dtypes and the statistics the fill step needs.
+
+    Returns {"rows", "nulls", "null_columns", "null_counts", "dtypes", "fill_values"}. dtypes
+    maps each column to the dtype the whole file would have been parsed with,
+    so every chunk of the clean pass is read the same way.
+    """
+    rows = 0
+    nulls = None
+    kinds = {}
+    moments = RunningMoments()
+    sample = ColumnSample()
+    for chunk in _read(source, chunksize):
+        rows += len(chunk)
+        chunk_nulls = chunk.isnull().sum()
+        nulls = chunk_nulls if nulls is None else nulls.add(chunk_nulls, fill_value=0)
+        _note_kinds(chunk, chunk_nulls, kinds)
+
+        numeric = chunk.select_dtypes(include=[np.number])
+        if fill_method == "Fill with Mean":
+            moments.update(numeric)
+        elif fill_method == "Fill with Median":
+            sample.update(numeric)
+
+    nulls = pd.Series(dtype=int) if nulls is None else nulls.astype(int)
+    dtypes = _plan_dtypes(kinds, nulls)
+
+    null_columns = [c for c in nulls.index if nulls[c] > 0]
+    fill_values = {}
+    numeric_cols = [c for c, d in dtypes.items() if d in ("int64", "float64") and kinds.get(c)]
+    if fill_method == "Fill with Mean":
+        fill_values = moments.mean.reindex(numeric_cols).dropna().to_dict()
+    elif fill_method == "Fill with Median":
+        fill_values = {c: float(np.median(sample.values(c))) for c in numeric_cols if len(sample.values(c))}
+    elif fill_method == "Fill by most common":
+        fill_values = _modes(source, chunksize, dtypes, null_columns)
+    return {"rows": rows, "nulls": int(nulls.sum()), "null_columns": null_columns,
+            "null_counts": nulls[null_columns].to_dict(), "dtypes": dtypes, "fill_values": fill_values}
+
+
+def _modes(source, chunksize, dtypes, columns):
+    """Most common value of each column (smallest on ties, like Series.mode()[0]), merged from per-chunk counts."""
+    if not columns:
+        return {}
+    counts = {}
+    for chunk in _read(source, chunksize, dtype=dtypes, usecols=columns):
+        for col in columns:
+            vc = chunk[col].value_counts()
+            counts[col] = vc if col not in counts else counts[col].add(vc, fill_value=0)
+    modes = {}
+    for col, vc in counts.items():
+        if len(vc):
+            top = vc[vc == vc.max()].index
+            modes[col] = sorted(top)[0]
+    return modes
+
+
+def fill_chunk(chunk, method, fill_values):
+    """fill_missing for one chunk, using file-wide statistics from scan()."""
+    if method == "Drop Rows":
+        return chunk.dropna()
+    if method == "Fill with N/A":
+        return chunk.fillna(FILL_VALUE)
+    return chunk.fillna({col: val for col, val in fill_values.items() if col in chunk.columns})
+
+
+def text_columns_after_fill(stats, options):
+    """
+    Columns that are object dtype in the whole (filled) file, i.e. the ones the text steps touch.
+
+    A chunk can't tell on its own: a numeric column with nulls anywhere in the
+    file becomes text once "N/A" is filled in, even in chunks without nulls.
+    """
+    cols = [c for c, d in stats["dtypes"].items() if d == "object"]
+    if options.get("fill_method", "Fill with N/A") == "Fill with N/A":
+        cols += [c for c in stats["null_columns"] if c not in cols]
+    if options.get("do_standardize_cols"):
+        return standardize_column_names(cols)
+    return cols
+
+
+def clean_chunk(chunk, options, text_cols, date_reports, text_reports, workers=1):
+    """
+    The row-local steps, in the same order as the app, applied to one (already filled and deduplicated) chunk.
+
+    Its text columns are cleaned on up to workers processes (see cleaning.clean_text_columns).
+
+    Fuzzy matching needs the whole file's value counts, so it is left to clean_csv_stream.
+    """
+    if options.get("do_standardize_cols"):
+        chunk.columns = standardize_column_names(chunk.columns)
+
+    dates, texts, _, _ = clean_text_columns(chunk, options, text_cols, workers)
+    for col, report in dates.items():
+        totals = date_reports.setdefault(col, {})
+        for key, count in report.items():
+            totals[key] = totals.get(key, 0) + count
+    for col, stats in texts.items():
+        merge_stats(text_reports.setdefault(col, {}), stats)
+    return chunk
+
+
+def strip_counts(series):
+    """Row counts of the stripped text of series, with the string work done once per distinct value."""
+    vc = series.value_counts(dropna=False)
+    return vc.groupby(vc.index.astype(str).str.strip()).sum()
+
+
+class OutputStats:
+    """Stats of the final output, gathered as each chunk is written."""
+
+    def __init__(self, anomaly_method=None, keys=None):
+        self.rows = 0
+        self.nulls = 0
+        self.fingerprints = FingerprintSet()
+        self.keys = keys   # columns duplicates are counted on (None: whole rows)
+        self.anomaly_method = anomaly_method
+        self.moments = RunningMoments() if anomaly_method == "zscore" else None
+        self.sample = ColumnSample() if anomaly_method in ("mad", "iqr") else None
+        self.seen_numeric = []
+        self.non_numeric = set()
+
+    def update(self, chunk):
+        self.rows += len(chunk)
+        self.nulls += int(chunk.isnull().sum().sum())
+        self.fingerprints.add(row_fingerprints(chunk, self.keys))
+        if self.anomaly_method is not None:
+            numeric = chunk.select_dtypes(include=[np.number])
+            self.non_numeric.update(c for c in chunk.columns if c not in numeric.columns and chunk[c].notna().any())
+            self.seen_numeric += [c for c in numeric.columns if c not in self.seen_numeric]
+            if self.moments is not None:
+                self.moments.update(numeric)
+            else:
+                self.sample.update(numeric)
+
+    @property
+    def duplicates(self):
+        return self.rows - len(self.fingerprints)
+
+    def anomaly_params(self):
+        """(columns, lo, hi, scale) for the numeric columns of the whole output, as anomaly_engine.fit gives them."""
+        columns = [c for c in self.seen_numeric if c not in self.non_numeric]
+        if self.moments is not None:
+            lo = hi = self.moments.mean.reindex(columns).to_numpy()
+            scale = self.moments.std().reindex(columns).to_numpy()
+            scale = np.where(scale > 0, scale, np.nan)
+            return columns, lo, hi, scale
+        # Robust methods: medians and quartiles of each column's sample
+        params = [fit(self.sample.values(c)[:, None], self.anomaly_method) for c in columns]
+        lo, hi, scale = (np.array([p[i][0] for p in params], dtype=float) for i in range(3))
+        return columns, lo, hi, scale
+
+
+def _write(chunk, dest, first):
+    chunk.to_csv(dest, index=False, header=first, mode="w" if first else "a")
+
+
+def detect_anomalies_stream(path, columns, lo, hi, scale, threshold, chunksize=CHUNK_ROWS):
+    """
+    Flag values of the CSV at path that lie outside their column's band (see anomaly_engine).
+
+    Same long (row, column, value, score) table as cleaning.detect_anomalies,
+    with row being the row's position in the file.
+    """
+    found = []
+    offset = 0
+    if columns:
+        for chunk in _read(path, chunksize, usecols=columns, **_REREAD):
+            X = chunk[columns].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+            found.append(flag(X, columns, None, lo, hi, scale, threshold, row_offset=offset))
+            offset += len(chunk)
+    if not found:
+        return pd.DataFrame(columns=RESULT_COLUMNS)
+    result = pd.concat(found, ignore_index=True)
+    # Column by column, like the in-memory engine, rather than chunk by chunk
+    order = np.lexsort((result["row"].to_numpy(), pd.Index(columns).get_indexer(result["column"])))
+    return result.take(order).reset_index(drop=True)
+
+
+def clean_csv_stream(source, dest, options, chunksize=CHUNK_ROWS, canonicals=None, workers=1):
+    """
+    Clean a CSV (path or file object) chunk by chunk into the CSV at path dest.
+
+    options uses the same keys as the app's cleaning_options; canonicals and
+    workers are used like in cleaning.run_stages. Returns a report with the before/after
+    counts the Summary shows, the anomalies found, the per-column fill, date
+    parsing and text transform reports, the "canonical_updates" to save, and a
+    stage_log timing each pass over the data.
+    """
+    if options.get("do_anomaly_detection") and options.get("anomaly_group_by"):
+        raise ValueError("Grouped anomaly detection needs the whole file in memory; it is not available in streaming mode.")
+    if options.get("do_near_duplicates"):
+        raise ValueError("Near-duplicate detection needs the whole file in memory; it is not available in streaming mode.")
+    fill_method = options.get("fill_method", "Fill with N/A")
+    do_fuzzy = options.get("do_fuzzy_standardize")
+    canonicals = canonicals if options.get("fuzzy_dictionary") else None
+    anomaly_method = options.get("anomaly_method", "zscore") if options.get("do_anomaly_detection") else None
+
+    stage_log = []
+    with measure() as m:
+        stats = scan(source, chunksize, fill_method)
+    _log_pass(stage_log, "Scan (types and fill values)", stats["rows"], m)
+    dtypes = stats["dtypes"]
+    text_cols = set(text_columns_after_fill(stats, options))
+    # Dates and emails come out of their steps as text too, ahead of fuzzy matching
+    out_names = standardize_column_names(dtypes) if options.get("do_standardize_cols") else list(dtypes)
+    fuzzy_cols = set(text_cols)
+    if options.get("do_fix_dates"):
+        fuzzy_cols.update(c for c in out_names if "date" in c.lower())
+    if options.get("do_validate_emails"):
+        fuzzy_cols.update(c for c in out_names if "email" in c.lower())
+
+    keys = options.get("duplicate_keys") or None
+    before = FingerprintSet()
+    dedupe = FingerprintSet()
+    final = OutputStats(anomaly_method, duplicate_keys({**DEFAULT_OPTIONS, **options}))
+    date_reports = {}
+    text_reports = {}
+    fuzzy_counts = {}
+    canonical_updates = {}
+    spool = dest + ".spool" if do_fuzzy else dest
+    try:
+        first = True
+        with measure() as m:
+            for chunk in _read(source, chunksize, dtype=dtypes):
+                before.add(row_fingerprints(chunk, keys))
+                chunk = fill_chunk(chunk, fill_method, stats["fill_values"])
+                if options.get("do_duplicates"):
+                    chunk = chunk[dedupe.add(row_fingerprints(chunk, keys))]
+                chunk = clean_chunk(chunk, options, text_cols, date_reports, text_reports, workers)
+
+                if do_fuzzy:
+                    for col in chunk.columns:
+                        if col in fuzzy_cols:
+                            vc = strip_counts(chunk[col])
+                            fuzzy_counts[col] = vc if col not in fuzzy_counts else \
+                                fuzzy_counts[col].add(vc, fill_value=0)
+                else:
+                    final.update(chunk)
+                _write(chunk, spool, first)
+                first = False
+        _log_pass(stage_log, "Clean chunks", stats["rows"], m)
+
+        if first:   # empty file: still write the header
+            _write(pd.DataFrame(columns=list(dtypes)), dest, True)
+
+        if do_fuzzy and not first:
+            with measure() as m:
+                counts = {col: dict(zip(vc.index, vc.astype(int).to_numpy())) for col, vc in fuzzy_counts.items()}
+                mappings = {col: build_mapping(c, cutoff=CUTOFF,
+                                               known=None if canonicals is None else canonicals.index(col))
+                            for col, c in counts.items()}
+                if canonicals is not None:
+                    canonical_updates = {col: {value: (mappings[col][value], int(n)) for value, n in c.items()}
+                                         for col, c in counts.items()}
+                first = True
+                for chunk in _read(spool, chunksize, dtype={col: str for col in mappings}, **_REREAD):
+                    for col, mapping in mappings.items():
+                        column = TextColumn(chunk[col])
+                        column.apply("fuzzy", lambda u: u.astype(str).str.strip().map(mapping))
+                        chunk[col] = column.to_series()
+                        merge_stats(text_reports.setdefault(col, {}), column.stats)
+                    final.update(chunk)
+                    _write(chunk, dest, first)
+                    first = False
+            _log_pass(stage_log, "Fuzzy standardize", final.rows, m)
+    finally:
+        # The spool is only needed between the two passes, whether they finish or not
+        if spool != dest and os.path.exists(spool):
+            os.remove(spool)
+
+    if fill_method in ("Drop Rows", "Fill with N/A"):
+        fill_report = stats["null_counts"]
+    else:
+        fill_report = {col: n if col in stats["fill_values"] else 0 for col, n in stats["null_counts"].items()}
+
+    anomalies = pd.DataFrame(columns=RESULT_COLUMNS)
+    if anomaly_method is not None:
+        columns, lo, hi, scale = final.anomaly_params()
+        with measure() as m:
+            anomalies = detect_anomalies_stream(dest, columns, lo, hi, scale, METHODS[anomaly_method],
+                                                chunksize=chunksize)
+        _log_pass(stage_log, "Detect anomalies", final.rows, m)
+
+    return {
+        "rows_before": stats["rows"],
+        "rows_after": final.rows,
+        "nulls_before": stats["nulls"],
+        "nulls_after": final.nulls,
+        "duplicates_before": stats["rows"] - len(before),
+        "duplicates_after": final.duplicates,
+        "anomalies": anomalies,
+        "fill_report": fill_report,
+        "date_reports": date_reports,
+        "text_reports": text_reports,
+        "canonical_updates": canonical_updates,
+        "stage_log": stage_log,
+    }
+
+
+def _log_pass(stage_log, label, rows, m):
+    """Add a pass to the report's stage_log, shaped like cleaning.run_stages' rows (cells changed are not counted)."""
+    stage_log.append({"stage": label, "status": "computed", "rows": rows, "seconds": round(m["seconds"], 4),
+                      "rows_per_sec": round(rows / m["seconds"]) if m["seconds"] else None,
+                      "peak_mb": m["peak_mb"], "cells_changed": None})
+
+
+def export_stream(path, fmt, dest, chunksize=CHUNK_ROWS):
+    """
+    Convert the cleaned CSV at path to format fmt (see file_formats.EXPORT_FORMATS) at dest, chunk by chunk.
+
+    CSV formats are a block-by-block copy. Parquet and Feather need one type for
+    each column across the whole file, so a first pass works the types out the
+    same way scan() does and the second pass writes every chunk with them.
+    """
+    if fmt in CSV_FORMATS:
+        compress_file(path, fmt, dest)
+        return
+    kinds, nulls = {}, None
+    for chunk in _read(path, chunksize, **_REREAD):
+        chunk_nulls = chunk.isnull().sum()
+        nulls = chunk_nulls if nulls is None else nulls.add(chunk_nulls, fill_value=0)
+        _note_kinds(chunk, chunk_nulls, kinds)
+    if nulls is None:   # header only
+        nulls = pd.Series(0, index=pd.read_csv(path, nrows=0).columns)
+    dtypes = _plan_dtypes(kinds, nulls)
+    empty = pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in dtypes.items()})
+    with ChunkWriter(fmt, dest, arrow_schema(empty)) as writer:
+        for chunk in _read(path, chunksize, dtype=dtypes, **_REREAD):
+            writer.write(chunk)
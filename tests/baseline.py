@@ -0,0 +1,116 @@
+"""
+The cleaning helpers and pipeline as they were in sprint5.py before the engines
+replaced them, kept as the reference the engines are tested against.
+
+The only change is fill_missing assigning each filled column back instead of
+the chained fillna(..., inplace=True), which does nothing under copy-on-write.
+"""
+
+import difflib
+import re
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+
+def standardize_dates(series):
+    def parse_date(x):
+        for fmt in ("%Y-%m-%d", "%d/%m/%y", "%d/%m/%Y", "%b %d, %Y", "%Y.%m.%d"):
+            try:
+                return datetime.strptime(str(x), fmt).strftime("%Y-%m-%d")
+            except:
+                continue
+        return x
+    return series.apply(parse_date)
+
+
+def normalize_text(series, col_name=""):
+    if "email" in col_name.lower():
+        return series
+    return series.astype(str).str.strip().str.lower().str.title()
+
+
+def validate_emails(series):
+    return series.apply(lambda x: x if re.match(r"[^@]+@[^@]+\.[^@]+", str(x)) else "invalid@example.com")
+
+
+def fill_missing(df, method="Fill with N/A"):
+    df_copy = df.copy()
+    for col in df_copy.columns:
+        if df_copy[col].isnull().sum() > 0:
+            if method == "Drop Rows":
+                df_copy.dropna(inplace=True)
+            elif method == "Fill with N/A":
+                df_copy[col] = df_copy[col].fillna("N/A")
+            elif method == "Fill with Mean" and pd.api.types.is_numeric_dtype(df_copy[col]):
+                df_copy[col] = df_copy[col].fillna(df_copy[col].mean())
+            elif method == "Fill with Median" and pd.api.types.is_numeric_dtype(df_copy[col]):
+                df_copy[col] = df_copy[col].fillna(df_copy[col].median())
+            elif method == "Fill by most common":
+                df_copy[col] = df_copy[col].fillna(df_copy[col].mode()[0])
+    return df_copy
+
+
+def fuzzy_standardize(series, cutoff=0.85):
+    series = series.astype(str).str.strip()
+    unique_vals = series.dropna().unique()
+    mapping = {}
+
+    for val in unique_vals:
+        match = difflib.get_close_matches(val, mapping.keys(), n=1, cutoff=cutoff)
+        if match:
+            mapping[val] = mapping[match[0]]
+        else:
+            mapping[val] = val
+    return series.map(mapping)
+
+
+def detect_anomalies(df, threshold=3):
+    anomalies = pd.DataFrame()
+    for col in df.select_dtypes(include=[np.number]).columns:
+        if df[col].std() == 0:  # avoid divide by zero
+            continue
+        z_scores = (df[col] - df[col].mean()) / df[col].std()
+        anomaly_mask = np.abs(z_scores) > threshold
+        if anomaly_mask.any():
+            col_anomalies = df[anomaly_mask].copy()
+            col_anomalies["Anomaly_Column"] = col
+            col_anomalies["Anomaly_Value"] = df[col][anomaly_mask]
+            anomalies = pd.concat([anomalies, col_anomalies])
+    return anomalies
+
+
+def clean(df, options):
+    """The Run Cleaning steps of the app, in its order; returns (df_cleaned, anomalies)."""
+    df_cleaned = df.copy()
+    df_cleaned = fill_missing(df_cleaned, method=options.get("fill_method", "Fill with N/A"))
+    if options.get("do_duplicates"):
+        df_cleaned.drop_duplicates(inplace=True)
+    if options.get("do_standardize_cols"):
+        df_cleaned.columns = [c.strip().lower().replace(" ", "_") for c in df_cleaned.columns]
+    if options.get("do_normalize_text"):
+        for col in df_cleaned.select_dtypes(include=["object"]).columns:
+            df_cleaned[col] = normalize_text(df_cleaned[col], col_name=col)
+    if options.get("do_fix_dates"):
+        for col in df_cleaned.columns:
+            if "date" in col.lower():
+                df_cleaned[col] = standardize_dates(df_cleaned[col])
+    if options.get("do_validate_emails"):
+        for col in df_cleaned.columns:
+            if "email" in col.lower():
+                df_cleaned[col] = validate_emails(df_cleaned[col])
+    if options.get("do_fuzzy_standardize"):
+        for col in df_cleaned.select_dtypes(include=["object"]).columns:
+            df_cleaned[col] = fuzzy_standardize(df_cleaned[col], cutoff=0.85)
+    anomalies = pd.DataFrame()
+    if options.get("do_anomaly_detection"):
+        anomalies = detect_anomalies(df_cleaned)
+    return df_cleaned, anomalies
+
+
+def anomaly_cells(anomalies):
+    """{(row, column, value)} flagged by the old detect_anomalies."""
+    if anomalies.empty:
+        return set()
+    return set(zip(anomalies.index, anomalies["Anomaly_Column"], anomalies["Anomaly_Value"]))
@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# The modules live at the repository root, next to sprint5.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Never let a test touch users.db or the shared result cache
+os.environ.setdefault("RAWTOREADY_DB", os.path.join(tempfile.mkdtemp(), "users.db"))
+os.environ.setdefault("RAWTOREADY_RESULT_CACHE", tempfile.mkdtemp())
@@ -0,0 +1,77 @@
+"""anomaly_engine (user-007, grouped: user-008) against the old detect_anomalies."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import baseline
+from anomaly_engine import RESULT_COLUMNS, detect_anomalies, rows_for
+
+
+def _cells(anomalies):
+    return set(zip(anomalies["row"], anomalies["column"], anomalies["value"]))
+
+
+def _frame(rows=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({"Amount": rng.normal(100, 10, rows), "Units": rng.integers(1, 10, rows),
+                       "Score": rng.normal(0, 1, rows), "Segment": rng.choice(["a", "b", "c"], rows),
+                       "Constant": 7.0, "Empty": np.nan},
+                      index=pd.RangeIndex(rows) * 3)   # labels, not positions
+    df.loc[df.index[::97], "Amount"] = 500.0
+    df.loc[df.index[::131], "Units"] = 90
+    df.loc[df.index[::50], "Score"] = np.nan
+    return df
+
+
+def test_zscore_matches_baseline():
+    df = _frame()
+    anomalies = detect_anomalies(df)
+    assert list(anomalies.columns) == RESULT_COLUMNS
+    assert _cells(anomalies) == baseline.anomaly_cells(baseline.detect_anomalies(df))
+    assert len(anomalies) == len(_cells(anomalies))   # one entry per cell, even for rows flagged twice
+
+
+def test_rows_for_returns_flagged_rows_once():
+    df = _frame()
+    rows = rows_for(df, detect_anomalies(df))
+    assert rows.index.is_unique
+    assert set(rows.index) == set(baseline.detect_anomalies(df).index)
+
+
+@pytest.mark.parametrize("method", ["mad", "iqr"])
+def test_robust_methods(method):
+    df = _frame()[["Amount", "Units"]]
+    expected = set()
+    for col in df.columns:
+        x = df[col]
+        if method == "mad":
+            median = x.median()
+            z = (x - median) / ((x - median).abs().median() / 0.6745)
+            flagged = z.abs() > 3.5
+        else:
+            q1, q3 = x.quantile([0.25, 0.75])
+            flagged = (x < q1 - 1.5 * (q3 - q1)) | (x > q3 + 1.5 * (q3 - q1))
+        expected |= {(row, col, value) for row, value in x[flagged].items()}
+    assert _cells(detect_anomalies(df, method=method)) == expected
+
+
+def test_group_by_scores_each_group_on_its_own():
+    df = _frame()
+    expected = set()
+    for _, group in df.groupby("Segment"):
+        expected |= baseline.anomaly_cells(baseline.detect_anomalies(group))
+    assert _cells(detect_anomalies(df, group_by=["Segment"])) == expected
+
+
+def test_empty_and_non_numeric_frames():
+    assert detect_anomalies(_frame().iloc[:0]).empty
+    assert detect_anomalies(pd.DataFrame({"City": ["a", "b"]})).empty
+    assert detect_anomalies(pd.DataFrame({"Empty": [np.nan, np.nan, np.nan]})).empty
+
+
+def test_arrow_dtypes():
+    df = _frame().drop(columns="Segment")
+    arrow = df.convert_dtypes(dtype_backend="pyarrow")
+    assert _cells(detect_anomalies(arrow)) == _cells(detect_anomalies(df))
+
@@ -0,0 +1,69 @@
+"""batch_clean (user-005)."""
+
+import os
+
+import pandas as pd
+import pytest
+
+from batch_clean import find_inputs, parse_recipe, run_batch
+from benchmarks.dirty_data import make_dirty_frame
+from cleaning import DEFAULT_OPTIONS, clean_frame
+
+RECIPE = {"fill_method": "Fill with Median", "do_duplicates": True, "do_normalize_text": True}
+
+
+def test_parse_recipe_json_and_dict_literal(tmp_path):
+    expected = {**DEFAULT_OPTIONS, **RECIPE}
+    assert parse_recipe('{"fill_method": "Fill with Median", "do_duplicates": true, "do_normalize_text": true}') \
+        == expected
+    # As shown in the old cleaning history: str() of the options dict
+    assert parse_recipe(str(RECIPE)) == expected
+    path = tmp_path / "recipe.json"
+    path.write_text('{"do_duplicates": true}')
+    assert parse_recipe(str(path)) == {**DEFAULT_OPTIONS, "do_duplicates": True}
+    assert parse_recipe("{}") == DEFAULT_OPTIONS
+
+
+@pytest.mark.parametrize("text", ['{"do_dedupe": true}', '{"fill_method": "Fill with zero"}', '["fill_method"]',
+                                  '{"anomaly_method": "magic"}', '{"anomaly_group_by": "City"}'])
+def test_parse_recipe_rejects_bad_options(text):
+    with pytest.raises(ValueError):
+        parse_recipe(text)
+
+
+def test_find_inputs(tmp_path):
+    for name in ["b.csv", "a.CSV.GZ", "c.parquet", "d.feather", "e.csv.zst", "notes.txt", "x.xlsx"]:
+        (tmp_path / name).touch()
+    found = find_inputs([str(tmp_path), "elsewhere.csv"])
+    assert [os.path.basename(f) for f in found] == ["a.CSV.GZ", "b.csv", "c.parquet", "d.feather", "e.csv.zst",
+                                                   "elsewhere.csv"]
+
+
+def test_run_batch_reports_bad_files_and_cleans_the_rest(tmp_path):
+    df = make_dirty_frame(500)
+    good = tmp_path / "orders.csv"
+    df.to_csv(good, index=False)
+    broken = tmp_path / "broken.parquet"
+    broken.write_bytes(b"not parquet")
+    missing = tmp_path / "missing.csv"
+    out_dir = tmp_path / "out"
+    options = parse_recipe(str(RECIPE))
+    rows = run_batch([str(missing), str(good), str(broken)], str(out_dir), options, workers=2)
+
+    assert [row["file"] for row in rows] == [str(missing), str(good), str(broken)]
+    assert rows[0]["error"].startswith("FileNotFoundError") and rows[0]["mb"] is None
+    assert "error" in rows[2]
+    expected, _, _ = clean_frame(pd.read_csv(good), options)
+    assert rows[1]["rows_before"] == 500 and rows[1]["rows_after"] == len(expected)
+    pd.testing.assert_frame_equal(pd.read_csv(out_dir / "orders_cleaned.csv"),
+                                  pd.read_csv(pd.io.common.StringIO(expected.to_csv(index=False))))
+
+
+def test_run_batch_streams_big_files(tmp_path):
+    df = make_dirty_frame(500)
+    source = tmp_path / "orders.csv"
+    df.to_csv(source, index=False)
+    rows = run_batch([str(source)], str(tmp_path / "out"), parse_recipe(str(RECIPE)), workers=1, streaming_mb=0,
+                     chunksize=100, fmt="parquet")
+    assert rows[0]["mode"] == "streaming" and "error" not in rows[0]
+    assert len(pd.read_parquet(tmp_path / "out" / "orders_cleaned.parquet")) == rows[0]["rows_after"]
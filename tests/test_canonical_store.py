@@ -0,0 +1,74 @@
+"""canonical_store (user-023): saved canonical values across runs."""
+
+import pandas as pd
+import pytest
+
+import canonical_store
+from canonical_store import SHARED, dictionary_scope, load_dictionary, save_updates, semantic
+from cleaning import clean_frame
+from db import Database
+
+FUZZY = {"do_fuzzy_standardize": True}
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(canonical_store, "_snapshots", {})
+    return Database(str(tmp_path / "users.db"))
+
+
+def _cities(counts):
+    return pd.DataFrame({"City": [city for city, n in counts.items() for _ in range(n)]})
+
+
+def _run(db, choice, scope, df):
+    """One app run with the dictionary choice of scope: clean, then save the run's values."""
+    options = {**FUZZY, "fuzzy_dictionary": choice}
+    cleaned, _, reports = clean_frame(df, options, canonicals=load_dictionary(db, scope))
+    save_updates(db, scope, reports["canonical_updates"])
+    return cleaned
+
+
+def test_semantic_and_scope():
+    assert semantic("Vendor Name") == semantic("vendor_name") == "vendor_name"
+    assert dictionary_scope("mine", "a@example.com") == "a@example.com"
+    assert dictionary_scope("mine") is None
+    assert dictionary_scope("shared", "a@example.com") == SHARED
+    assert dictionary_scope("") is None
+
+
+@pytest.mark.parametrize("choice", ["mine", "shared"])
+def test_first_canonical_wins_across_runs(db, choice):
+    scope = dictionary_scope(choice, "a@example.com")
+    first = _run(db, choice, scope, _cities({"Bostn": 5, "Boston": 2, "Chicago": 3}))
+    assert set(first["City"]) == {"Bostn", "Chicago"}
+    # On its own this run would pick "Boston"; the saved canonical is kept instead
+    assert set(clean_frame(_cities({"Boston": 9, "Bostn": 1}), FUZZY)[0]["City"]) == {"Boston"}
+    second = _run(db, choice, scope, _cities({"Boston": 9, "Bostn": 1, "Chicgo": 1}))
+    assert set(second["City"]) == {"Bostn", "Chicago"}
+    assert load_dictionary(db, scope).entries["city"] == {"Bostn": "Bostn", "Boston": "Bostn",
+                                                          "Chicago": "Chicago", "Chicgo": "Chicago"}
+    # The other scope learned nothing
+    other = SHARED if choice == "mine" else "a@example.com"
+    assert len(load_dictionary(db, other)) == 0
+
+
+def test_snapshot_reused_until_a_value_is_added(db):
+    save_updates(db, SHARED, {"City": {"Boston": ("Boston", 3)}})
+    snapshot = load_dictionary(db, SHARED)
+    assert load_dictionary(db, SHARED) is snapshot
+    assert snapshot.index("city") is snapshot.index("City")   # the index is built once
+    save_updates(db, SHARED, {"City": {"Boston": ("Boston", 4)}})   # only a row count changes
+    assert load_dictionary(db, SHARED) is snapshot
+    save_updates(db, SHARED, {"City": {"Bostn": ("Boston", 1)}})
+    fresh = load_dictionary(db, SHARED)
+    assert fresh is not snapshot and fresh.revision != snapshot.revision
+    assert fresh.entries == {"city": {"Boston": "Boston", "Bostn": "Boston"}}
+
+
+def test_columns_with_too_many_values_are_not_saved(db, monkeypatch):
+    monkeypatch.setattr(canonical_store, "DICTIONARY_MAX_VALUES", 3)
+    updates = {"Email": {f"user{i}@example.com": (f"user{i}@example.com", 1) for i in range(4)},
+               "City": {"Boston": ("Boston", 2), "Bostn": ("Boston", 1), "Denver": ("Denver", 1)}}
+    assert save_updates(db, SHARED, updates) == 3
+    assert set(load_dictionary(db, SHARED).entries) == {"city"}
@@ -0,0 +1,71 @@
+"""The cleaning library (user-005; Arrow-backed input: user-010) against the old pipeline of sprint5.py."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import baseline
+from benchmarks.dirty_data import make_dirty_frame
+from cleaning import FILL_METHODS, clean_frame
+
+ALL_STEPS = {"do_duplicates": True, "do_standardize_cols": True, "do_normalize_text": True, "do_fix_dates": True,
+             "do_validate_emails": True, "do_anomaly_detection": True}
+
+
+def _anomaly_cells(anomalies):
+    return set(zip(anomalies["row"], anomalies["column"], anomalies["value"]))
+
+
+@pytest.mark.parametrize("fill_method", FILL_METHODS)
+def test_matches_baseline_pipeline(fill_method):
+    df = make_dirty_frame(3000)
+    options = {**ALL_STEPS, "fill_method": fill_method}
+    df_cleaned, anomalies, reports = clean_frame(df, options)
+    expected, expected_anomalies = baseline.clean(df, options)
+    pd.testing.assert_frame_equal(df_cleaned, expected)
+    assert _anomaly_cells(anomalies) == baseline.anomaly_cells(expected_anomalies)
+    assert reports["duplicates_before"] == int(df.duplicated().sum())
+    assert reports["duplicates_after"] == int(expected.duplicated().sum())
+
+
+def test_fuzzy_matches_baseline_when_the_most_common_spelling_comes_first():
+    # The engine picks the most common spelling of a cluster, the old loop the first one seen
+    df = pd.DataFrame({"City": ["Boston", "Boston", "Bostn", "Chicago", "chicago ", "Chicag0"],
+                       "Status": ["Shipped", "Shipped", "Shiped", "Pending", "Pending", "Pendng"],
+                       "Amount": [1.0, 2.0, np.nan, 4.0, 5.0, 6.0]})
+    options = {"do_normalize_text": True, "do_fuzzy_standardize": True}
+    df_cleaned, _, _ = clean_frame(df, options)
+    pd.testing.assert_frame_equal(df_cleaned, baseline.clean(df, options)[0])
+
+
+def test_input_frame_untouched():
+    df = make_dirty_frame(500)
+    before = df.copy()
+    clean_frame(df, {**ALL_STEPS, "do_fuzzy_standardize": True})
+    pd.testing.assert_frame_equal(df, before)
+
+
+def test_empty_and_all_null_frames():
+    empty = make_dirty_frame(10).iloc[:0]
+    df_cleaned, anomalies, _ = clean_frame(empty, {**ALL_STEPS, "do_fuzzy_standardize": True})
+    assert df_cleaned.empty and anomalies.empty
+    nulls = pd.DataFrame({"Name": [None, None, None], "Order Date": [np.nan] * 3, "Amount": [np.nan] * 3})
+    for method in FILL_METHODS:
+        options = {**ALL_STEPS, "do_fuzzy_standardize": True, "do_near_duplicates": True, "fill_method": method}
+        _, anomalies, _ = clean_frame(nulls, options)
+        assert anomalies.empty
+
+
+def test_arrow_input_matches_numpy_input():
+    df = make_dirty_frame(1000)
+    # Floats stay floats: "1.0" and "1" are different text once normalized
+    arrow = df.convert_dtypes(dtype_backend="pyarrow", convert_integer=False)
+    options = {**ALL_STEPS, "do_fuzzy_standardize": True}
+    expected, expected_anomalies, _ = clean_frame(df, options)
+    df_cleaned, anomalies, _ = clean_frame(arrow, options)
+    assert df_cleaned.shape == expected.shape
+    for col in expected.columns:
+        got = [None if pd.isna(v) else v for v in df_cleaned[col].astype(object)]
+        want = [None if pd.isna(v) else v for v in expected[col].astype(object)]
+        assert got == want, col
+    assert _anomaly_cells(anomalies) == _anomaly_cells(expected_anomalies)
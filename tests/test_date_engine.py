@@ -0,0 +1,48 @@
+"""date_engine (user-001) against the old strptime loop."""
+
+import numpy as np
+import pandas as pd
+
+import baseline
+from benchmarks.dirty_data import make_dirty_frame
+from date_engine import SLOW_PATH, UNPARSED, standardize_dates
+
+
+def test_matches_baseline_on_dirty_dates():
+    series = make_dirty_frame(5000)["Order Date"]
+    pd.testing.assert_series_equal(standardize_dates(series), baseline.standardize_dates(series).astype(object))
+
+
+def test_edge_values_match_baseline():
+    series = pd.Series(["2024-02-29", "2023-02-29", "31/12/99", "31/12/1999", "Jan 05, 2021", "2021.01.05",
+                        "2021-1-5", " 2021-01-05", "", "not a date", None, np.nan, 20210105, "0001-01-01"],
+                       dtype=object)
+    pd.testing.assert_series_equal(standardize_dates(series), baseline.standardize_dates(series))
+
+
+def test_report_counts_rows():
+    series = pd.Series(["2021-01-05", "2021-01-05", "05/01/21", "soon", None])
+    _, report = standardize_dates(series, return_report=True)
+    assert report["%Y-%m-%d"] == 2 and report["%d/%m/%y"] == 1
+    assert report[UNPARSED] == 2
+    assert sum(n for key, n in report.items() if key != SLOW_PATH) == len(series)
+
+
+def test_weights_count_rows_of_uniques():
+    uniques = pd.Series(["2021-01-05", "soon"])
+    _, report = standardize_dates(uniques, return_report=True, weights=np.array([3, 2]))
+    assert report["%Y-%m-%d"] == 3 and report[UNPARSED] == 2
+
+
+def test_empty_and_all_null():
+    empty = pd.Series([], dtype=object)
+    assert standardize_dates(empty).empty
+    nulls = pd.Series([np.nan, np.nan], dtype=object)
+    # apply() infers float64 for the unchanged nulls; the values are the same
+    pd.testing.assert_series_equal(standardize_dates(nulls), baseline.standardize_dates(nulls), check_dtype=False)
+
+
+def test_arrow_strings():
+    series = pd.Series(["2021-01-05", "05/01/21", None, "soon"], dtype="string[pyarrow]")
+    expected = baseline.standardize_dates(series.astype(object))
+    assert standardize_dates(series).tolist() == expected.tolist()
@@ -0,0 +1,165 @@
+"""db (user-012, history pages and summary: user-013), upgrading a database the old app created."""
+
+import json
+import sqlite3
+import threading
+
+import pytest
+
+import db as db_module
+from db import MIGRATIONS, Database
+
+BASELINE_SCHEMA = """
+CREATE TABLE users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT UNIQUE,
+    email TEXT UNIQUE,
+    password_hash TEXT
+);
+CREATE TABLE cleaning_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_email TEXT,
+    filename TEXT,
+    rows_before INTEGER,
+    rows_after INTEGER,
+    nulls_before INTEGER,
+    nulls_after INTEGER,
+    duplicates_before INTEGER,
+    duplicates_after INTEGER,
+    anomalies_detected INTEGER,
+    cleaning_options TEXT,
+    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+
+def _run(email="a@example.com", filename="orders.csv", **options):
+    return {"user_email": email, "filename": filename, "rows_before": 10, "rows_after": 8, "nulls_before": 3,
+            "nulls_after": 0, "duplicates_before": 2, "duplicates_after": 0, "anomalies_detected": 1,
+            "cleaning_options": {"fill_method": "Fill with N/A", **options}}
+
+
+@pytest.fixture
+def db(tmp_path):
+    return Database(str(tmp_path / "users.db"))
+
+
+def test_upgrades_a_baseline_database(tmp_path):
+    path = str(tmp_path / "users.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.execute("INSERT INTO users (username, email, password_hash) VALUES ('a', 'a@example.com', 'h')")
+    # The old app saved str(dict) of the options
+    conn.execute("INSERT INTO cleaning_history (user_email, filename, rows_before, cleaning_options) VALUES (?, ?, ?, ?)",
+                 ("a@example.com", "old.csv", 5, str({"fill_method": "Drop Rows", "do_duplicates": True})))
+    conn.execute("INSERT INTO cleaning_history (user_email, filename, cleaning_options) VALUES (?, ?, ?)",
+                 ("a@example.com", "broken.csv", "{not python"))
+    conn.commit()
+    conn.close()
+
+    db = Database(path)
+    assert db.find_user("a@example.com", "h") is not None
+    page, cursor = db.history_page("a@example.com")
+    assert cursor is None and sorted(page["filename"]) == ["broken.csv", "old.csv"]
+    options = {row.filename: json.loads(row.cleaning_options) for row in page.itertuples()}
+    assert options["old.csv"] == {"fill_method": "Drop Rows", "do_duplicates": True}
+    assert options["broken.csv"] == {"unparsed": "{not python"}
+    filtered, _ = db.history_page("a@example.com", filters={"fill_method": "Drop Rows"})
+    assert filtered["filename"].tolist() == ["old.csv"]
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == len(MIGRATIONS)
+
+
+def _baseline_db(path):
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.close()
+
+
+def test_concurrent_migrations_run_each_step_once(tmp_path):
+    # Like the app and batch_clean opening an old database at the same time
+    path = str(tmp_path / "users.db")
+    _baseline_db(path)
+    databases = [Database(path) for _ in range(6)]
+    start, errors = threading.Barrier(len(databases)), []
+
+    def migrate(database):
+        start.wait()
+        try:
+            database.migrate()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=migrate, args=(database,)) for database in databases]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == len(MIGRATIONS)
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(cleaning_history)")]
+    assert columns.count("stage_metrics") == 1 and columns.count("profile_report") == 1
+
+
+def test_failed_migration_rolls_back(tmp_path, monkeypatch):
+    path = str(tmp_path / "users.db")
+    monkeypatch.setattr(db_module, "MIGRATIONS", MIGRATIONS + [
+        "CREATE TABLE half_done (x INTEGER); ALTER TABLE no_such_table ADD COLUMN y INTEGER;"])
+    database = Database(path)
+    with pytest.raises(sqlite3.OperationalError):
+        database.migrate()
+    assert not database._writer.in_transaction
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == len(MIGRATIONS)
+        assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'half_done'").fetchone() is None
+    monkeypatch.setattr(db_module, "MIGRATIONS", MIGRATIONS)
+    database.migrate()   # the lock and the connection are still usable
+    assert database.register_user("a", "a@example.com", "h")
+
+
+def test_users(db):
+    assert db.register_user("a", "a@example.com", "h")
+    assert not db.register_user("a", "other@example.com", "h")
+    assert not db.register_user("b", "a@example.com", "h")
+    assert db.find_user("a@example.com", "h")[1] == "a"
+    assert db.find_user("a@example.com", "wrong") is None
+
+
+def test_history_pages_and_summary(db):
+    for i in range(7):
+        db.record_history(_run(filename=f"f{i}.csv", do_duplicates=i % 2 == 0))
+    db.record_history(_run(email="b@example.com"))
+    seen, after = [], None
+    while True:
+        page, after = db.history_page("a@example.com", after=after, limit=3)
+        seen += page["filename"].tolist()
+        if after is None:
+            break
+    assert seen == [f"f{i}.csv" for i in reversed(range(7))]
+    totals, weekly = db.history_summary("a@example.com", filters={"do_duplicates": True})
+    assert totals == {"runs": 4, "rows_cleaned": 40, "nulls_fixed": 12, "duplicates_removed": 8,
+                      "anomalies_found": 4}
+    assert weekly["runs"].sum() == 4
+
+
+def test_rename_and_delete_only_own_runs(db):
+    db.record_history(_run())
+    db.flush()
+    record_id = int(db.history_page("a@example.com")[0]["id"].iloc[0])
+    db.rename_history(record_id, "b@example.com", "stolen.csv")
+    db.delete_history(record_id, "b@example.com")
+    assert db.history_page("a@example.com")[0]["filename"].tolist() == ["orders.csv"]
+    db.rename_history(record_id, "a@example.com", "renamed.csv")
+    assert db.history_page("a@example.com")[0]["filename"].tolist() == ["renamed.csv"]
+    db.delete_history(record_id, "a@example.com")
+    assert db.history_page("a@example.com")[0].empty
+
+
+def test_canonical_values_round_trip(db):
+    assert db.save_canonical_values("*", [("city", "Bostn", "Boston", 2), ("city", "Boston", "Boston", 9)]) == 2
+    # A saved value keeps its canonical; its row count only grows
+    assert db.save_canonical_values("*", [("city", "Bostn", "Boston!", 5), ("status", "Shiped", "Shipped", 1)]) == 1
+    assert db.canonical_count("*") == 3 and db.canonical_count("a@example.com") == 0
+    assert db.canonical_values("*") == [("city", "Boston", "Boston"), ("city", "Bostn", "Boston"),
+                                        ("status", "Shiped", "Shipped")]
@@ -0,0 +1,110 @@
+"""file_formats uploads and exports (user-011), streaming.export_stream."""
+
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from file_formats import EXPORT_FORMATS, ChunkWriter, arrow_schema, file_stem, read_upload, write_frame
+from streaming import _REREAD, export_stream
+
+FORMATS = list(EXPORT_FORMATS)
+
+
+def _frame(rows=50):
+    rng = np.random.default_rng(0)
+    amount = rng.normal(100, 10, rows).round(2).astype(object)
+    amount[::7] = "N/A"   # what "Fill with N/A" leaves in a numeric column
+    return pd.DataFrame({
+        "id": np.arange(rows),
+        "City": rng.choice(["Boston", "Chicago", "Zürich"], rows),
+        "Amount": amount,
+        "Score": np.where(np.arange(rows) % 5, rng.random(rows).round(4), np.nan),
+    })
+
+
+def _expected(df, fmt):
+    """df as the file in format fmt reads back: CSV re-infers types, Arrow formats stringify mixed columns."""
+    if fmt.startswith("csv"):
+        return pd.read_csv(io.BytesIO(df.to_csv(index=False).encode()))
+    return df.assign(Amount=df["Amount"].astype(str))
+
+
+class Upload(io.BytesIO):
+    def __init__(self, data, name):
+        super().__init__(data)
+        self.name = name
+
+
+@pytest.mark.parametrize("fmt", FORMATS)
+def test_write_then_read_upload(tmp_path, fmt):
+    df = _frame()
+    dest = str(tmp_path / f"data.{fmt}")
+    write_frame(df, fmt, dest, chunksize=16)
+    pd.testing.assert_frame_equal(read_upload(dest), _expected(df, fmt))
+    with open(dest, "rb") as f:
+        upload = Upload(f.read(), f"upload.{fmt}")
+    pd.testing.assert_frame_equal(read_upload(upload), _expected(df, fmt))
+    # The upload is left open and rewound on the next read
+    assert not upload.closed
+    pd.testing.assert_frame_equal(read_upload(upload, nrows=5), _expected(df, fmt).head(5))
+
+
+@pytest.mark.parametrize("fmt", FORMATS)
+def test_arrow_upload_has_the_same_values(tmp_path, fmt):
+    df = _frame()
+    dest = str(tmp_path / f"data.{fmt}")
+    write_frame(df, fmt, dest)
+    got = read_upload(dest, arrow=True)
+    assert all(isinstance(dtype, pd.ArrowDtype) for dtype in got.dtypes)
+    expected = _expected(df, fmt)
+    for col in df.columns:
+        assert got[col].astype(object).where(got[col].notna(), None).tolist() == \
+            expected[col].astype(object).where(expected[col].notna(), None).tolist()
+
+
+def test_mixed_column_is_written_as_text(tmp_path):
+    dest = str(tmp_path / "data.parquet")
+    write_frame(_frame(), "parquet", dest)
+    got = pd.read_parquet(dest)
+    assert got["Amount"].tolist()[:8] == ["N/A"] + [str(v) for v in _frame()["Amount"][1:7]] + ["N/A"]
+    assert str(arrow_schema(_frame()).field("Amount").type) == "string"
+
+
+def test_chunk_writer_matches_write_frame(tmp_path):
+    df = _frame()
+    whole, chunked = str(tmp_path / "whole.parquet"), str(tmp_path / "chunked.parquet")
+    write_frame(df, "parquet", whole)
+    with ChunkWriter("parquet", chunked, arrow_schema(df)) as writer:
+        for chunk in np.array_split(np.arange(len(df)), 4):
+            writer.write(df.iloc[chunk])
+    pd.testing.assert_frame_equal(pd.read_parquet(chunked), pd.read_parquet(whole))
+
+
+def test_empty_frame_csv_keeps_its_header(tmp_path):
+    dest = str(tmp_path / "empty.csv.gz")
+    write_frame(_frame().iloc[:0], "csv.gz", dest)
+    assert list(read_upload(dest).columns) == list(_frame().columns)
+
+
+def test_unknown_format_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        ChunkWriter("xlsx", str(tmp_path / "data.xlsx"))
+
+
+@pytest.mark.parametrize("fmt", FORMATS)
+def test_export_stream_matches_write_frame(tmp_path, fmt):
+    path = str(tmp_path / "cleaned.csv")
+    df = _frame(200)
+    df.loc[150:, "Amount"] = 1.0   # a mixed column only in some chunks
+    df.to_csv(path, index=False)
+    streamed, whole = str(tmp_path / f"streamed.{fmt}"), str(tmp_path / f"whole.{fmt}")
+    export_stream(path, fmt, streamed, chunksize=30)
+    write_frame(pd.read_csv(path, **_REREAD), fmt, whole)
+    pd.testing.assert_frame_equal(read_upload(streamed), read_upload(whole))
+
+
+def test_file_stem():
+    assert file_stem("a/b.csv.gz") == "b"
+    assert file_stem("report.v2.parquet") == "report.v2"
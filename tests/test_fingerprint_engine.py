@@ -0,0 +1,47 @@
+"""fingerprint_engine (user-021) against df.duplicated()."""
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.dirty_data import make_dirty_frame
+from fingerprint_engine import RowFingerprints
+
+
+def test_duplicated_matches_pandas():
+    df = make_dirty_frame(5000)
+    fingerprints = RowFingerprints.of(df)
+    np.testing.assert_array_equal(fingerprints.duplicated(), df.duplicated().to_numpy())
+    keys = ["City", "Status"]
+    np.testing.assert_array_equal(fingerprints.duplicated(keys), df.duplicated(subset=keys).to_numpy())
+    assert fingerprints.duplicates() == int(df.duplicated().sum())
+
+
+def test_nulls_and_types_hash_like_pandas_compares():
+    df = pd.DataFrame({"a": [1.0, np.nan, np.nan, 1.0], "b": ["x", None, None, "x"], "c": ["1", "1", "1", 1]})
+    np.testing.assert_array_equal(RowFingerprints.of(df).duplicated(), df.duplicated().to_numpy())
+
+
+def test_take_rehash_and_rename_follow_the_frame():
+    df = make_dirty_frame(2000)
+    fingerprints = RowFingerprints.of(df)
+    keep = ~fingerprints.duplicated()
+    kept = df[keep]
+    changed = kept.assign(City=kept["City"].str.lower())
+    renamed = changed.set_axis([c.lower() for c in changed.columns], axis=1)
+    derived = fingerprints.take(keep).rehash(changed, {"City"}).rename(list(renamed.columns))
+    fresh = RowFingerprints.of(renamed)
+    assert list(derived.hashes) == list(fresh.hashes)
+    np.testing.assert_array_equal(derived.rows(), fresh.rows())
+
+
+def test_empty_frame():
+    df = make_dirty_frame(10).iloc[:0]
+    fingerprints = RowFingerprints.of(df)
+    assert len(fingerprints) == 0 and fingerprints.duplicates() == 0
+    assert RowFingerprints.of(pd.DataFrame()).duplicates() == 0
+
+
+def test_arrow_dtypes():
+    df = make_dirty_frame(3000)
+    arrow = df.convert_dtypes(dtype_backend="pyarrow")
+    np.testing.assert_array_equal(RowFingerprints.of(arrow).duplicated(), df.duplicated().to_numpy())
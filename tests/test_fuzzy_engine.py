@@ -0,0 +1,52 @@
+"""fuzzy_engine (user-002) against the old difflib loop."""
+
+import numpy as np
+import pandas as pd
+
+import baseline
+from benchmarks.bench_fuzzy import make_uniques, quadratic_mapping
+from fuzzy_engine import CanonicalIndex, build_mapping, fuzzy_standardize
+
+
+def _in_count_order(counts):
+    """A column holding counts[v] rows of each value, first appearances most frequent first (as build_mapping visits them)."""
+    values = sorted(counts, key=lambda v: (-counts[v], v))
+    return pd.Series([v for v in values for _ in range(counts[v])], dtype=object)
+
+
+def test_mapping_matches_quadratic_difflib():
+    counts = make_uniques(1500, seed=3)
+    assert build_mapping(counts) == quadratic_mapping(counts)
+
+
+def test_matches_baseline_when_values_appear_in_count_order():
+    counts = make_uniques(300, seed=5)
+    series = _in_count_order(counts)
+    pd.testing.assert_series_equal(fuzzy_standardize(series), baseline.fuzzy_standardize(series))
+
+
+def test_mapping_does_not_depend_on_row_order():
+    series = _in_count_order(make_uniques(300, seed=7))
+    shuffled = series.sample(frac=1, random_state=0)
+    pd.testing.assert_series_equal(fuzzy_standardize(shuffled), fuzzy_standardize(series).loc[shuffled.index])
+
+
+def test_weights_stand_for_rows():
+    uniques = pd.Series(["Bostn", "Boston"])
+    assert fuzzy_standardize(uniques).tolist() == ["Bostn", "Bostn"]   # a tie goes to the first alphabetically
+    assert fuzzy_standardize(uniques, weights=[1, 3]).tolist() == ["Boston", "Boston"]
+
+
+def test_known_values_keep_their_canonical():
+    known = CanonicalIndex({"Bostn": "Boston", "Chicago": "Chicago"})
+    out, mapping = fuzzy_standardize(pd.Series(["Bostn", "Chicag0", "Denver"]), known=known, return_mapping=True)
+    assert out.tolist() == ["Boston", "Chicago", "Denver"]
+    assert mapping["Chicag0"] == ("Chicago", 1)
+
+
+def test_empty_null_and_arrow_input():
+    assert fuzzy_standardize(pd.Series([], dtype=object)).empty
+    nulls = pd.Series([np.nan, None, " nan"], dtype=object)
+    pd.testing.assert_series_equal(fuzzy_standardize(nulls), baseline.fuzzy_standardize(nulls))
+    arrow = pd.Series(["Boston", "Bostn", "Boston", None], dtype="string[pyarrow]")
+    assert fuzzy_standardize(arrow).tolist() == baseline.fuzzy_standardize(arrow.astype(object)).tolist()
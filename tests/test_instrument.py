@@ -0,0 +1,67 @@
+"""instrument's stage measurements (user-016) and profiled runs (user-019)."""
+
+import time
+import tracemalloc
+
+import instrument
+from benchmarks.dirty_data import make_dirty_frame
+from cleaning import run_stages
+from instrument import capture_profile, measure, profile_report
+
+
+def test_measure_reports_time_and_peak():
+    with measure() as m:
+        data = bytearray(64 * 1024 ** 2)
+        time.sleep(0.02)
+    del data
+    assert m["seconds"] >= 0.02
+    if m["peak_mb"] is not None:   # Linux only
+        assert m["peak_mb"] >= 0
+
+
+def test_sampler_survives_failed_reads(monkeypatch):
+    reads = iter([100, None, None, 300 * 1024 ** 2])
+    monkeypatch.setattr(instrument, "rss_bytes", lambda: next(reads, None))
+    with measure() as m:
+        time.sleep(0.1)   # many samples, most of them failed reads
+    assert m["peak_mb"] == 300.0
+
+
+def test_no_rss(monkeypatch):
+    monkeypatch.setattr(instrument, "rss_bytes", lambda: None)
+    with measure() as m:
+        pass
+    assert m["peak_mb"] is None
+
+
+def test_profile_report_sections():
+    df = make_dirty_frame(500)
+    with capture_profile(top=10) as prof:
+        _, _, _, stage_log = run_stages(df, {"do_duplicates": True, "do_normalize_text": True})
+    report = profile_report(prof, stage_log, "orders.csv")
+    assert report.startswith("Raw to Ready profile report: orders.csv\n")
+    assert f"peak traced memory {prof['peak_mb']} MB" in report and prof["peak_mb"] > 0
+    stages = report[report.index("== Stages =="):report.index("== Top functions")]
+    for row in stage_log:
+        assert row["stage"] in stages
+    functions = report[report.index("== Top functions"):report.index("== Top allocation sites")]
+    assert "run_stages" in functions
+    allocations = report[report.index("== Top allocation sites"):]
+    assert "size=" in allocations
+    assert not tracemalloc.is_tracing()
+
+
+def test_running_trace_is_left_alone():
+    tracemalloc.start()
+    try:
+        held = bytearray(8 * 1024 ** 2)
+        del held
+        _, peak_before = tracemalloc.get_traced_memory()
+        with capture_profile() as prof:
+            sum(range(1000))
+        assert tracemalloc.is_tracing()
+        assert tracemalloc.get_traced_memory()[1] >= peak_before   # the peak was not reset
+        assert prof["peak_mb"] is None
+        assert "peak traced memory not measured" in profile_report(prof, [])
+    finally:
+        tracemalloc.stop()
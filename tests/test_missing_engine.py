@@ -0,0 +1,86 @@
+"""missing_engine (user-006) against the old fill_missing."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import baseline
+from cleaning import FILL_METHODS
+from missing_engine import FILL_VALUE, column_modes, fill_missing
+
+
+def _values(series):
+    return [None if pd.isna(v) else v for v in series.astype(object)]
+
+
+def _frame():
+    return pd.DataFrame({
+        "City": ["Boston", None, "Denver", "Boston", np.nan, "Denver"],
+        "Amount": [1.5, np.nan, 3.0, 2.0, 10.0, np.nan],
+        "Units": [1, 2, None, 2, 4, 4],
+        "Count": [1, 2, 3, 4, 5, 6],
+        "Flag": [True, False, True, True, False, True],
+        "Note": [np.nan] * 6,
+    })
+
+
+@pytest.mark.filterwarnings("ignore:Mean of empty slice")   # the old helper's median of the all-null column
+@pytest.mark.parametrize("method", [m for m in FILL_METHODS if m != "Fill by most common"])
+def test_matches_baseline(method):
+    df = _frame()
+    pd.testing.assert_frame_equal(fill_missing(df, method), baseline.fill_missing(df, method))
+
+
+def test_most_common_matches_baseline_without_all_null_columns():
+    df = _frame().drop(columns="Note")
+    pd.testing.assert_frame_equal(fill_missing(df, "Fill by most common"),
+                                  baseline.fill_missing(df, "Fill by most common"))
+
+
+def test_most_common_leaves_all_null_column():
+    # The old helper raised here: mode() of no values is empty
+    df = _frame()
+    with pytest.raises(KeyError):
+        baseline.fill_missing(df, "Fill by most common")
+    out, report = fill_missing(df, "Fill by most common", return_report=True)
+    assert out["Note"].isna().all()
+    assert report["Note"] == 0 and report["City"] == 2
+
+
+def test_modes_break_ties_like_mode():
+    df = pd.DataFrame({"a": ["b", "a", "b", "a", None], "b": [3, 1, 1, 3, 2], "c": [None, None, None, None, None]})
+    modes = column_modes(df, df.columns)
+    assert modes == {"a": df["a"].mode()[0], "b": df["b"].mode()[0]}
+
+
+def test_report_and_input_untouched():
+    df = _frame()
+    before = df.copy()
+    _, report = fill_missing(df, "Fill with Mean", return_report=True)
+    assert report == {"City": 0, "Amount": 2, "Units": 1, "Note": 0}
+    pd.testing.assert_frame_equal(df, before)
+
+
+@pytest.mark.parametrize("method", FILL_METHODS)
+def test_empty_frame(method):
+    df = _frame().iloc[:0]
+    out = fill_missing(df, method)
+    assert out.empty and list(out.columns) == list(df.columns)
+
+
+@pytest.mark.parametrize("method", FILL_METHODS)
+def test_arrow_dtypes(method):
+    df = _frame().drop(columns="Note").convert_dtypes(dtype_backend="pyarrow")
+    out = fill_missing(df, method)
+    expected = fill_missing(_frame().drop(columns="Note"), method)
+    assert out.shape == expected.shape
+    for col in out.columns:
+        assert _values(out[col]) == _values(expected[col])
+
+
+def test_arrow_text_takes_fill_value():
+    df = pd.DataFrame({"City": pd.Series(["Boston", None], dtype="string[pyarrow]"),
+                       "Units": pd.Series([1, None], dtype="int64[pyarrow]")})
+    out = fill_missing(df, "Fill with N/A")
+    assert out["City"].tolist() == ["Boston", FILL_VALUE]
+    assert out["Units"].tolist() == [1, FILL_VALUE]
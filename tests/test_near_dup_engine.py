@@ -0,0 +1,51 @@
+"""near_dup_engine (user-022)."""
+
+import numpy as np
+import pandas as pd
+
+from cleaning import run_stages
+from near_dup_engine import find_near_duplicates, merge_near_duplicates
+
+
+def test_all_null_column_is_skipped():
+    df = pd.DataFrame({"Name": ["a", "b", "c"], "Note": [np.nan] * 3})
+    _, _, reports, _ = run_stages(df, {"do_near_duplicates": True})
+    assert reports["near_duplicates"].empty
+
+
+def test_only_null_columns():
+    df = pd.DataFrame({"Name": [None, None], "Note": [np.nan, np.nan]})
+    positions, groups, similarity = find_near_duplicates(df, ["Name", "Note"])
+    assert len(positions) == len(groups) == len(similarity) == 0
+
+
+def test_empty_frame():
+    positions, _, _ = find_near_duplicates(pd.DataFrame({"Name": pd.Series([], dtype=object)}))
+    assert len(positions) == 0
+
+
+def test_typos_group_together():
+    df = pd.DataFrame({"Name": ["Jonathan Smith", "Jonathon Smith", "Maria Garcia"],
+                       "City": ["Boston", "boston", "Denver"]})
+    positions, groups, _ = find_near_duplicates(df)
+    assert positions.tolist() == [0, 1]
+    assert groups.tolist() == [0, 0]
+
+
+def test_missing_field_is_not_a_mismatch():
+    df = pd.DataFrame({"Name": ["Jonathan Smith", "Jonathan Smith", "Maria Garcia"],
+                       "Email": [None, "js@example.com", "mg@example.com"],
+                       "City": ["Boston", "Boston", "Denver"]})
+    positions, groups, _ = find_near_duplicates(df)
+    assert positions.tolist() == [0, 1]
+    merged, keep, filled = merge_near_duplicates(df, positions, groups)
+    assert keep.tolist() == [True, False, True]
+    assert merged["Email"].tolist() == ["js@example.com", "mg@example.com"]
+    assert filled == {"Email": 1}
+
+
+def test_distinct_records_are_not_grouped():
+    df = pd.DataFrame({"Name": ["Jonathan Smith", "Maria Garcia", "Wei Chen"],
+                       "City": ["Boston", "Denver", "Austin"]})
+    positions, _, _ = find_near_duplicates(df)
+    assert len(positions) == 0
@@ -0,0 +1,152 @@
+"""parallel_engine: column tasks on a process pool (user-024), row partitions (user-025)."""
+
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import parallel_engine
+from benchmarks.dirty_data import make_dirty_frame
+from cleaning import DEFAULT_OPTIONS, clean_text_columns, run_stages
+from parallel_engine import ColumnTask, _publish, _read, run_column_tasks
+from text_engine import TextColumn
+
+TEXT_OPTIONS = {**DEFAULT_OPTIONS, "do_normalize_text": True, "do_fix_dates": True, "do_validate_emails": True}
+
+
+def upper(column):
+    column.apply("normalize", lambda u: u.str.upper())
+
+
+def fail(column):
+    raise ValueError("bad column")
+
+
+def slow_upper(column):
+    time.sleep(0.5)
+    upper(column)
+
+
+def _frame(rows=30000, seed=0):
+    # The email column holds most of the work, so it is split into row partitions
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "Customer Email": [f"user{i}@example.com" if i % 5 else f"user {i}" for i in rng.integers(0, 20000, rows)],
+        "Order Date": [f"{d % 28 + 1:02d}/{m:02d}/2023" for d, m in zip(rng.integers(0, 28, rows),
+                                                                          rng.integers(1, 13, rows))],
+        "City": rng.choice(["new york", " Boston", "chicago", None], rows),
+    })
+
+
+def _shm():
+    return set(os.listdir("/dev/shm")) if os.path.isdir("/dev/shm") else set()
+
+
+@pytest.fixture
+def cheap(monkeypatch):
+    # Ship even small columns (and split them), so the tests exercise the workers
+    monkeypatch.setattr(parallel_engine, "INLINE_COST", 0)
+
+
+def test_publish_round_trip():
+    uniques = np.array(["a", np.nan, "ünï", "", "x" * 50], dtype=object)
+    codes = np.array([0, 2, 1, 4, 3, 0])
+    handle, block = _publish(codes, uniques)
+    try:
+        got_codes, got = _read(handle, block)
+        assert got_codes.tolist() == codes.tolist()
+        assert pd.Series(got).equals(pd.Series(uniques))
+        del got_codes
+    finally:
+        block.close()
+        block.unlink()
+
+
+def test_publish_falls_back_to_pickle():
+    for uniques in (np.array(["a", None, 3], dtype=object), np.array(["ok", "bad\udc80"], dtype=object)):
+        handle, block = _publish(np.array([0, 1]), uniques)
+        try:
+            assert handle["objects"] is uniques
+        finally:
+            block.close()
+            block.unlink()
+
+
+@pytest.mark.parametrize("workers", [2, 3])
+def test_parallel_matches_serial(cheap, workers):
+    df = _frame()
+    serial, parallel = df.copy(), df.copy()
+    dates, texts, changed, _ = clean_text_columns(serial, TEXT_OPTIONS, set(df.columns))
+    dates_p, texts_p, changed_p, report = clean_text_columns(parallel, TEXT_OPTIONS, set(df.columns), workers)
+    pd.testing.assert_frame_equal(serial, parallel)
+    assert dates == dates_p
+    assert changed == changed_p
+    assert {c: {s: v["rows"] for s, v in steps.items()} for c, steps in texts.items()} == \
+        {c: {s: v["rows"] for s, v in steps.items()} for c, steps in texts_p.items()}
+    assert report["in_workers"] == report["partitions"]
+    if workers == 3:   # the email column is more than twice its share: split into row partitions
+        assert report["partitions"] > report["columns"]
+
+
+def test_error_in_a_task_frees_shared_memory(cheap):
+    before = _shm()
+    # The failing column is the biggest, so it starts first and fails while another is still running
+    tasks = [ColumnTask("bad", TextColumn(pd.Series(["a", "b"] * 200)), fail, steps=["normalize"])]
+    tasks += [ColumnTask(f"c{i}", TextColumn(pd.Series(["a", "b"] * 100)), slow_upper, steps=["normalize"])
+              for i in range(3)]
+    with pytest.raises(ValueError, match="bad column"):
+        run_column_tasks(tasks, workers=2)
+    time.sleep(1)   # a block leaked by the column still running would show up once it finishes
+    assert _shm() <= before
+
+
+def test_serial_runs_in_process():
+    tasks = [ColumnTask("c", TextColumn(pd.Series(["a", "b", "a"])), upper, steps=["normalize"])]
+    _, report = run_column_tasks(tasks, workers=1)
+    assert report["workers"] == 1 and report["in_workers"] == 0
+    assert tasks[0].column.to_series().tolist() == ["A", "B", "A"]
+
+
+
+def _dated_frame(rows=8000, seed=1):
+    # The date column holds most of the work, in several formats (and some junk), so each
+    # partition infers its formats from its own slice of the values
+    rng = np.random.default_rng(seed)
+    days = pd.Timestamp("2000-01-01") + pd.to_timedelta(rng.integers(0, 9000, rows), unit="D")
+    formats = rng.choice(["%Y-%m-%d", "%d/%m/%Y", "%b %d, %Y", "%Y.%m.%d", "junk"], rows)
+    return pd.DataFrame({
+        "Order Date": [f"not a date {d.day}" if f == "junk" else d.strftime(f) for d, f in zip(days, formats)],
+        "Customer Email": [f"user{i}@example.com" if i % 5 else f"user {i}" for i in rng.integers(0, 500, rows)],
+        "City": rng.choice(["new york", " Boston", "chicago", None], rows),
+    })
+
+
+def _counts(text_reports):
+    return {c: {s: (v["rows"], v["uniques"]) for s, v in steps.items()} for c, steps in text_reports.items()}
+
+
+@pytest.mark.parametrize("workers", [3, 4])
+def test_partitions_match_serial_with_reports(cheap, workers):
+    df = _dated_frame()
+    serial, parallel = df.copy(), df.copy()
+    dates, texts, changed, _ = clean_text_columns(serial, TEXT_OPTIONS, set(df.columns))
+    dates_p, texts_p, changed_p, report = clean_text_columns(parallel, TEXT_OPTIONS, set(df.columns), workers)
+    assert {row["column"] for row in report["detail"] if row["part"]} == {"Order Date"}
+    pd.testing.assert_frame_equal(serial, parallel)
+    assert dates_p == dates and changed_p == changed
+    assert _counts(texts_p) == _counts(texts)
+
+
+def test_stages_match_one_worker(cheap):
+    df = pd.concat([_dated_frame(), make_dirty_frame(len(_dated_frame())).drop(columns=["Order Date", "City",
+                                                                                      "Customer Email"])], axis=1)
+    options = {"do_duplicates": True, "do_normalize_text": True, "do_fix_dates": True, "do_validate_emails": True,
+               "do_fuzzy_standardize": True}
+    one, _, reports, _ = run_stages(df, options)
+    three, _, reports_p, _ = run_stages(df, options, workers=3)
+    pd.testing.assert_frame_equal(one, three)
+    assert reports_p["date_reports"] == reports["date_reports"]
+    assert _counts(reports_p["text_reports"]) == _counts(reports["text_reports"])
+    assert any(row["part"] for row in reports_p["parallel"]["text"]["detail"])
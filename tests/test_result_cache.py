@@ -0,0 +1,122 @@
+"""result_cache (user-014)."""
+
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.dirty_data import make_dirty_frame
+from cleaning import clean_frame
+from result_cache import ResultCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResultCache(root=str(tmp_path / "results"), max_bytes=50 * 1024 ** 2)
+
+
+def _result():
+    df = pd.DataFrame({"City": ["Boston", np.nan, "Denver"], "Amount": [1.5, 2.0, np.nan]})
+    anomalies = pd.DataFrame({"row": [2], "column": ["Amount"], "value": [2.0], "score": [3.1]})
+    return df, anomalies, {"fill_report": {"City": 1}}
+
+
+def test_round_trip(cache):
+    df, anomalies, reports = _result()
+    assert cache.get("k") is None
+    cache.put("k", df, anomalies, reports)
+    got_df, got_anomalies, got_reports = cache.get("k")
+    pd.testing.assert_frame_equal(got_df, df)
+    pd.testing.assert_frame_equal(got_anomalies, anomalies)
+    assert got_reports == reports
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_mixed_type_column_round_trips(cache):
+    df = pd.DataFrame({"mixed": ["a", 1, 2.5, np.nan, True, "N/A"], "amount": [1.5, "N/A", 2.0, 3.0, 4.0, 5.0]})
+    cache.put("k", df, pd.DataFrame(), {})
+    got = cache.get("k")[0]
+    pd.testing.assert_frame_equal(got, df)
+    assert [type(v) for v in got["mixed"]] == [str, int, float, float, bool, str]
+
+
+def test_object_column_of_ints_keeps_its_dtype(cache):
+    df = pd.DataFrame({"ids": pd.Series([1, 2, 3], dtype=object)})   # plain Parquet gives int64 back
+    cache.put("k", df, pd.DataFrame(), {})
+    pd.testing.assert_frame_equal(cache.get("k")[0], df)
+
+
+def test_frame_parquet_cant_hold_is_not_cached(cache):
+    df = pd.DataFrame({"lists": [[1], [2]]})
+    cache.put("k", df, pd.DataFrame(), {})
+    assert cache.get("k") is None
+    assert not os.listdir(cache.root)
+
+
+def test_reports_round_trip_as_json_and_parquet(cache):
+    df, anomalies, _ = _result()
+    reports = {"fill_report": {"City": np.int64(1)}, "duplicates_before": 2,
+               "canonical_updates": {"City": {"Bostn": ("Boston", 3)}},
+               "near_duplicates": pd.DataFrame({"group": [1, 1], "row": [0, 2], "City": ["Boston", "Bostn"]})}
+    cache.put("k", df, anomalies, reports)
+    got = cache.get("k")[2]
+    pd.testing.assert_frame_equal(got["near_duplicates"], reports["near_duplicates"])
+    assert got["fill_report"] == {"City": 1} and got["duplicates_before"] == 2
+    assert got["canonical_updates"] == {"City": {"Bostn": ["Boston", 3]}}
+    assert not glob.glob(os.path.join(cache.root, "k", "*.pkl"))
+
+
+def test_directory_others_can_write_is_not_used(cache):
+    cache.put("k", *_result())
+    os.chmod(cache.root, 0o777)
+    assert cache.get("k") is None
+    os.chmod(cache.root, 0o700)
+    assert cache.get("k") is not None
+
+
+def test_directory_is_created_private(tmp_path):
+    cache = ResultCache(root=str(tmp_path / "home" / "results"))
+    cache.put("k", *_result())
+    assert os.stat(cache.root).st_mode & 0o777 == 0o700
+
+
+@pytest.mark.parametrize("damage", ["truncate", "empty_meta"])
+def test_damaged_entry_is_a_miss_and_removed(cache, damage):
+    cache.put("k", *_result())
+    entry = os.path.join(cache.root, "k")
+    if damage == "truncate":
+        path = os.path.join(entry, "cleaned.parquet")
+        with open(path, "r+b") as f:
+            f.truncate(os.path.getsize(path) // 2)
+    else:
+        open(os.path.join(entry, "meta.json"), "wb").close()
+    assert cache.get("k") is None
+    assert not os.path.exists(entry)
+    cache.put("k", *_result())   # stored again on the next run
+    assert cache.get("k") is not None
+
+
+def test_eviction_keeps_cache_bounded(tmp_path):
+    cache = ResultCache(root=str(tmp_path / "results"), max_bytes=200 * 1024)
+    big = pd.DataFrame({"x": np.random.default_rng(0).random(10_000)})
+    for key in "abcd":
+        cache.put(key, big, pd.DataFrame(), {})
+    assert sum(nbytes for _, nbytes, _ in cache._entries()) <= 200 * 1024
+    assert cache.get("d") is not None
+    assert cache.get("a") is None
+
+
+def test_pipeline_result_round_trips(cache):
+    df = make_dirty_frame(1000)
+    options = {"do_duplicates": True, "do_normalize_text": True, "do_fix_dates": True, "do_validate_emails": True,
+               "do_near_duplicates": True, "do_anomaly_detection": True}
+    df_cleaned, anomalies, reports = clean_frame(df, options)
+    cache.put("k", df_cleaned, anomalies, reports)
+    got_df, got_anomalies, got_reports = cache.get("k")
+    pd.testing.assert_frame_equal(got_df, df_cleaned)
+    pd.testing.assert_frame_equal(got_anomalies, anomalies)
+    pd.testing.assert_frame_equal(got_reports["near_duplicates"], reports["near_duplicates"])
+    assert got_reports["date_reports"] == reports["date_reports"]
+    assert got_reports["fill_report"] == reports["fill_report"]
@@ -0,0 +1,77 @@
+"""sketch_engine (user-020) against df.describe()."""
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.dirty_data import make_dirty_frame
+from sketch_engine import HEAVY_HITTERS, DatasetSketch, HyperLogLog, sketch_frame
+
+
+def _frame(rows=30000):
+    df = make_dirty_frame(rows)
+    df["Signup"] = pd.Timestamp("2020-01-01") + pd.to_timedelta(np.arange(rows) % 900, unit="D")
+    return df
+
+
+def test_describe_close_to_pandas():
+    df = _frame()
+    got = sketch_frame(df, chunksize=7000).describe()
+    expected = df.describe(include="all").transpose()
+    assert list(got.index) == list(expected.index)
+    for col in df.columns:
+        row, exact = got.loc[col], expected.loc[col]
+        assert row["count"] == exact["count"]
+        if pd.api.types.is_numeric_dtype(df[col]):
+            for stat in ["mean", "std", "min", "max"]:
+                assert np.isclose(row[stat], exact[stat])
+            spread = exact["max"] - exact["min"]
+            for stat in ["25%", "50%", "75%"]:
+                assert abs(row[stat] - exact[stat]) <= 0.02 * spread
+        elif pd.api.types.is_datetime64_any_dtype(df[col]):
+            assert row["min"] == exact["min"] and row["max"] == exact["max"]
+        else:
+            assert abs(row["unique"] - exact["unique"]) <= max(0.03 * exact["unique"], 1)
+            if exact["unique"] <= HEAVY_HITTERS:
+                assert row["top"] == exact["top"] and row["freq"] == exact["freq"]
+            else:   # a lower bound, at most rows / (capacity + 1) short
+                assert exact["freq"] - len(df) / (HEAVY_HITTERS + 1) <= row["freq"] <= exact["freq"]
+
+
+def test_merged_chunks_match_one_pass():
+    df = _frame(10000)
+    parts = [DatasetSketch(df.dtypes.to_dict()) for _ in range(3)]
+    for part, chunk in zip(parts, np.array_split(np.arange(len(df)), 3)):
+        part.add(df.iloc[chunk])
+    merged = parts[0]
+    for part in parts[1:]:
+        merged.merge(part)
+    whole = sketch_frame(df).describe()
+    got = merged.describe()
+    for col in df.columns:
+        assert got.loc[col, "count"] == whole.loc[col, "count"]
+    assert np.isclose(got.loc["Amount", "mean"], whole.loc["Amount", "mean"])
+    assert got.loc["City", "unique"] == whole.loc["City", "unique"]
+
+
+def test_distinct_count_error():
+    sketch = HyperLogLog()
+    sketch.add_hashes(pd.util.hash_array(np.arange(200_000)))
+    assert abs(sketch.count() - 200_000) <= 0.03 * 200_000
+
+
+def test_empty_and_all_null_columns():
+    df = pd.DataFrame({"City": pd.Series([None, None], dtype=object), "Amount": [np.nan, np.nan]})
+    got = sketch_frame(df).describe()
+    assert got.loc["City", "count"] == 0 and got.loc["City", "unique"] == 0
+    assert got.loc["Amount", "count"] == 0
+    empty = sketch_frame(df.iloc[:0]).describe()
+    assert list(empty.index) == ["City", "Amount"]
+
+
+def test_arrow_dtypes():
+    df = _frame(5000).drop(columns="Signup")
+    arrow = df.convert_dtypes(dtype_backend="pyarrow")
+    got, expected = sketch_frame(arrow).describe(), sketch_frame(df).describe()
+    for col in df.columns:
+        assert got.loc[col, "count"] == expected.loc[col, "count"]
+    assert np.isclose(got.loc["Amount", "mean"], expected.loc["Amount", "mean"])
@@ -0,0 +1,91 @@
+"""The memoized stage chain of cleaning.run_stages (user-015)."""
+
+import pandas as pd
+import pytest
+
+from benchmarks.dirty_data import make_dirty_frame
+from cleaning import STAGES, clean_frame, run_stages
+from upload_cache import LRUCache
+
+BASE = {"fill_method": "Fill with N/A", "do_duplicates": True, "do_standardize_cols": True, "do_normalize_text": True,
+        "do_fix_dates": True, "do_validate_emails": True, "do_fuzzy_standardize": True, "do_near_duplicates": True,
+        "do_anomaly_detection": True}
+
+
+def _rows(text_reports):
+    # Timings differ between runs; what each step ran on does not
+    return {col: {step: stats["rows"] for step, stats in steps.items()} for col, steps in text_reports.items()}
+
+
+def _assert_same_result(got, expected):
+    df, anomalies, reports = got
+    expected_df, expected_anomalies, expected_reports = expected
+    pd.testing.assert_frame_equal(df, expected_df)
+    pd.testing.assert_frame_equal(anomalies.reset_index(drop=True), expected_anomalies.reset_index(drop=True))
+    pd.testing.assert_frame_equal(reports["near_duplicates"], expected_reports["near_duplicates"])
+    for key in ["fill_report", "date_reports", "duplicates_before", "duplicates_after"]:
+        assert reports[key] == expected_reports[key], key
+    assert _rows(reports["text_reports"]) == _rows(expected_reports["text_reports"])
+
+
+def _snapshot(memo):
+    return {key: (value["df"].copy(deep=True), value["anomalies"].copy(deep=True))
+            for key, (value, _) in memo._entries.items()}
+
+
+@pytest.mark.parametrize("change, first_rerun", [
+    ({"anomaly_method": "iqr"}, "anomalies"),
+    ({"near_duplicate_merge": True}, "near_duplicates"),
+    ({"do_fuzzy_standardize": False}, "near_duplicates"),
+    ({"do_validate_emails": False}, "text"),
+    ({"fill_method": "Fill by most common"}, "fill"),
+])
+def test_changed_option_resumes_from_the_memo(change, first_rerun):
+    df = make_dirty_frame(400)
+    memo = LRUCache(512 * 1024 ** 2)
+    run_stages(df, BASE, memo=memo, memo_key="upload")
+    options = {**BASE, **change}
+    df_cleaned, anomalies, reports, stage_log = run_stages(df, options, memo=memo, memo_key="upload")
+
+    _assert_same_result((df_cleaned, anomalies, reports), clean_frame(df, options))
+    statuses = {stage.name: row["status"] for stage, row in zip(STAGES, stage_log)}
+    names = [stage.name for stage in STAGES]
+    for name in names[:names.index(first_rerun)]:
+        assert statuses[name] in ("cached", "off"), name
+    assert statuses[first_rerun] == "computed"
+
+
+def test_same_options_are_all_cached():
+    df = make_dirty_frame(500)
+    memo = LRUCache(512 * 1024 ** 2)
+    first = run_stages(df, BASE, memo=memo, memo_key="upload")
+    again = run_stages(df, BASE, memo=memo, memo_key="upload")
+    assert {row["status"] for row in again[3]} == {"cached"}
+    _assert_same_result(again[:3], first[:3])
+
+
+def test_later_stages_do_not_change_cached_outputs():
+    df = make_dirty_frame(400)
+    before = df.copy(deep=True)
+    memo = LRUCache(512 * 1024 ** 2)
+    run_stages(df, {**BASE, "do_fuzzy_standardize": False, "do_anomaly_detection": False}, memo=memo,
+               memo_key="upload")
+    cached = _snapshot(memo)
+    # Resume from every cached stage with later stages that rewrite the frame
+    run_stages(df, {**BASE, "near_duplicate_merge": True}, memo=memo, memo_key="upload")
+    run_stages(df, {**BASE, "do_validate_emails": False, "near_duplicate_merge": True}, memo=memo,
+               memo_key="upload")
+    for key, (frame, anomalies) in cached.items():
+        state = memo._entries[key][0]
+        pd.testing.assert_frame_equal(state["df"], frame)
+        pd.testing.assert_frame_equal(state["anomalies"], anomalies)
+    pd.testing.assert_frame_equal(df, before)
+
+
+def test_memo_key_separates_uploads():
+    memo = LRUCache(512 * 1024 ** 2)
+    a, b = make_dirty_frame(300, seed=1), make_dirty_frame(300, seed=2)
+    run_stages(a, BASE, memo=memo, memo_key="a")
+    df_cleaned, _, _, stage_log = run_stages(b, BASE, memo=memo, memo_key="b")
+    assert "cached" not in {row["status"] for row in stage_log}
+    pd.testing.assert_frame_equal(df_cleaned, clean_frame(b, BASE)[0])
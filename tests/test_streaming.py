@@ -0,0 +1,72 @@
+"""Streaming cleaning (user-004) against the in-memory pipeline."""
+
+import os
+
+import pandas as pd
+import pytest
+
+import streaming
+from benchmarks.dirty_data import make_dirty_frame
+from cleaning import clean_frame
+from streaming import clean_csv_stream
+
+ALL_STEPS = {"do_duplicates": True, "do_standardize_cols": True, "do_normalize_text": True, "do_fix_dates": True,
+             "do_validate_emails": True, "do_anomaly_detection": True}
+
+
+def _source(tmp_path, rows=1000):
+    source = tmp_path / "dirty.csv"
+    make_dirty_frame(rows).to_csv(source, index=False)
+    return source, pd.read_csv(source)
+
+
+def _cells(anomalies, positions):
+    """{(position in the output, column)} of the anomalies; positions maps the in-memory rows' labels."""
+    rows = anomalies["row"] if positions is None else positions.get_indexer(anomalies["row"])
+    return set(zip(rows, anomalies["column"]))
+
+
+@pytest.mark.parametrize("fill_method, anomaly_method", [
+    ("Fill with N/A", "zscore"),
+    ("Drop Rows", "zscore"),
+    ("Fill with Mean", "mad"),
+    ("Fill with Median", "iqr"),
+    ("Fill by most common", "zscore"),
+])
+def test_streaming_matches_in_memory(tmp_path, fill_method, anomaly_method):
+    source, df = _source(tmp_path)
+    options = {**ALL_STEPS, "do_fuzzy_standardize": True, "fill_method": fill_method,
+               "anomaly_method": anomaly_method}
+    expected, anomalies, reports = clean_frame(df, options)
+    report = clean_csv_stream(str(source), str(tmp_path / "clean.csv"), options, chunksize=300)
+    streamed = pd.read_csv(tmp_path / "clean.csv", keep_default_na=False, na_values=[""])
+    written = pd.read_csv(pd.io.common.StringIO(expected.to_csv(index=False)), keep_default_na=False,
+                          na_values=[""])
+    pd.testing.assert_frame_equal(streamed, written)
+    assert report["rows_after"] == len(expected)
+    assert report["duplicates_before"] == reports["duplicates_before"]
+    assert report["fill_report"] == reports["fill_report"]
+    assert len(anomalies) or fill_method == "Fill with N/A"   # "N/A" turns the numeric columns into text
+    assert _cells(report["anomalies"], None) == _cells(anomalies, expected.index)
+
+
+@pytest.mark.parametrize("fuzzy", [True, False])
+def test_spool_is_removed_when_a_pass_fails(tmp_path, monkeypatch, fuzzy):
+    source, _ = _source(tmp_path, rows=200)
+    dest = str(tmp_path / "clean.csv")
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("pass failed")
+
+    # build_mapping runs between the two passes, clean_chunk during the first
+    monkeypatch.setattr(streaming, "build_mapping" if fuzzy else "clean_chunk", fail)
+    with pytest.raises(RuntimeError):
+        clean_csv_stream(str(source), dest, {**ALL_STEPS, "do_fuzzy_standardize": True}, chunksize=50)
+    assert not os.path.exists(dest + ".spool")
+
+
+def test_spool_is_removed_after_a_run(tmp_path):
+    source, _ = _source(tmp_path, rows=200)
+    dest = str(tmp_path / "clean.csv")
+    clean_csv_stream(str(source), dest, {**ALL_STEPS, "do_fuzzy_standardize": True}, chunksize=50)
+    assert sorted(os.listdir(tmp_path)) == ["clean.csv", "dirty.csv"]
@@ -0,0 +1,100 @@
+"""upload_cache (user-003)."""
+
+import io
+
+import pandas as pd
+import pytest
+
+import upload_cache
+from benchmarks.dirty_data import make_dirty_frame
+from upload_cache import LRUCache, load_csv
+
+
+class Upload(io.BytesIO):
+    """Stands in for Streamlit's UploadedFile: a BytesIO with a name and a file_id."""
+
+    def __init__(self, data, name="data.csv", file_id="upload-1"):
+        super().__init__(data)
+        self.name = name
+        self.file_id = file_id
+
+
+@pytest.fixture
+def uploads(monkeypatch):
+    cache = LRUCache(64 * 1024 ** 2)
+    monkeypatch.setattr(upload_cache, "_uploads", cache)
+    monkeypatch.setattr(upload_cache, "_digests", type(upload_cache._digests)())
+    return cache
+
+
+def _csv(rows=500):
+    return make_dirty_frame(rows).to_csv(index=False).encode()
+
+
+def test_evicts_least_recently_used_by_size():
+    cache = LRUCache(100)
+    cache.put("a", "A", 40)
+    cache.put("b", "B", 40)
+    assert cache.get("a") == "A"   # now b is the least recently used
+    cache.put("c", "C", 40)
+    assert cache.get("b") is None
+    assert cache.get("a") == "A" and cache.get("c") == "C"
+    assert cache.size == 80
+    assert cache.stats()["entries"] == 2 and cache.evictions == 1
+
+
+def test_counts_hits_and_misses():
+    cache = LRUCache(100)
+    assert cache.get("a") is None
+    cache.put("a", "A", 10)
+    cache.get("a")
+    cache.get("a")
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (2, 1, 0)
+
+
+def test_replacing_an_entry_counts_its_new_size():
+    cache = LRUCache(100)
+    cache.put("a", "A", 60)
+    cache.put("a", "AA", 30)
+    assert cache.size == 30 and cache.get("a") == "AA"
+
+
+def test_entry_larger_than_the_budget_is_not_kept():
+    cache = LRUCache(100)
+    cache.put("a", "A", 50)
+    cache.put("big", "B", 101)
+    assert cache.get("big") is None
+    assert cache.get("a") == "A" and cache.size == 50
+
+
+def test_load_csv_reuses_the_cached_parse(uploads, monkeypatch):
+    data = _csv()
+    df, profile, key = load_csv(Upload(data))
+    pd.testing.assert_frame_equal(df, pd.read_csv(io.BytesIO(data)))
+    assert profile["rows"] == len(df)
+
+    def no_parse(*args, **kwargs):
+        raise AssertionError("parsed again")
+
+    monkeypatch.setattr(upload_cache, "read_upload", no_parse)
+    # Same contents under a new upload: hashed again, then found in the cache
+    again, profile_again, key_again = load_csv(Upload(data, file_id="upload-2"))
+    assert again is df and profile_again is profile and key_again == key
+    assert uploads.hits == 1 and uploads.misses == 1
+
+
+def test_entry_size_counts_the_profile(uploads):
+    df, profile, key = load_csv(Upload(_csv()))
+    assert profile["sketch"].nbytes > 0
+    assert uploads.size >= (upload_cache.frame_bytes(df) + profile["fingerprints"].nbytes +
+                            profile["sketch"].nbytes)
+
+
+def test_upload_is_hashed_once_per_file_id(uploads, monkeypatch):
+    upload = Upload(_csv())
+    key = load_csv(upload)[2]
+    calls = []
+    monkeypatch.setattr(upload_cache.hashlib, "blake2b", lambda *args, **kwargs: calls.append(args))
+    assert load_csv(upload)[2] == key
+    assert not calls
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Upload cache for Raw to Ready.
+
+Streamlit reruns the whole script on every widget click, which used to mean
+re-parsing the uploaded CSV and re-profiling it each time. Parsed frames and
+their baseline profile are kept here, keyed by a hash of the file contents,
+in a size-bounded LRU cache that lives for the whole server process.
+
+With arrow=True the CSV is parsed by PyArrow's multithreaded reader into
+Arrow-backed dtypes (string[pyarrow], int64[pyarrow], ...), which parse faster
+and take far less memory than NumPy object strings for text-heavy files. The
+cleaning helpers accept both kinds of frame. PyArrow is optional.
+
+The output of every cleaning stage is kept too (see cleaning.run_stages), keyed
+by the upload and the options it depends on, so after one option changes only
+the stages from the first one that reads it are run again.
+
+The summary statistics of the profile come from mergeable sketches built in
+one pass over the rows (see sketch_engine); exact ones are computed only on
+request (exact_describe) and cached alongside.
+"""
+
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from cleaning import frame_bytes, run_stages
+from file_formats import ARROW_AVAILABLE, read_upload
+from sketch_engine import sketch_frame
+from fingerprint_engine import RowFingerprints
+
+CACHE_MAX_MB = int(os.environ.get("RAWTOREADY_CACHE_MB", "1024"))
+STAGE_CACHE_MB = int(os.environ.get("RAWTOREADY_STAGE_CACHE_MB", "1024"))
+DIGESTS_KEPT = 256
+
+
+class LRUCache:
+    """Thread-safe LRU cache bounded by the total size (in bytes) of its entries."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()   # key -> (value, size)
+        self._lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key][0]
+
+    def put(self, key, value, size):
+        with self._lock:
+            if key in self._entries:
+                self.size -= self._entries.pop(key)[1]
+            if size > self.max_bytes:
+                return  # would evict everything else and still not fit
+            self._entries[key] = (value, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, old_size) = self._entries.popitem(last=False)
+                self.size -= old_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "size_mb": round(self.size / 1024 ** 2, 1),
+                    "max_mb": round(self.max_bytes / 1024 ** 2, 1), "hits": self.hits,
+                    "misses": self.misses, "evictions": self.evictions}
+
+
+_uploads = LRUCache(CACHE_MAX_MB * 1024 ** 2)
+_stages = LRUCache(STAGE_CACHE_MB * 1024 ** 2)
+_digests = OrderedDict()   # uploader file_id -> file_hash, the most recent DIGESTS_KEPT
+_digests_lock = threading.Lock()
+
+
+def file_hash(uploaded_file):
+    """
+    Hash of the uploaded file's contents (no copy of the bytes is made).
+
+    Streamlit gives each upload a new file_id, so the hash is computed once per
+    upload and looked up by file_id on the reruns after it.
+    """
+    file_id = getattr(uploaded_file, "file_id", None)
+    with _digests_lock:
+        if file_id in _digests:
+            _digests.move_to_end(file_id)
+            return _digests[file_id]
+    digest = hashlib.blake2b(uploaded_file.getbuffer(), digest_size=16).hexdigest()
+    if file_id is not None:
+        with _digests_lock:
+            _digests[file_id] = digest
+            while len(_digests) > DIGESTS_KEPT:
+                _digests.popitem(last=False)
+    return digest
+
+
+def profile_frame(df):
+    """
+    Baseline stats shown before cleaning and used for the before/after summary.
+
+    "describe" is approximate (unique counts, top values and percentiles come
+    from the "sketch", a sketch_engine.DatasetSketch). "fingerprints" is the
+    rows' RowFingerprints index, reused by the cleaning run.
+    """
+    sketch = sketch_frame(df)
+    fingerprints = RowFingerprints.of(df)
+    return {
+        "rows": int(len(df)),
+        "nulls": int(df.isnull().sum().sum()),
+        "duplicates": fingerprints.duplicates(),
+        "fingerprints": fingerprints,
+        "dtypes": df.dtypes.astype(str).to_dict(),
+        "sketch": sketch,
+        "describe": sketch.describe(),
+    }
+
+
+def exact_describe(df, key):
+    """df.describe(include="all").transpose() of the upload df (key from load_csv), cached like the upload."""
+    cached = _uploads.get(key + ":describe")
+    if cached is None:
+        cached = df.describe(include="all").transpose()
+        _uploads.put(key + ":describe", cached, frame_bytes(cached))
+    return cached
+
+
+def compare_ingest(uploaded_file, arrow_df, arrow_seconds):
+    """Parse time and memory of the Arrow frame next to the default parser's, for the dataset details."""
+    start = time.perf_counter()
+    default_df = read_upload(uploaded_file)
+    default_seconds = time.perf_counter() - start
+    return pd.DataFrame({
+        "parse seconds": [round(default_seconds, 3), round(arrow_seconds, 3)],
+        "memory MB": [round(frame_bytes(default_df) / 1024 ** 2, 1), round(frame_bytes(arrow_df) / 1024 ** 2, 1)],
+    }, index=["Default (NumPy)", "Arrow"])
+
+
+def load_csv(uploaded_file, arrow=False):
+    """
+    Parse an upload (see file_formats.read_upload) and profile it, reusing the cached result for the same contents.
+
+    Returns (df, profile, key). The frame is shared between reruns and sessions,
+    so callers must copy it before modifying it. With arrow=True the profile
+    also has an "ingest" table comparing the Arrow parse with the default one.
+    """
+    key = file_hash(uploaded_file) + (":arrow" if arrow else "")
+    cached = _uploads.get(key)
+    if cached is not None:
+        return cached[0], cached[1], key
+
+    start = time.perf_counter()
+    df = read_upload(uploaded_file, arrow=arrow)
+    seconds = time.perf_counter() - start
+    profile = profile_frame(df)
+    if arrow:
+        profile["ingest"] = compare_ingest(uploaded_file, df, seconds)
+    _uploads.put(key, (df, profile), frame_bytes(df) + frame_bytes(profile["describe"]) +
+                 profile["fingerprints"].nbytes + profile["sketch"].nbytes)
+    return df, profile, key
+
+
+def cache_stats():
+    return _uploads.stats()
+
+
+def clean_incremental(df, key, options, fingerprints=None, canonicals=None, workers=1):
+    """
+    cleaning.run_stages on the upload df (key from load_csv), reusing the cached stage outputs.
+
+    fingerprints is the "fingerprints" of the upload's profile; canonicals and
+    workers are passed through to run_stages.
+
+    Returns (df_cleaned, anomalies, reports, stage_log). The frames are shared
+    with the cache, so callers must copy them before modifying them.
+    """
+    return run_stages(df, options, memo=_stages, memo_key=key, fingerprints=fingerprints, canonicals=canonicals,
+                      workers=workers)
+
+
+def stage_cache_stats():
+    return _stages.stats()